@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# HTTP load benchmark
+#
+# Serves the web interface, backed by a stand-in station with a day of
+# synthetic samples, from the builtin server and from Flask's development
+# server in turn, and measures each with concurrent keep-alive clients:
+# requests per second and latency percentiles, per path.
+#
+# Usage: benchmarks/http_load.py [--server {builtin,flask,all}] [--path PATH]...
+#                                [--clients N] [--duration SECONDS]
+#                                [--workers N] [--output RESULT.json]
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PATHS = ['/', '/api/current', '/api/history?field=tempc']
+
+def _env():
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [ROOT, env.get('PYTHONPATH')]))
+    return env
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def station(samples=86400 // 5, interval=5):
+    # Returns a stand-in for the Daemon, with everything the web interface
+    # reads from it
+    import math
+
+    from weatherstation import api
+    from weatherstation.broadcast import Broadcaster
+    from weatherstation.history import History
+    from weatherstation.observation import Observation
+    from weatherstation.pws import Daemon
+    from weatherstation.rollup import Rollups
+
+    class Station(object):
+        display_units = 'imperial'
+        archive = None
+        conditions = Daemon.conditions
+
+        def __init__(self):
+            self.observation = None
+            self.generation = 0
+            self.history = History()
+            self.rollups = Rollups()
+            self.broadcaster = Broadcaster()
+
+        def sample(self, observation):
+            self.observation = observation
+            self.history.append(observation)
+            self.rollups.append(observation)
+            self.generation += 1
+            self.broadcaster.publish(self.generation, api.current(self))
+
+    stand_in = Station()
+    start = time.time() - samples * interval
+    for i in range(samples):
+        phase = 2 * math.pi * i / samples
+        stand_in.sample(Observation(start + i * interval, 15 + 8 * math.sin(phase),
+                                    101.3 + 0.5 * math.cos(phase), 60 - 20 * math.sin(phase),
+                                    max(0.0, 8 * math.sin(phase))))
+
+    return stand_in
+
+def serve(server, port, workers):
+    import weatherstation.web as web
+
+    web.init(station())
+
+    if server == 'flask':
+        web.app.run(host='127.0.0.1', port=port, threaded=True)
+    else:
+        from weatherstation.httpserver import serve
+        serve(web.app, '127.0.0.1', port, workers=workers, streams=web.streams)
+
+async def _request(reader, writer, request):
+    # Sends request, returns whether the connection can be reused
+    writer.write(request)
+
+    status = await reader.readline()
+    if not status:
+        raise ConnectionError('Connection closed')
+
+    length = 0
+    keep_alive = status.startswith(b'HTTP/1.1')
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+
+        name, _, value = line.decode('latin-1').partition(':')
+        name, value = name.strip().lower(), value.strip().lower()
+        if name == 'content-length':
+            length = int(value)
+        elif name == 'connection':
+            keep_alive = value == 'keep-alive'
+
+    await reader.readexactly(length)
+    if not status.split()[1].startswith(b'2'):
+        raise ValueError(status.decode('latin-1').strip())
+
+    return keep_alive
+
+async def _client(port, request, deadline, latencies, errors):
+    connection = None
+    while time.monotonic() < deadline:
+        try:
+            if connection is None:
+                connection = await asyncio.open_connection('127.0.0.1', port)
+
+            started = time.perf_counter()
+            keep_alive = await _request(connection[0], connection[1], request)
+            latencies.append(time.perf_counter() - started)
+        except (OSError, ValueError, asyncio.IncompleteReadError):
+            errors.append(1)
+            keep_alive = False
+
+        if not keep_alive:
+            connection[1].close()
+            connection = None
+
+    if connection is not None:
+        connection[1].close()
+
+def _percentile(values, fraction):
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+def load(port, path, clients, duration):
+    request = 'GET {} HTTP/1.1\r\nHost: 127.0.0.1\r\n\r\n'.format(path).encode('latin-1')
+    latencies, errors = [], []
+
+    async def run():
+        deadline = time.monotonic() + duration
+        await asyncio.gather(*(_client(port, request, deadline, latencies, errors)
+                               for _ in range(clients)))
+
+    started = time.monotonic()
+    asyncio.run(run())
+    elapsed = time.monotonic() - started
+
+    latencies.sort()
+    result = {'requests': len(latencies), 'errors': len(errors),
+              'requests_per_second': len(latencies) / elapsed}
+    if latencies:
+        result.update({
+            'p50_ms': _percentile(latencies, 0.5) * 1000,
+            'p99_ms': _percentile(latencies, 0.99) * 1000,
+            'max_ms': latencies[-1] * 1000,
+        })
+
+    return result
+
+def benchmark(server, paths, clients, duration, workers, timeout=60):
+    port = _free_port()
+    proc = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), '--serve', server,
+         '--port', str(port), '--workers', str(workers)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, cwd=ROOT, env=_env())
+
+    try:
+        started = time.monotonic()
+        while True:
+            try:
+                socket.create_connection(('127.0.0.1', port), 1).close()
+                break
+            except OSError:
+                if time.monotonic() - started > timeout or proc.poll() is not None:
+                    raise RuntimeError('{} server did not start'.format(server))
+                time.sleep(0.1)
+
+        return {path: load(port, path, clients, duration) for path in paths}
+    finally:
+        proc.terminate()
+        proc.wait()
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure web interface throughput')
+    parser.add_argument('--server', choices=['builtin', 'flask', 'all'], default='all')
+    parser.add_argument('--path', action='append', help='path to request, repeatable')
+    parser.add_argument('--clients', type=int, default=32, help='concurrent connections')
+    parser.add_argument('--duration', type=float, default=5, help='seconds per path')
+    parser.add_argument('--workers', type=int, default=2, help='builtin server app threads')
+    parser.add_argument('--output', help='write results to this JSON file')
+    parser.add_argument('--serve', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.port, args.workers)
+        return
+
+    servers = ['builtin', 'flask'] if args.server == 'all' else [args.server]
+    results = {'python': sys.version.split()[0], 'clients': args.clients,
+               'duration': args.duration, 'workers': args.workers, 'servers': {}}
+    for server in servers:
+        results['servers'][server] = benchmark(server, args.path or PATHS, args.clients,
+                                               args.duration, args.workers)
+
+    print(json.dumps(results, indent=2))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
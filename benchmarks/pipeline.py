@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+# Pipeline benchmark
+#
+# Runs the daemon against the simulated board and a local stand-in for the
+# upload server, and times its own code paths: the sampling job, the upload
+# job, and the uploader moving each observation through the spool to the
+# server, and within those the sensor reads, compensation, unit conversion
+# and formatting. The time per I2C transaction, per publish and per HTTP
+# request comes from the daemon's metrics. Reports samples per second
+# through the whole sampling job, CPU time per sample, memory, and web
+# requests per second, so results can be compared across commits.
+#
+# Usage: benchmarks/pipeline.py [--samples N] [--i2c-latency SECONDS]
+#                               [--atm-mode {forced,normal}] [--filter]
+#                               [--http-duration SECONDS]
+#                               [--output RESULT.json] [--compare BASELINE.json]
+
+import argparse
+import asyncio
+import http.server
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from configparser import ConfigParser
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import http_load
+
+from weatherstation import api, bus, scheduler, transport, units, uploader
+from weatherstation.filters import SensorFilter
+from weatherstation.httpserver import WSGIServer
+from weatherstation.led import LEDController
+from weatherstation.pws import Daemon
+from weatherstation.sim import Simulation
+
+# Per sample:
+# sample: the sampling job, Daemon._environ_update
+# i2c: the sensor reads within it, including the wait for the conversion in
+# forced mode
+# compensation: the BME280's compensation of the raw readings
+# conversion: unit conversions, wherever they are made
+# formatting: api.current, which the sampling job broadcasts, and
+# Daemon.conditions, once per sample as if for a page view
+# upload_job: the upload job, Daemon._remote_update, which queues the
+# observation for the uploaders
+# uploader: every uploader spooling and publishing what was queued
+STAGES = ['sample', 'i2c', 'compensation', 'conversion', 'formatting', 'upload_job',
+          'uploader']
+
+# Daemon metrics broken down in the results
+METRICS = [bus.I2C_SECONDS, scheduler.JOB_SECONDS, uploader.PUBLISH_SECONDS,
+           transport.REQUEST_SECONDS]
+
+class Histogram(object):
+    # Latencies in power of two microsecond buckets, plus exact percentiles
+    def __init__(self):
+        self.values = []
+
+    def add(self, seconds):
+        self.values.append(seconds)
+
+    def summary(self):
+        values = sorted(self.values)
+        if not values:
+            return {'count': 0}
+
+        buckets = {}
+        for value in values:
+            bound = 1
+            while bound < value * 1e6:
+                bound *= 2
+            buckets[bound] = buckets.get(bound, 0) + 1
+
+        def us(fraction):
+            return values[min(len(values) - 1, int(fraction * len(values)))] * 1e6
+
+        return {
+            'count': len(values),
+            'mean_us': sum(values) / len(values) * 1e6,
+            'p50_us': us(0.5),
+            'p90_us': us(0.9),
+            'p99_us': us(0.99),
+            'max_us': values[-1] * 1e6,
+            # [upper bound in microseconds, count]
+            'histogram': sorted(buckets.items()),
+        }
+
+class Timer(object):
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.histogram.add(time.perf_counter() - self._started)
+
+class Stopwatch(object):
+    # Swaps timed wrappers in for the daemon's own functions, and adds up
+    # the time spent in them per stage. Stages nest: conversions are made
+    # while formatting and uploading, for one.
+    def __init__(self):
+        self.spent = {}
+        self._swapped = []
+
+    def wrap(self, stage, owner, name):
+        original = getattr(owner, name)
+        self._swapped.append((owner, name, vars(owner).get(name)))
+        self.spent[stage] = 0.0
+
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.spent[stage] += time.perf_counter() - started
+
+        setattr(owner, name, timed)
+
+    def take(self):
+        # Returns the time per stage since the last take
+        spent = self.spent
+        self.spent = dict.fromkeys(spent, 0.0)
+        return spent
+
+    def restore(self):
+        for owner, name, original in reversed(self._swapped):
+            if original is None:
+                # A method, looked up on the class again
+                delattr(owner, name)
+            else:
+                setattr(owner, name, original)
+        self._swapped = []
+
+class UploadStandIn(http.server.BaseHTTPRequestHandler):
+    # Answers every upload the way Weather Underground accepts one
+    protocol_version = 'HTTP/1.1'
+    requests = 0
+
+    # Headers and body are written separately; without this, each upload
+    # waits out the client's delayed ACK
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        UploadStandIn.requests += 1
+        body = b'success\n'
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def rss_kb():
+    # Current resident set size
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+
+def commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def build_daemon(simulation, upload_url, archive_path, atm_mode, filters):
+    config = ConfigParser()
+    config.add_section('led')
+    config.set('led', 'network', '44')
+
+    daemon = Daemon('BENCH', 'bench', 'imperial', atm_mode=atm_mode, archive_path=archive_path,
+                    i2c=simulation.i2c, clock=simulation.clock,
+                    filters=SensorFilter() if filters else None,
+                    # Uploads go to the local stand-in
+                    publish=True)
+    daemon.leds = LEDController(config, gpio=simulation.gpio)
+    daemon.pws.url = upload_url
+
+    return daemon
+
+def snapshot(families):
+    # Returns the current (counts, sum) of every child of families
+    return {(family.name, values): child.snapshot()
+            for family in families for values, child in family.children()}
+
+def breakdown(families, before):
+    # Summarizes what families recorded since the snapshot before. Buckets
+    # only bound the percentiles, so they are given as the bucket's upper
+    # bound; the mean is exact. The histogram is in the metric's own
+    # buckets rather than powers of two.
+    results = {}
+    for family in families:
+        for values, child in family.children():
+            counts, total = child.snapshot()
+            old_counts, old_total = before.get((family.name, values),
+                                               ([0] * len(counts), 0.0))
+            counts = [new - old for new, old in zip(counts, old_counts)]
+            count, total = sum(counts), total - old_total
+            if not count:
+                continue
+
+            bounds = [bound * 1e6 for bound in child.buckets] + [float('inf')]
+
+            def le_us(fraction):
+                cumulative = 0
+                for bound, n in zip(bounds, counts):
+                    cumulative += n
+                    if cumulative >= fraction * count:
+                        return bound
+
+            name = family.name + ''.join(
+                '{{{}={}}}'.format(label, value)
+                for label, value in zip(family.label_names, values))
+            results[name] = {'count': count, 'mean_us': total / count * 1e6,
+                             'p50_le_us': le_us(0.5), 'p99_le_us': le_us(0.99),
+                             # [upper bound in microseconds, count], the last
+                             # unbounded
+                             'histogram': [[bound if bound != float('inf') else None, n]
+                                           for bound, n in zip(bounds, counts) if n]}
+
+    return results
+
+def measure_stages(daemon, samples):
+    # Runs the daemon's own jobs as the scheduler would, one sample and one
+    # upload at a time, and the uploaders in this thread rather than theirs
+    histograms = {stage: Histogram() for stage in STAGES}
+    jobs = {job.name: job for job in daemon.scheduler.jobs()}
+    uploaders = daemon.publisher.uploaders
+
+    stopwatch = Stopwatch()
+    for name in ('start_measurement', 'read_measurement_raw'):
+        stopwatch.wrap('i2c', daemon.atm_sensor, name)
+    stopwatch.wrap('i2c', daemon.uv_sensor, 'readUV')
+    for name in ('_compensate_temperature', '_compensate_pressure', '_compensate_humidity'):
+        stopwatch.wrap('compensation', daemon.atm_sensor, name)
+    for name in ('DEGC_TO_DEGF', 'KPA_TO_INHG', 'KPA_TO_HPA'):
+        stopwatch.wrap('conversion', units, name)
+    stopwatch.wrap('formatting', api, 'current')
+    stopwatch.wrap('formatting', daemon, 'conditions')
+
+    before = snapshot(METRICS)
+    try:
+        for _ in range(samples):
+            with Timer(histograms['sample']):
+                daemon.scheduler.run_job(jobs['sample'])
+            daemon.conditions()
+
+            with Timer(histograms['upload_job']):
+                daemon.scheduler.run_job(jobs['upload'])
+
+            with Timer(histograms['uploader']):
+                for each in uploaders:
+                    each.process()
+
+            for stage, seconds in stopwatch.take().items():
+                histograms[stage].add(seconds)
+    finally:
+        stopwatch.restore()
+
+    stages = {stage: histogram.summary() for stage, histogram in histograms.items()}
+    return stages, breakdown(METRICS, before)
+
+def measure_throughput(daemon, samples):
+    # Runs the sampling job back to back, as fast as the board allows
+    sample = {job.name: job for job in daemon.scheduler.jobs()}['sample']
+
+    cpu, started = time.process_time(), time.perf_counter()
+    for _ in range(samples):
+        sample.func()
+    cpu, elapsed = time.process_time() - cpu, time.perf_counter() - started
+
+    return {
+        'samples_per_second': samples / elapsed,
+        'cpu_us_per_sample': cpu / samples * 1e6,
+    }
+
+def measure_http(daemon, duration, clients):
+    # Returns the load results per path, and the web metrics broken down
+    import weatherstation.web as web
+    web.init(daemon)
+    before = snapshot([web.REQUEST_SECONDS])
+
+    loop = asyncio.new_event_loop()
+    server = WSGIServer(web.app, '127.0.0.1', 0, loop=loop, streams=web.streams)
+    loop.run_until_complete(server.start())
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+
+    try:
+        results = {path: http_load.load(server.port, path, clients, duration)
+                   for path in http_load.PATHS}
+        return results, breakdown([web.REQUEST_SECONDS], before)
+    finally:
+        asyncio.run_coroutine_threadsafe(server.stop(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+def compare(results, baseline):
+    # Prints each headline figure against the baseline's
+    def figures(result):
+        yield 'samples/s', result['throughput']['samples_per_second']
+        yield 'cpu us/sample', result['throughput']['cpu_us_per_sample']
+        yield 'max rss kB', result['memory']['max_rss_kb']
+        # Results from before a stage was added have no figures for it
+        for stage in (stage for stage in STAGES if stage in result['stages']):
+            yield '{} p50 us'.format(stage), result['stages'][stage]['p50_us']
+            yield '{} p99 us'.format(stage), result['stages'][stage]['p99_us']
+        for path, load in sorted(result['http'].items()):
+            yield '{} req/s'.format(path), load['requests_per_second']
+        for name, summary in sorted(result.get('metrics', {}).items()):
+            yield '{} mean us'.format(name), summary['mean_us']
+
+    before = dict(figures(baseline))
+    for name, value in figures(results):
+        if name in before and before[name]:
+            print('{:64} {:12.1f} {:12.1f} {:+7.1f}%'.format(
+                name, before[name], value, (value / before[name] - 1) * 100))
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the sampling, upload and web pipeline')
+    parser.add_argument('--samples', type=int, default=500, help='samples per measurement')
+    parser.add_argument('--i2c-latency', type=float, default=0.0002,
+                        help='seconds per simulated I2C transaction')
+    parser.add_argument('--atm-mode', choices=['forced', 'normal'], default='forced',
+                        help='BME280 mode, normal skips the conversion wait')
+    parser.add_argument('--filter', action='store_true',
+                        help='filter readings, with the default [filter] settings')
+    parser.add_argument('--http-duration', type=float, default=3, help='seconds per path')
+    parser.add_argument('--http-clients', type=int, default=16, help='concurrent connections')
+    parser.add_argument('--output', help='write results to this JSON file')
+    parser.add_argument('--compare', help='print changes against this earlier result')
+    args = parser.parse_args()
+
+    upload_server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), UploadStandIn)
+    threading.Thread(target=upload_server.serve_forever, daemon=True).start()
+    upload_url = 'http://127.0.0.1:{}/weatherstation/updateweatherstation.php'.format(
+        upload_server.server_address[1])
+
+    simulation = Simulation(latency=args.i2c_latency)
+
+    with tempfile.TemporaryDirectory() as archive_path:
+        rss_before = rss_kb()
+        daemon = build_daemon(simulation, upload_url, archive_path, args.atm_mode,
+                              args.filter)
+
+        try:
+            stages, stage_metrics = measure_stages(daemon, args.samples)
+            throughput = measure_throughput(daemon, args.samples)
+            web_load, web_metrics = measure_http(daemon, args.http_duration, args.http_clients)
+
+            results = {
+                'commit': commit(),
+                'python': sys.version.split()[0],
+                'parameters': vars(args),
+                'stages': stages,
+                'metrics': dict(stage_metrics, **web_metrics),
+                'throughput': throughput,
+                'http': web_load,
+                'i2c_transactions': simulation.i2c.transactions,
+                'uploads': UploadStandIn.requests,
+            }
+            results['memory'] = {
+                'rss_kb': rss_kb(),
+                'daemon_rss_kb': rss_kb() - rss_before,
+                'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                'history_bytes': daemon.history.nbytes,
+            }
+        finally:
+            daemon.close()
+            upload_server.shutdown()
+
+    print(json.dumps(results, indent=2))
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# Startup benchmark
+#
+# Measures, in fresh interpreters, the import time of each weatherstation
+# module (python -X importtime) and, given a config file, the time from
+# process start to first sample and to first served web request.
+#
+# Usage: benchmarks/startup.py [--config CONFIG_FILE] [--output RESULT.json]
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = [
+    'weatherstation.pws',
+    'weatherstation.bme280',
+    'weatherstation.si1145',
+    'weatherstation.weatherunderground',
+    'weatherstation.units',
+    'weatherstation.web',
+]
+
+IMPORTTIME_RE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|(\s+)(\S+)')
+MILESTONE_RE = re.compile(r'Startup milestone (\w+): ([\d.]+) s')
+
+def _env():
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [ROOT, env.get('PYTHONPATH')]))
+    return env
+
+def import_time(module, top=5):
+    # Returns the cumulative import time of module, in seconds, and its
+    # heaviest top level imports
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        universal_newlines=True, cwd=ROOT, env=_env())
+
+    if proc.returncode != 0:
+        return {'error': proc.stderr.strip().splitlines()[-1]}
+
+    total = 0
+    imports = []
+    for line in proc.stderr.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        if not match:
+            continue
+
+        self_us, cumulative_us, indent, name = match.groups()
+        if name == module:
+            total = int(cumulative_us)
+        # Depth 1 imports are the ones the module itself pulls in
+        if len(indent) == 3:
+            imports.append((int(cumulative_us), name))
+
+    imports.sort(reverse=True)
+    return {
+        'seconds': total / 1e6,
+        'heaviest': [{'module': name, 'seconds': us / 1e6} for us, name in imports[:top]],
+    }
+
+def daemon_startup(config_path, timeout=60):
+    # Starts the station and returns its startup milestones, plus the time
+    # until the web interface answered as seen by a client
+    from configparser import ConfigParser
+
+    config = ConfigParser(interpolation=None)
+    config.read(config_path)
+    host = config.get('web', 'listen_address', fallback='127.0.0.1')
+    if host == '0.0.0.0':
+        host = '127.0.0.1'
+    url = 'http://{}:{}/'.format(host, config.get('web', 'port', fallback='5000'))
+
+    started = time.monotonic()
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'weatherstation.pws', config_path],
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+        universal_newlines=True, cwd=ROOT, env=_env())
+
+    result = {}
+    try:
+        while time.monotonic() - started < timeout:
+            try:
+                urllib.request.urlopen(url, timeout=1).read()
+                result['client_first_response'] = time.monotonic() - started
+                break
+            except OSError:
+                time.sleep(0.05)
+    finally:
+        proc.terminate()
+        output, _ = proc.communicate()
+
+    for name, seconds in MILESTONE_RE.findall(output):
+        result[name] = float(seconds)
+
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure weatherstation startup time')
+    parser.add_argument('--config', help='station config to start the daemon with')
+    parser.add_argument('--output', help='write results to this JSON file')
+    args = parser.parse_args()
+
+    results = {'python': sys.version.split()[0], 'imports': {}}
+    for module in MODULES:
+        results['imports'][module] = import_time(module)
+
+    if args.config:
+        results['startup'] = daemon_startup(os.path.abspath(args.config))
+
+    print(json.dumps(results, indent=2))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+# Copyright (c) 2016 Joseph Kogut
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import json
+
+import pytest
+
+from weatherstation import api, web
+from weatherstation.archive import Archive
+from weatherstation.history import History
+from weatherstation.observation import Observation
+from weatherstation.rollup import Rollups
+
+START = 1476662400
+
+class Station(object):
+    # The parts of the Daemon the API reads
+    archive = None
+    generation = 0
+
+    def __init__(self, samples=600, interval=1):
+        self.history = History()
+        self.rollups = Rollups()
+        self.observation = None
+
+        for i in range(samples):
+            self.observation = Observation(START + i * interval, 20.0 + i % 7, 101.3, 50.0, 1.0)
+            self.history.append(self.observation)
+            self.rollups.append(self.observation)
+
+@pytest.fixture
+def client():
+    web.init(Station())
+    web.app.testing = True
+    return web.app.test_client()
+
+def test_history(client):
+    response = client.get('/api/history?field=tempc&from={}&to={}&step=1'.format(
+        START, START + 10))
+    result = json.loads(response.get_data(as_text=True))
+
+    assert response.status_code == 200
+    assert result['step'] is None
+    assert [timestamp for timestamp, _ in result['points']] == list(range(START, START + 10))
+
+@pytest.mark.parametrize('query', [
+    'from=nan',
+    'from=-inf',
+    'to=inf',
+    'from=abc',
+    'from=-1e20&to=-99999999999999990000',
+    'from=0&to=1e12&step=1',
+    'step=nan',
+    'step=0',
+    'step=-60',
+    'from=100&to=50',
+])
+def test_invalid_parameters(client, query):
+    response = client.get('/api/history?field=tempc&' + query)
+
+    assert response.status_code == 400
+    # Always valid JSON, never NaN or Infinity
+    json.loads(response.get_data(as_text=True), parse_constant=pytest.fail)
+
+def test_raw_points_are_capped(monkeypatch):
+    monkeypatch.setattr(api, 'MAX_RAW_POINTS', 100)
+    station = Station(samples=600)
+
+    result = api.history(station, 'tempc', 0, START + 86400, 1)
+    assert result['step'] == 60
+    assert len(result['points']) == 10
+
+    result = api.history(station, 'tempc', START, START + 100, 1)
+    assert result['step'] is None
+    assert len(result['points']) == 100
+
+def test_history_after_restart(tmp_path):
+    # A week on disk, and rollups that start out empty
+    archive = Archive(str(tmp_path))
+    for i in range(7 * 1440):
+        archive.append(Observation(START + i * 60, 20.0 + i % 7, 101.3, 50.0, 1.0))
+    archive.close()
+
+    station = Station(samples=0)
+    station.archive = archive = Archive(str(tmp_path))
+    station.rollups.seed(archive.scan, START + 7 * 86400)
+
+    result = api.history(station, 'tempc', START, START + 7 * 86400)
+    assert result['step'] == 60
+    assert len(result['points']) == 7 * 1440
@@ -0,0 +1,145 @@
+# Copyright (c) 2016 Joseph Kogut
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import os
+import shutil
+
+import pytest
+
+from weatherstation.archive import Archive
+from weatherstation.observation import Observation
+
+# 2016-09-29 00:00:00 UTC, three days before October
+START = 1475107200
+DAY = 86400
+
+def samples(start, count, interval=3600):
+    return [Observation(start + i * interval, 10.0 + i, 101.25, 50.0, i % 2 or None)
+            for i in range(count)]
+
+def read(archive, start=None, end=None):
+    return list(archive.observations(start, end))
+
+@pytest.fixture
+def archive(tmp_path):
+    return Archive(str(tmp_path / 'archive'), flush_count=1000)
+
+def test_round_trip(archive):
+    written = samples(START, 72)
+    for observation in written:
+        archive.append(observation)
+
+    # Pending samples are read before and after they are flushed
+    assert read(archive) == written
+    archive.flush()
+    assert archive.partitions() == (['2016-09-29', '2016-09-30', '2016-10-01'], [])
+    assert read(archive) == written
+    assert read(archive, START + DAY, START + DAY + 7200) == written[24:26]
+
+def test_torn_write_is_repaired(tmp_path):
+    written = samples(START, 10)
+    archive = Archive(str(tmp_path))
+    for observation in written:
+        archive.append(observation)
+    archive.close()
+
+    # A crash midway through a flush: one column got a record and a half
+    # more than the others
+    with open(os.path.join(str(tmp_path), '2016-09-29', 'tempc'), 'ab') as f:
+        f.write(b'\0' * 6)
+
+    archive = Archive(str(tmp_path))
+    assert read(archive) == written
+
+    extra = samples(START + 10 * 3600, 2)
+    for observation in extra:
+        archive.append(observation)
+    archive.flush()
+
+    assert read(Archive(str(tmp_path))) == written + extra
+    for column in ('timestamp', 'tempc', 'uv'):
+        size = os.path.getsize(os.path.join(str(tmp_path), '2016-09-29', column))
+        assert size == 12 * (8 if column == 'timestamp' else 4)
+
+def test_compaction(archive):
+    written = samples(START, 96)
+    for observation in written:
+        archive.append(observation)
+    archive.flush()
+
+    assert archive.compact(now=START + 3 * DAY) == ['2016-09']
+    assert archive.partitions() == (['2016-10-01', '2016-10-02'], ['2016-09'])
+    assert read(archive) == written
+    assert read(Archive(archive.path)) == written
+
+    # The current month is left alone
+    assert archive.compact(now=START + 3 * DAY) == []
+
+def test_late_day_is_merged(archive):
+    written = samples(START, 24)
+    for observation in written:
+        archive.append(observation)
+    archive.flush()
+    archive.compact(now=START + 3 * DAY)
+
+    # Arrives after its month was compacted, between two samples of it
+    late = Observation(START + 1800, 99.0, 101.25, 50.0, None)
+    archive.append(late)
+    archive.flush()
+    archive.compact(now=START + 3 * DAY)
+
+    assert read(archive) == written[:1] + [late] + written[1:]
+
+def test_interrupted_compaction_does_not_duplicate(archive, tmp_path):
+    written = samples(START, 48)
+    for observation in written:
+        archive.append(observation)
+    archive.flush()
+
+    # A crash after the month file was installed, before its days were
+    # removed: they are still there on the next start
+    saved = str(tmp_path / 'saved')
+    os.makedirs(saved)
+    for day in ('2016-09-29', '2016-09-30'):
+        shutil.copytree(os.path.join(archive.path, day), os.path.join(saved, day))
+    archive.compact(now=START + 3 * DAY)
+    for day in ('2016-09-29', '2016-09-30'):
+        shutil.copytree(os.path.join(saved, day), os.path.join(archive.path, day))
+
+    archive = Archive(archive.path)
+    assert read(archive) == written
+
+    assert archive.compact(now=START + 3 * DAY) == ['2016-09']
+    assert archive.partitions() == ([], ['2016-09'])
+    assert read(Archive(archive.path)) == written
+
+def test_scan(archive):
+    written = samples(START, 24 * 6)
+    for observation in written:
+        archive.append(observation)
+    archive.flush()
+    archive.compact()
+
+    # The same samples as segments(), a month at a time
+    scanned = list(archive.scan(START + 3600, START + 5 * DAY))
+    assert len(scanned) == 2
+    assert [t for timestamps, _ in scanned for t in timestamps] == \
+        [o.timestamp for o in written[1:120]]
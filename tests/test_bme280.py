@@ -0,0 +1,75 @@
+# Copyright (c) 2016 Joseph Kogut
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Reference vectors for the BME280 compensation paths. The trimming values
+# are the datasheet example plus typical humidity trimming; the expected
+# integer results are from the Bosch reference code built with a C compiler.
+
+import pytest
+
+from weatherstation import bme280
+from weatherstation.bme280 import BME280Calibration
+
+CALIBRATION = BME280Calibration(
+    dig_T1=27504, dig_T2=26435, dig_T3=-1000,
+    dig_P1=36477, dig_P2=-10685, dig_P3=3024, dig_P4=2855, dig_P5=140,
+    dig_P6=-7, dig_P7=15500, dig_P8=-14600, dig_P9=6000,
+    dig_H1=75, dig_H2=362, dig_H3=0, dig_H4=313, dig_H5=50, dig_H6=30)
+
+# (adc_T, adc_P, adc_H, T, t_fine, P int64, P int32, H int32)
+VECTORS = [
+    (519888, 415148, 30000, 2508, 128422, 25767233, 100656, 56317),
+    (418677, 467299, 39899, -675, -34543, 22343440, 87282, 102400),
+    (485871, 461325, 24443, 1441, 73773, 23345628, 91195, 24879),
+    (582586, 324097, 31600, 4468, 228767, 30708647, 119958, 66445),
+]
+
+@pytest.mark.parametrize('adc_t, adc_p, adc_h, T, t_fine, p64, p32, h', VECTORS)
+def test_integer(adc_t, adc_p, adc_h, T, t_fine, p64, p32, h):
+    assert bme280.compensate_temperature_int32(adc_t, CALIBRATION) == (T, t_fine)
+    assert bme280.compensate_pressure_int64(adc_p, t_fine, CALIBRATION) == p64
+    assert bme280.compensate_pressure_int32(adc_p, t_fine, CALIBRATION) == p32
+    assert bme280.compensate_humidity_int32(adc_h, t_fine, CALIBRATION) == h
+
+@pytest.mark.parametrize('adc_t, adc_p, adc_h, T, t_fine, p64, p32, h', VECTORS)
+def test_float_agrees_with_integer(adc_t, adc_p, adc_h, T, t_fine, p64, p32, h):
+    # To within the resolution of the integer results
+    temp, t_fine_f = bme280.compensate_temperature(adc_t, CALIBRATION)
+    pressure = bme280.compensate_pressure(adc_p, t_fine_f, CALIBRATION)
+    humidity = bme280.compensate_humidity(adc_h, t_fine_f, CALIBRATION)
+
+    assert temp == pytest.approx(T / 100.0, abs=0.01)
+    assert pressure == pytest.approx(p64 / 256.0, abs=1)
+    assert pressure == pytest.approx(p32, abs=10)
+    assert humidity == pytest.approx(h / 1024.0, abs=0.1)
+
+def test_batch_matches_scalar():
+    pytest.importorskip('numpy')
+
+    columns = list(zip(*VECTORS))
+    batch = bme280.compensate_batch(columns[0], columns[1], columns[2], CALIBRATION)
+
+    for i, (adc_t, adc_p, adc_h) in enumerate(zip(*columns[:3])):
+        temp, t_fine = bme280.compensate_temperature(adc_t, CALIBRATION)
+        expected = (temp, bme280.compensate_pressure(adc_p, t_fine, CALIBRATION),
+                    bme280.compensate_humidity(adc_h, t_fine, CALIBRATION))
+
+        assert tuple(float(column[i]) for column in batch) == expected
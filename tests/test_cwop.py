@@ -0,0 +1,94 @@
+# Copyright (c) 2016 Joseph Kogut
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import socketserver
+import time
+
+from weatherstation.cwop import CWOPPublisher
+from weatherstation.observation import Observation
+
+OBSERVATION = Observation(1476680400, 20.0, 101.3, 50.0, 3.0)
+
+LOGIN = 'user EW1234 pass -1 vers weatherstation 1.0\r\n'
+PACKET = 'EW1234>APRS,TCPIP*:@170500z4636.00N/12030.00W_.../...g...t068h50b10130\r\n'
+
+class APRSIS(socketserver.StreamRequestHandler):
+    # Sends a banner, answers the login and records what the client sends
+    lines = []
+
+    def handle(self):
+        self.wfile.write(b'# aprsc 2.1.4 stand-in\r\n')
+
+        login = self.rfile.readline().decode('latin-1')
+        self.lines.append(login)
+        self.wfile.write('# logresp {} unverified, server TEST\r\n'.format(
+            login.split()[1]).encode('latin-1'))
+
+        self.lines.extend(line.decode('latin-1') for line in self.rfile)
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def wait_for(condition, timeout=5):
+    # The stand-in may still be reading after the client hangs up
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+def aprs_is(serve):
+    return serve(type('TestAPRSIS', (APRSIS,), {'lines': []}))
+
+def test_login_and_packet(serve):
+    server = aprs_is(serve)
+    publisher = CWOPPublisher('ew1234', 46.6, -120.5, host='127.0.0.1', port=server.port,
+                              timeout=5)
+
+    publisher.publish([OBSERVATION])
+
+    lines = server.RequestHandlerClass.lines
+    wait_for(lambda: len(lines) == 2)
+    assert lines == [LOGIN, PACKET]
+
+def test_packet_position_and_missing_values():
+    publisher = CWOPPublisher('EW1234', -33.8688, 151.2093)
+
+    assert publisher.packet(Observation(1476680400, -10.0, None, None, None)) == \
+        'EW1234>APRS,TCPIP*:@170500z3352.13S/15112.56E_.../...g...t014'
+
+def test_min_interval(serve):
+    server = aprs_is(serve)
+    clock = Clock()
+    publisher = CWOPPublisher('EW1234', 46.6, -120.5, host='127.0.0.1', port=server.port,
+                              min_interval=300, timeout=5, clock=clock)
+
+    publisher.publish([OBSERVATION])
+    clock.now += 299
+    publisher.publish([OBSERVATION])
+    clock.now += 1
+    publisher.publish([OBSERVATION])
+
+    lines = server.RequestHandlerClass.lines
+    wait_for(lambda: len(lines) == 4)
+    assert lines == [LOGIN, PACKET, LOGIN, PACKET]
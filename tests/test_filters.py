@@ -0,0 +1,156 @@
+# Copyright (c) 2016 Joseph Kogut
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+from configparser import ConfigParser
+
+import pytest
+
+from weatherstation.filters import EMA, Kalman, Median, SensorFilter, Window, load_filters
+from weatherstation.observation import Observation
+
+def run(stage, values):
+    return [stage.update(value) for value in values]
+
+def test_median_drops_spikes():
+    assert run(Median(5), [10, 10, 99, 10, 10, -50, 10]) == [10, 10, 10, 10, 10, 10, 10]
+
+def test_median_warmup():
+    # The median of what has been seen so far, until the window fills; the
+    # lower of the middle two for an even count
+    assert run(Median(5), [1, 3, 2, 5, 4, 6]) == [1, 1, 2, 2, 3, 4]
+
+def test_median_follows_a_step():
+    assert run(Median(3), [0, 0, 0, 5, 5, 5]) == [0, 0, 0, 0, 5, 5]
+
+def test_median_of_one_passes_through():
+    assert run(Median(1), [3, 1, 2]) == [3, 1, 2]
+
+    with pytest.raises(ValueError):
+        Median(0)
+
+def test_ema():
+    assert run(EMA(0.5), [10, 20, 20]) == [10, 15, 17.5]
+    assert run(EMA(1), [1, 2, 3]) == [1, 2, 3]
+
+    for alpha in (0, -0.1, 1.5):
+        with pytest.raises(ValueError):
+            EMA(alpha)
+
+def test_kalman():
+    kalman = Kalman(process_noise=0.01, measurement_noise=1.0)
+
+    # Starts at the first measurement, then moves part way to each next one,
+    # by the gain
+    assert kalman.update(10.0) == 10.0
+    assert kalman.update(20.0) == pytest.approx(10.0 + 10.0 * 1.01 / 2.01)
+    assert kalman.variance == pytest.approx(1.01 / 2.01)
+
+def test_kalman_settles_on_a_constant():
+    kalman = Kalman(process_noise=0.01, measurement_noise=1.0)
+    values = run(kalman, [0.0] + [10.0] * 200)
+
+    assert values[-1] == pytest.approx(10.0, abs=0.01)
+
+def test_kalman_smoother_with_less_process_noise():
+    smooth, jumpy = Kalman(0.001, 1.0), Kalman(0.1, 1.0)
+    for _ in range(100):
+        smooth.update(0.0)
+        jumpy.update(0.0)
+
+    assert smooth.update(10.0) < jumpy.update(10.0)
+
+def test_window():
+    window = Window()
+    assert window.take() is None
+
+    run(window, [1.0, 2.0, 6.0])
+    assert window.take() == 3.0
+    assert window.take() is None
+
+    window.update(4.0)
+    assert window.take() == 4.0
+
+def observation(timestamp, tempc):
+    return Observation(timestamp, tempc, 101.25, 50.0, 2.0)
+
+def test_sensor_filter_without_smoothing():
+    filters = SensorFilter(median=3, smoothing='none')
+    filtered = [filters.update(observation(i, tempc))
+                for i, tempc in enumerate([10.0, 10.0, 99.0, 10.0])]
+
+    assert [o.tempc for o in filtered] == [10.0, 10.0, 10.0, 10.0]
+    assert filtered[-1] == observation(3, 10.0)
+
+def test_sensor_filter_take():
+    filters = SensorFilter(median=1, smoothing='none')
+    for i, tempc in enumerate([1.0, 2.0, 6.0]):
+        filters.update(observation(i, tempc))
+
+    latest = observation(2, 6.0)
+
+    # The mean of the window, stamped with the latest observation's time
+    assert filters.take(latest) == observation(2, 3.0)
+    # Nothing since, so the latest observation
+    assert filters.take(latest) is latest
+
+def test_sensor_filter_without_upload_average():
+    filters = SensorFilter(median=1, smoothing='none', upload_average=False)
+    filters.update(observation(0, 1.0))
+    latest = filters.update(observation(1, 3.0))
+
+    assert filters.take(latest) is latest
+
+def test_sensor_filter_smoothing():
+    for smoothing in ('ema', 'kalman'):
+        filters = SensorFilter(median=1, smoothing=smoothing)
+        filters.update(observation(0, 10.0))
+        assert 10.0 < filters.update(observation(1, 20.0)).tempc < 20.0
+
+    with pytest.raises(ValueError):
+        SensorFilter(smoothing='lowpass')
+
+def config(text):
+    parser = ConfigParser()
+    parser.read_string(text)
+    return parser
+
+def test_load_filters():
+    assert load_filters(config('[pws]\nid = KTEST1\n')) is None
+
+    filters = load_filters(config('[filter]\n'))
+    assert isinstance(filters, SensorFilter)
+    assert filters.upload_average
+
+    filters = load_filters(config(
+        '[filter]\nmedian = 1\nsmoothing = none\nupload_average = false\n'))
+    assert not filters.upload_average
+    assert filters.update(observation(0, 5.0)) == observation(0, 5.0)
+    assert filters.update(observation(1, 7.0)) == observation(1, 7.0)
+
+    with pytest.raises(ValueError):
+        load_filters(config('[filter]\nsmoothing = lowpass\n'))
+
+def test_shipped_config_leaves_filtering_off():
+    import os
+
+    parser = ConfigParser()
+    parser.read(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'weatherstation.cfg'))
+    assert load_filters(parser) is None
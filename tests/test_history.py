@@ -0,0 +1,106 @@
+# Copyright (c) 2016 Joseph Kogut
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import math
+
+import pytest
+
+from weatherstation.history import History
+from weatherstation.observation import Observation
+
+def sample(i):
+    return Observation(1000.0 + i, float(i), 100.0, 50.0, None if i % 3 else 1.5)
+
+def filled(capacity, count):
+    history = History(capacity)
+    for i in range(count):
+        history.append(sample(i))
+    return history
+
+def timestamps(segments):
+    return [list(timestamps) for timestamps, _ in segments]
+
+def test_empty():
+    history = History(4)
+
+    assert len(history) == 0
+    assert history.latest() is None
+    assert history.segments() == []
+    assert list(history.observations()) == []
+
+def test_partially_filled():
+    history = filled(4, 3)
+
+    assert len(history) == 3
+    assert history.latest() == sample(2)
+    assert timestamps(history.segments()) == [[1000.0, 1001.0, 1002.0]]
+    assert list(history.observations()) == [sample(i) for i in range(3)]
+
+def test_exactly_full():
+    history = filled(4, 4)
+
+    assert len(history) == 4
+    assert history.latest() == sample(3)
+    assert timestamps(history.segments()) == [[1000.0, 1001.0, 1002.0, 1003.0]]
+
+def test_wrapped():
+    # The oldest two were overwritten, the newest two sit at the front
+    history = filled(4, 6)
+
+    assert len(history) == 4
+    assert history.latest() == sample(5)
+
+    segments = history.segments()
+    assert timestamps(segments) == [[1002.0, 1003.0], [1004.0, 1005.0]]
+    assert [list(columns['tempc']) for _, columns in segments] == [[2.0, 3.0], [4.0, 5.0]]
+    assert list(history.observations()) == [sample(i) for i in range(2, 6)]
+
+@pytest.mark.parametrize('start, end, expected', [
+    (None, None, [[1002.0, 1003.0], [1004.0, 1005.0]]),
+    # Within either side of the wrap point
+    (1002, 1004, [[1002.0, 1003.0]]),
+    (1004, 1006, [[1004.0, 1005.0]]),
+    # Across it
+    (1003, 1005, [[1003.0], [1004.0]]),
+    (1002.5, 1004.5, [[1003.0], [1004.0]]),
+    # Before, after and empty
+    (0, 1002, []),
+    (1006, 2000, []),
+    (1003, 1003, []),
+])
+def test_ranges_across_the_wrap(start, end, expected):
+    assert timestamps(filled(4, 6).segments(start, end)) == expected
+
+def test_segments_are_views():
+    history = filled(4, 4)
+    (timestamps_view, columns), = history.segments()
+
+    history.append(sample(4))
+    # The oldest slot now holds the newest sample
+    assert timestamps_view[0] == 1004.0
+    assert columns['tempc'][0] == 4.0
+
+def test_missing_values_are_none():
+    history = filled(4, 3)
+
+    assert [o.uv for o in history.observations()] == [1.5, None, None]
+    # Stored as NaN
+    assert math.isnan(history.segments()[0][1]['uv'][1])
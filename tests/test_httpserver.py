@@ -0,0 +1,313 @@
+# Copyright (c) 2016 Joseph Kogut
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import asyncio
+import itertools
+import json
+import socket
+import threading
+
+import pytest
+
+from weatherstation.httpserver import WSGIServer
+
+def echo(environ, start_response):
+    # Describes the request it was given
+    if environ['PATH_INFO'] == '/fail':
+        raise RuntimeError('failed')
+    if environ['PATH_INFO'] == '/fixed':
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return [b'the same for GET and HEAD']
+
+    body = json.dumps({
+        'method': environ['REQUEST_METHOD'],
+        'path': environ['PATH_INFO'],
+        'query': environ['QUERY_STRING'],
+        'protocol': environ['SERVER_PROTOCOL'],
+        'content_type': environ.get('CONTENT_TYPE'),
+        'x_station': environ.get('HTTP_X_STATION'),
+        'body': environ['wsgi.input'].read().decode('latin-1'),
+    }).encode()
+    start_response('200 OK', [('Content-Type', 'application/json')])
+    return [body]
+
+class Events(object):
+    # A stream handler sending chunks, then waiting until released
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.release = None
+        self.closed = threading.Event()
+
+    async def __call__(self, environ):
+        self.release = asyncio.Event()
+
+        async def body():
+            try:
+                for chunk in self.chunks:
+                    yield chunk
+                await self.release.wait()
+            finally:
+                self.closed.set()
+
+        return '200 OK', [('Content-Type', 'text/event-stream')], body()
+
+@pytest.fixture
+def server():
+    # server(**options) starts a WSGIServer for echo on a free local port,
+    # on a loop of its own; servers are stopped after the test
+    started = []
+
+    def start(**options):
+        loop = asyncio.new_event_loop()
+        server = WSGIServer(echo, '127.0.0.1', 0, loop=loop, **options)
+        loop.run_until_complete(server.start())
+        thread = threading.Thread(target=loop.run_forever, daemon=True)
+        thread.start()
+        started.append((server, loop, thread))
+        return server
+
+    yield start
+
+    for server, loop, thread in started:
+        stop(server)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+def stop(server):
+    asyncio.run_coroutine_threadsafe(server.stop(), server.loop).result(5)
+
+def connect(server):
+    sock = socket.create_connection(('127.0.0.1', server.port), timeout=5)
+    return sock, sock.makefile('rb')
+
+def read_response(f, head=False):
+    # Returns (status, headers, body), or None if the connection was closed
+    line = f.readline()
+    if not line:
+        return None
+    status = int(line.split()[1])
+
+    headers = {}
+    while True:
+        line = f.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    if head:
+        body = b''
+    elif 'content-length' in headers:
+        body = f.read(int(headers['content-length']))
+    else:
+        body = f.read()
+    return status, headers, body
+
+def request(server, raw):
+    sock, f = connect(server)
+    with sock:
+        sock.sendall(raw)
+        return read_response(f)
+
+def test_request_parsing(server):
+    server = server()
+    status, headers, body = request(
+        server,
+        b'POST /api/a%20b?x=1&y=2 HTTP/1.1\r\n'
+        b'Host: localhost\r\n'
+        b'X-Station: one\r\n'
+        b'x-station:   two  \r\n'
+        b'Content-Type: text/plain\r\n'
+        b'Content-Length: 5\r\n'
+        b'\r\n'
+        b'hello')
+
+    assert status == 200
+    assert json.loads(body.decode()) == {
+        'method': 'POST', 'path': '/api/a b', 'query': 'x=1&y=2', 'protocol': 'HTTP/1.1',
+        'content_type': 'text/plain', 'x_station': 'one,two', 'body': 'hello'}
+    assert headers['content-length'] == str(len(body))
+
+@pytest.mark.parametrize('raw', [
+    b'GET /\r\n\r\n',
+    b'GET / HTTP/1.1 extra\r\n\r\n',
+    b'GET / HTTP/1.1\r\nNo colon\r\n\r\n',
+    b'POST / HTTP/1.1\r\nContent-Length: five\r\n\r\n',
+    b'POST / HTTP/1.1\r\nContent-Length: -1\r\n\r\n',
+    b'GET / HTTP/1.1\r\n' + b'X-Station: 1\r\n' * 101 + b'\r\n',
+])
+def test_bad_request(server, raw):
+    server = server()
+    sock, f = connect(server)
+    with sock:
+        sock.sendall(raw)
+        status, headers, _ = read_response(f)
+
+        assert status == 400
+        assert headers['connection'] == 'close'
+        assert read_response(f) is None
+
+def test_request_timeout(server):
+    server = server(request_timeout=0.2)
+    sock, f = connect(server)
+    with sock:
+        # Half a request
+        sock.sendall(b'GET / HTTP/1.1\r\nHost: loc')
+        status, headers, _ = read_response(f)
+
+        assert status == 408
+        assert headers['connection'] == 'close'
+        assert read_response(f) is None
+
+def test_idle_connection_is_closed(server):
+    server = server(request_timeout=0.2)
+    sock, f = connect(server)
+    with sock:
+        # Nothing sent, nothing answered
+        assert read_response(f) is None
+
+def test_payload_too_large(server):
+    server = server(max_body=10)
+
+    status, _, body = request(server, b'POST / HTTP/1.1\r\nContent-Length: 10\r\n\r\n0123456789')
+    assert status == 200
+    assert json.loads(body.decode())['body'] == '0123456789'
+
+    # Refused before the body is read
+    sock, f = connect(server)
+    with sock:
+        sock.sendall(b'POST / HTTP/1.1\r\nContent-Length: 1000000000\r\n\r\n0123456789')
+        status, headers, _ = read_response(f)
+
+        assert status == 413
+        assert headers['connection'] == 'close'
+        assert read_response(f) is None
+
+def test_keep_alive(server):
+    server = server()
+    sock, f = connect(server)
+    with sock:
+        for path in ('/one', '/two'):
+            sock.sendall('GET {} HTTP/1.1\r\n\r\n'.format(path).encode())
+            status, headers, body = read_response(f)
+            assert status == 200
+            assert 'connection' not in headers
+            assert json.loads(body.decode())['path'] == path
+
+        sock.sendall(b'GET /three HTTP/1.1\r\nConnection: close\r\n\r\n')
+        status, headers, _ = read_response(f)
+        assert status == 200
+        assert headers['connection'] == 'close'
+        assert read_response(f) is None
+
+def test_keep_alive_http_1_0(server):
+    server = server()
+    sock, f = connect(server)
+    with sock:
+        sock.sendall(b'GET / HTTP/1.0\r\nConnection: keep-alive\r\n\r\n')
+        status, headers, _ = read_response(f)
+        assert status == 200
+        assert headers['connection'] == 'keep-alive'
+
+        # Closed unless asked otherwise
+        sock.sendall(b'GET / HTTP/1.0\r\n\r\n')
+        status, headers, _ = read_response(f)
+        assert status == 200
+        assert headers['connection'] == 'close'
+        assert read_response(f) is None
+
+def test_head(server):
+    server = server()
+    _, get_headers, get_body = request(server, b'GET /fixed HTTP/1.1\r\n\r\n')
+
+    sock, f = connect(server)
+    with sock:
+        sock.sendall(b'HEAD /fixed HTTP/1.1\r\n\r\n')
+        status, headers, _ = read_response(f, head=True)
+        assert status == 200
+        assert headers['content-length'] == get_headers['content-length']
+
+        # No body was sent, so the next response follows straight on
+        sock.sendall(b'GET /next HTTP/1.1\r\n\r\n')
+        status, _, body = read_response(f)
+        assert status == 200
+        assert json.loads(body.decode())['path'] == '/next'
+
+    assert get_body == b'the same for GET and HEAD'
+
+def test_application_error(server):
+    server = server()
+    status, headers, body = request(server, b'GET /fail HTTP/1.1\r\n\r\n')
+
+    assert status == 500
+    assert headers['connection'] == 'close'
+    assert body == b'Internal Server Error'
+
+def test_stream(server):
+    events = Events([b'data: 1\n\n', b'data: 2\n\n'])
+    server = server(streams={'/events': events})
+
+    sock, f = connect(server)
+    with sock:
+        sock.sendall(b'GET /events HTTP/1.1\r\n\r\n')
+        assert f.readline() == b'HTTP/1.1 200 OK\r\n'
+        headers = b''.join(iter(f.readline, b'\r\n'))
+        assert b'Connection: close' in headers
+        assert f.readline() + f.readline() == b'data: 1\n\n'
+        assert f.readline() + f.readline() == b'data: 2\n\n'
+
+        # The connection ends with the body
+        server.loop.call_soon_threadsafe(events.release.set)
+        assert f.read() == b''
+        assert events.closed.wait(5)
+
+    # Only GET is handed to the stream
+    status, _, body = request(server, b'POST /events HTTP/1.1\r\n\r\n')
+    assert status == 200
+    assert json.loads(body.decode())['method'] == 'POST'
+
+def test_stop_cancels_streams(server):
+    events = Events([b'data: 1\n\n'])
+    server = server(streams={'/events': events})
+
+    sock, f = connect(server)
+    with sock:
+        sock.sendall(b'GET /events HTTP/1.1\r\n\r\n')
+        while f.readline() != b'data: 1\n':
+            pass
+
+        stop(server)
+
+        assert events.closed.wait(5)
+        assert f.read() == b'\n'
+
+def test_stream_to_a_client_that_stops_reading(server):
+    events = Events(itertools.repeat(b'x' * 65536))
+    server = server(streams={'/events': events}, write_timeout=0.2)
+
+    sock, f = connect(server)
+    with sock:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        sock.sendall(b'GET /events HTTP/1.1\r\n\r\n')
+
+        # Cut off once the buffers fill up
+        assert events.closed.wait(5)
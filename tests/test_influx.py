@@ -0,0 +1,83 @@
+# Copyright (c) 2016 Joseph Kogut
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import http.server
+
+import pytest
+
+from weatherstation.influx import InfluxPublisher
+from weatherstation.observation import Observation
+from weatherstation.publish import PublishError, PublishRejected
+
+OBSERVATIONS = [Observation(1476680400, 20.5, 101.3, 50.0, None),
+                Observation(1476680401.25, 20.0, 101.25, 51.0, 3.0)]
+
+class Influx(http.server.BaseHTTPRequestHandler):
+    # Answers every write with status
+    protocol_version = 'HTTP/1.1'
+    status = 204
+    writes = []
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.writes.append((self.path, body.decode('UTF-8')))
+
+        message = b'' if self.status == 204 else b'{"error":"stand-in"}'
+        self.send_response(self.status)
+        self.send_header('Content-Length', str(len(message)))
+        self.end_headers()
+        self.wfile.write(message)
+
+    def log_message(self, *args):
+        pass
+
+def influx(serve, status):
+    server = serve(type('TestInflux', (Influx,), {'status': status, 'writes': []}))
+    publisher = InfluxPublisher('http://127.0.0.1:{}/write?db=weather'.format(server.port),
+                                tags={'station': 'KTEST 1'}, timeout=5)
+    return server.RequestHandlerClass, publisher
+
+def test_write(serve):
+    handler, publisher = influx(serve, 204)
+
+    publisher.publish(OBSERVATIONS)
+    publisher.close()
+
+    path, body = handler.writes[0]
+    assert path == '/write?db=weather&precision=ms'
+    assert body.split('\n') == [
+        r'weather,station=KTEST\ 1 tempc=20.5,barom_kPa=101.3,humidity_pct=50.0 1476680400000',
+        r'weather,station=KTEST\ 1 tempc=20.0,barom_kPa=101.25,humidity_pct=51.0,uv=3.0 '
+        '1476680401250',
+    ]
+
+def test_bad_data_is_rejected(serve):
+    _, publisher = influx(serve, 400)
+
+    with pytest.raises(PublishRejected):
+        publisher.publish(OBSERVATIONS)
+
+@pytest.mark.parametrize('status', [500, 503, 401])
+def test_other_errors_are_retried(serve, status):
+    _, publisher = influx(serve, status)
+
+    with pytest.raises(PublishError):
+        publisher.publish(OBSERVATIONS)
@@ -0,0 +1,139 @@
+# Copyright (c) 2016 Joseph Kogut
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import json
+import socketserver
+import struct
+
+import pytest
+
+from weatherstation.mqtt import MQTTPublisher
+from weatherstation.observation import Observation
+from weatherstation.publish import PublishError
+
+OBSERVATIONS = [Observation(1476680400 + i, 20.0 + i, 101.3, 50.0, 3.0) for i in range(3)]
+
+class Broker(socketserver.BaseRequestHandler):
+    # Accepts a connection with return_code, acks every QoS 1 PUBLISH, and
+    # hangs up after publishes_per_connection of them
+    return_code = 0
+    publishes_per_connection = None
+
+    connections = 0
+    published = []
+
+    def _read(self, n):
+        data = b''
+        while len(data) < n:
+            chunk = self.request.recv(n - len(data))
+            if not chunk:
+                raise EOFError
+            data += chunk
+        return data
+
+    def _packet(self):
+        header = self._read(1)[0]
+        length, shift = 0, 0
+        while True:
+            digit = self._read(1)[0]
+            length |= (digit & 0x7F) << shift
+            shift += 7
+            if not digit & 0x80:
+                break
+        return header, self._read(length)
+
+    def handle(self):
+        type(self).connections += 1
+        count = 0
+
+        try:
+            header, body = self._packet()
+            assert header == 0x10 and body[2:6] == b'MQTT'
+            self.request.sendall(bytes([0x20, 2, 0, self.return_code]))
+
+            while True:
+                header, body = self._packet()
+                if header & 0xF0 != 0x30:
+                    return
+
+                length, = struct.unpack('!H', body[:2])
+                topic = body[2:2 + length].decode('UTF-8')
+                packet_id = body[2 + length:4 + length]
+                payload = json.loads(body[4 + length:].decode('UTF-8'))
+                self.published.append((topic, header & 0x0F, payload))
+                self.request.sendall(bytes([0x40, 2]) + packet_id)
+
+                count += 1
+                if count == self.publishes_per_connection:
+                    return
+        except EOFError:
+            pass
+
+def broker(serve, **attributes):
+    attributes.update(connections=0, published=[])
+    return serve(type('TestBroker', (Broker,), attributes))
+
+def test_publish_batch(serve):
+    server = broker(serve)
+    publisher = MQTTPublisher('127.0.0.1', server.port, topic='station/obs', timeout=5)
+
+    publisher.publish(OBSERVATIONS)
+    publisher.publish(OBSERVATIONS[:1])
+    publisher.close()
+
+    handler = server.RequestHandlerClass
+    assert handler.connections == 1
+    assert [topic for topic, _, _ in handler.published] == ['station/obs'] * 4
+    # QoS 1, retained
+    assert {flags for _, flags, _ in handler.published} == {0x03}
+
+    payload = handler.published[0][2]
+    assert payload['tempc'] == 20.0
+    assert payload['dateutc'] == '2016-10-17 05:00:00'
+
+def test_connection_refused(serve):
+    # 5: not authorized
+    server = broker(serve, return_code=5)
+    publisher = MQTTPublisher('127.0.0.1', server.port, timeout=5)
+
+    with pytest.raises(PublishError):
+        publisher.publish(OBSERVATIONS)
+
+    assert server.RequestHandlerClass.published == []
+
+def test_reconnects_after_broker_hangs_up(serve):
+    server = broker(serve, publishes_per_connection=3)
+    publisher = MQTTPublisher('127.0.0.1', server.port, timeout=5)
+
+    publisher.publish(OBSERVATIONS)
+    # The broker has closed the connection, the next batch goes out on a new one
+    publisher.publish(OBSERVATIONS)
+    publisher.close()
+
+    handler = server.RequestHandlerClass
+    assert handler.connections == 2
+    assert len(handler.published) == 6
+
+def test_broker_down():
+    publisher = MQTTPublisher('127.0.0.1', 1, timeout=5)
+
+    with pytest.raises(OSError):
+        publisher.publish(OBSERVATIONS)
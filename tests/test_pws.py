@@ -0,0 +1,68 @@
+# Copyright (c) 2016 Joseph Kogut
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+from configparser import ConfigParser
+
+import pytest
+
+from weatherstation.influx import InfluxPublisher
+from weatherstation.pws import Daemon
+from weatherstation.sim import Simulation, SimulationError, load_simulation
+
+def daemon(tmp_path, **kwargs):
+    simulation = Simulation()
+    return Daemon('KTEST1', 'secret', i2c=simulation.i2c, clock=simulation.clock,
+                  calibration_cache=str(tmp_path / 'cache'),
+                  spool_path=str(tmp_path / 'spool.db'),
+                  publishers=[InfluxPublisher()], **kwargs)
+
+def test_simulated_readings_stay_in_memory(tmp_path):
+    station = daemon(tmp_path)
+    try:
+        assert station.publisher.uploaders == []
+        assert station.spool.path == ':memory:'
+    finally:
+        station.close()
+
+    assert list(tmp_path.iterdir()) == []
+
+def test_simulated_readings_published_on_request(tmp_path):
+    station = daemon(tmp_path, publish=True)
+    try:
+        assert [u.publisher.name for u in station.publisher.uploaders] == \
+            ['wunderground', 'influx']
+        assert station.spool.path == str(tmp_path / 'spool.db')
+    finally:
+        station.close()
+
+    # Even so, the made up calibration is never cached
+    assert not (tmp_path / 'cache').exists()
+
+def config(text):
+    parser = ConfigParser()
+    parser.read_string(text)
+    return parser
+
+def test_real_outputs_need_real_time():
+    assert load_simulation(config('[sim]\nenabled = true\nreal_outputs = true\n')) is not None
+
+    with pytest.raises(SimulationError):
+        load_simulation(config('[sim]\nenabled = true\nspeed = 60\nreal_outputs = true\n'))
@@ -0,0 +1,185 @@
+# Copyright (c) 2016 Joseph Kogut
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+from array import array
+
+import pytest
+
+from weatherstation.history import FIELDS, NAN
+from weatherstation.observation import Observation
+from weatherstation.rollup import RESOLUTIONS, Rollup, Rollups
+
+# 2016-10-17 00:00:00 UTC, a day boundary
+MIDNIGHT = 1476662400
+
+def values(tempc, uv=None):
+    return (tempc, 101.25, 50.0, uv)
+
+def aggregates(rollup, field='tempc', start=None, end=None):
+    return [tuple(aggregate) for aggregate in rollup.query(field, start, end)]
+
+@pytest.mark.parametrize('resolution', [60, 3600, 86400])
+def test_bucket_edges(resolution):
+    rollup = Rollup(resolution, 10)
+
+    # The last moment of one bucket, then exactly on the edge of the next
+    rollup.add(MIDNIGHT + resolution - 1, values(1.0))
+    rollup.add(MIDNIGHT + resolution, values(2.0))
+    rollup.add(MIDNIGHT + 2 * resolution - 1, values(4.0))
+
+    assert aggregates(rollup) == [
+        (MIDNIGHT, 1.0, 1.0, 1.0, 1.0),
+        (MIDNIGHT + resolution, 2.0, 4.0, 3.0, 4.0),
+    ]
+
+@pytest.mark.parametrize('resolution', [60, 3600, 86400])
+def test_min_max_mean_last(resolution):
+    rollup = Rollup(resolution, 10)
+    for i, tempc in enumerate([5.0, -2.5, 10.0, 1.5]):
+        rollup.add(MIDNIGHT + i * resolution // 4, values(tempc))
+
+    assert aggregates(rollup) == [(MIDNIGHT, -2.5, 10.0, 3.5, 1.5)]
+
+def test_missing_values_are_left_out():
+    rollup = Rollup(60, 10)
+    rollup.add(MIDNIGHT, values(1.0, uv=None))
+    rollup.add(MIDNIGHT + 1, values(3.0, uv=2.0))
+    rollup.add(MIDNIGHT + 2, values(float('nan'), uv=None))
+    # A bucket with nothing for uv
+    rollup.add(MIDNIGHT + 60, values(5.0, uv=None))
+
+    assert aggregates(rollup, 'tempc') == [(MIDNIGHT, 1.0, 3.0, 2.0, 3.0),
+                                           (MIDNIGHT + 60, 5.0, 5.0, 5.0, 5.0)]
+    assert aggregates(rollup, 'uv') == [(MIDNIGHT, 2.0, 2.0, 2.0, 2.0)]
+
+def test_late_samples_are_dropped():
+    rollup = Rollup(60, 10)
+    rollup.add(MIDNIGHT + 60, values(1.0))
+    rollup.add(MIDNIGHT + 59, values(100.0))
+
+    assert aggregates(rollup) == [(MIDNIGHT + 60, 1.0, 1.0, 1.0, 1.0)]
+
+def test_gaps_stay_gaps():
+    rollup = Rollup(60, 10)
+    rollup.add(MIDNIGHT, values(1.0))
+    rollup.add(MIDNIGHT + 600, values(2.0))
+
+    assert len(rollup) == 2
+    assert [a[0] for a in aggregates(rollup)] == [MIDNIGHT, MIDNIGHT + 600]
+
+def test_oldest_buckets_are_dropped():
+    rollup = Rollup(60, 3)
+    for i in range(5):
+        rollup.add(MIDNIGHT + i * 60, values(float(i)))
+
+    assert len(rollup) == 3
+    assert [a[1] for a in aggregates(rollup)] == [2.0, 3.0, 4.0]
+
+def test_query_range():
+    rollup = Rollup(60, 10)
+    for i in range(5):
+        rollup.add(MIDNIGHT + i * 60, values(float(i)))
+
+    # Buckets starting in [start, end), start rounded down to its bucket
+    assert [a[1] for a in aggregates(rollup, start=MIDNIGHT + 90, end=MIDNIGHT + 240)] == \
+        [1.0, 2.0, 3.0]
+    assert aggregates(rollup, start=MIDNIGHT + 300) == []
+
+def test_rollups():
+    rollups = Rollups()
+    for i in range(2 * 86400 // 600):
+        rollups.append(Observation(MIDNIGHT + i * 600, float(i % 144), 101.25, 50.0, None))
+
+    minutes, hours, days = rollups.rollups
+    assert [minutes.resolution, hours.resolution, days.resolution] == [60, 3600, 86400]
+    assert len(minutes) == 288 and len(hours) == 48 and len(days) == 2
+
+    assert aggregates(days) == [(MIDNIGHT, 0.0, 143.0, 71.5, 143.0),
+                                (MIDNIGHT + 86400, 0.0, 143.0, 71.5, 143.0)]
+    assert aggregates(hours)[1] == (MIDNIGHT + 3600, 6.0, 11.0, 8.5, 11.0)
+
+    # The coarsest resolution that still gives enough points
+    assert rollups.query('tempc', MIDNIGHT, MIDNIGHT + 2 * 86400, 2)[0] == 86400
+    assert rollups.query('tempc', MIDNIGHT, MIDNIGHT + 2 * 86400, 3)[0] == 3600
+    assert rollups.query('tempc', MIDNIGHT, MIDNIGHT + 2 * 86400, 100)[0] == 60
+    assert rollups.query('tempc', MIDNIGHT, MIDNIGHT + 600, 100)[0] == 60
+
+    with pytest.raises(KeyError):
+        rollups.query('wind', MIDNIGHT, MIDNIGHT + 600)
+
+def segment(observations):
+    # A (timestamps, columns) segment like History.segments gives
+    timestamps = memoryview(array('q', [o.timestamp for o in observations]))
+    columns = {field: memoryview(array('f', [NAN if getattr(o, field) is None else getattr(o, field)
+                                             for o in observations]))
+               for field in FIELDS}
+    return timestamps, columns
+
+def test_add_block_matches_add():
+    observations = [Observation(MIDNIGHT + i * 7, float(i % 13) - 4.0, 101.25, 50.0,
+                                None if i % 3 else float(i % 5))
+                    for i in range(1000)]
+    # A minute with nothing for uv, and one with nothing at all
+    observations = [o for o in observations if not 600 <= o.timestamp - MIDNIGHT < 720]
+
+    for resolution in (60, 3600):
+        one, block = Rollup(resolution, 100), Rollup(resolution, 100)
+        for o in observations:
+            one.add(o.timestamp, [getattr(o, field) for field in FIELDS])
+        block.add_block(*segment(observations))
+
+        for field in FIELDS:
+            assert aggregates(block, field) == pytest.approx(aggregates(one, field))
+
+    # Samples before since are left out
+    rollup = Rollup(60, 100)
+    rollup.add_block(*segment(observations), since=MIDNIGHT + 6000)
+    assert aggregates(rollup)[0][0] == MIDNIGHT + 6000
+
+def test_seed_keeps_live_samples():
+    until = MIDNIGHT + 86400 + 1800
+    archived = [Observation(MIDNIGHT + i * 60, float(i % 100), 101.25, 50.0, None)
+                for i in range((until - MIDNIGHT) // 60)]
+    live = [Observation(until + i * 60, 500.0 + i, 101.25, 50.0, None) for i in range(10)]
+
+    scans = []
+    def scan(start, end):
+        scans.append((start, end))
+        return [segment([o for o in archived if start <= o.timestamp < end])]
+
+    # Samples keep arriving while the archive is read
+    rollups = Rollups()
+    for o in live:
+        rollups.append(o)
+    rollups.seed(scan, until)
+
+    # Reaching back as far as the longest rollup holds
+    assert scans == [(until - max(r * c for r, c in RESOLUTIONS), until)]
+
+    expected = Rollups()
+    for o in archived + live:
+        expected.append(o)
+    for seeded, full in zip(rollups.rollups, expected.rollups):
+        assert aggregates(seeded) == pytest.approx(aggregates(full))
+
+    # The hour of the restart is half archived, half live
+    hours = rollups.rollups[1]
+    assert aggregates(hours, start=until - 1800, end=until)[0][1:] == (40.0, 509.0, 167.0, 509.0)
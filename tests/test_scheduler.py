@@ -0,0 +1,171 @@
+# Copyright (c) 2016 Joseph Kogut
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import threading
+
+import pytest
+
+from weatherstation.scheduler import Scheduler
+
+class Clock(object):
+    # Monotonic time that only moves when told to
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+@pytest.fixture
+def scheduler(clock):
+    return Scheduler(clock)
+
+def names(jobs):
+    return [job.name for job in jobs]
+
+def test_deadline_order(clock, scheduler):
+    runs = []
+    for name, delay in [('c', 3), ('a', 1), ('b', 2)]:
+        scheduler.add(name, 10, lambda name=name: runs.append(name), delay=delay)
+
+    assert scheduler.next_deadline() == 1001
+    assert scheduler.pop_due() == []
+
+    clock.now = 1002
+    assert scheduler.run_pending() == 2
+    assert runs == ['a', 'b']
+    assert scheduler.next_deadline() == 1003
+
+    clock.now = 1011
+    assert names(scheduler.pop_due()) == ['c', 'a']
+    assert scheduler.next_deadline() == 1012
+
+def test_same_deadline_runs_in_order_added(clock, scheduler):
+    for name in ('first', 'second', 'third'):
+        scheduler.add(name, 5, lambda: None)
+
+    assert names(scheduler.pop_due()) == ['first', 'second', 'third']
+
+def test_replace_job(clock, scheduler):
+    runs = []
+    scheduler.add('job', 5, lambda: runs.append('old'))
+    scheduler.run_pending()
+
+    # Same name, new function and interval, first run after delay
+    scheduler.add('job', 20, lambda: runs.append('new'), delay=20)
+    assert names(scheduler.jobs()) == ['job']
+    assert scheduler.next_deadline() == 1020
+
+    clock.now = 1005
+    assert scheduler.run_pending() == 0
+
+    clock.now = 1020
+    scheduler.run_pending()
+    assert runs == ['old', 'new']
+    assert scheduler.next_deadline() == 1040
+
+def test_remove_job(clock, scheduler):
+    runs = []
+    scheduler.add('kept', 10, lambda: runs.append('kept'), delay=5)
+    scheduler.add('removed', 10, lambda: runs.append('removed'))
+
+    scheduler.remove('removed')
+    assert names(scheduler.jobs()) == ['kept']
+    assert scheduler.next_deadline() == 1005
+
+    clock.now = 1100
+    scheduler.run_pending()
+    assert runs == ['kept']
+
+    scheduler.remove('kept')
+    assert scheduler.next_deadline() is None
+    with pytest.raises(KeyError):
+        scheduler.remove('kept')
+
+def test_late_run_keeps_phase(clock, scheduler):
+    scheduler.add('job', 5, lambda: None)
+    scheduler.run_pending()
+
+    clock.now = 1006
+    assert scheduler.run_pending() == 1
+    assert scheduler.next_deadline() == 1010
+
+def test_missed_runs_are_not_caught_up(clock, scheduler):
+    runs = []
+    scheduler.add('job', 5, lambda: runs.append(clock.now))
+    scheduler.run_pending()
+
+    # Asleep for ten intervals: one run, then a full interval on
+    clock.now = 1053
+    assert scheduler.run_pending() == 1
+    assert scheduler.run_pending() == 0
+    assert runs == [1000, 1053]
+    assert scheduler.next_deadline() == 1058
+
+def test_failed_job_is_rescheduled(clock, scheduler):
+    runs = []
+
+    def fail():
+        runs.append('fail')
+        raise RuntimeError('failed')
+
+    scheduler.add('fail', 5, fail)
+    scheduler.add('other', 5, lambda: runs.append('other'))
+    assert scheduler.run_pending() == 2
+
+    clock.now = 1005
+    scheduler.run_pending()
+    assert runs == ['fail', 'other', 'fail', 'other']
+
+def test_on_change(scheduler):
+    changes = []
+    scheduler.on_change = lambda: changes.append(names(scheduler.jobs()))
+
+    scheduler.add('job', 5, lambda: None)
+    scheduler.remove('job')
+    scheduler.stop()
+
+    assert changes == [['job'], [], []]
+
+def test_run_wakes_for_new_jobs_and_stop():
+    # Real time, and nothing scheduled, so run() waits without a timeout
+    scheduler = Scheduler()
+    ran = threading.Event()
+    thread = threading.Thread(target=scheduler.run, daemon=True)
+    thread.start()
+
+    scheduler.add('job', 60, ran.set)
+    assert ran.wait(5)
+
+    scheduler.stop()
+    thread.join(5)
+    assert not thread.is_alive()
+
+def test_stop_before_run(scheduler):
+    scheduler.add('job', 5, pytest.fail, delay=5)
+    scheduler.stop()
+
+    # Returns at once, without running anything
+    scheduler.run()
+    assert not scheduler.running
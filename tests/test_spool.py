@@ -0,0 +1,69 @@
+# Copyright (c) 2016 Joseph Kogut
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import os
+
+from weatherstation.observation import Observation
+from weatherstation.spool import Spool
+
+OBSERVATIONS = [Observation(1476680400 + i, 20.0 + i, 101.25, 50.0, None) for i in range(5)]
+
+def test_creates_its_directory(tmp_path):
+    path = str(tmp_path / 'lib' / 'weatherstation' / 'spool.db')
+
+    spool = Spool(path)
+    spool.queue('sink').append(OBSERVATIONS[0])
+    spool.close()
+
+    assert os.path.exists(path)
+
+def test_survives_a_restart(tmp_path):
+    path = str(tmp_path / 'spool.db')
+
+    spool = Spool(path)
+    queue = spool.queue('sink')
+    for observation in OBSERVATIONS:
+        queue.append(observation)
+    queue.ack(queue.peek(2)[-1][0])
+    spool.close()
+
+    queue = Spool(path).queue('sink')
+    assert len(queue) == 3
+    assert [observation for _, observation in queue.peek(10)] == OBSERVATIONS[2:]
+
+def test_queues_are_separate():
+    spool = Spool()
+    first, second = spool.queue('first'), spool.queue('second')
+    for observation in OBSERVATIONS:
+        first.append(observation)
+    second.append(OBSERVATIONS[0])
+
+    first.ack(first.peek(10)[-1][0])
+    assert len(first) == 0
+    assert [observation for _, observation in second.peek(10)] == OBSERVATIONS[:1]
+
+def test_oldest_are_dropped_when_full():
+    queue = Spool(max_records=3).queue('sink')
+    for observation in OBSERVATIONS:
+        queue.append(observation)
+
+    assert len(queue) == 3
+    assert [observation for _, observation in queue.peek(10)] == OBSERVATIONS[2:]
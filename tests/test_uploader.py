@@ -0,0 +1,288 @@
+# Copyright (c) 2016 Joseph Kogut
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import random
+import threading
+import time
+
+import pytest
+
+from weatherstation.observation import Observation
+from weatherstation.publish import Publisher, PublishError, PublishRejected
+from weatherstation.spool import Spool
+from weatherstation.uploader import FanOut, Uploader
+from weatherstation.weatherunderground import PWS
+
+OBSERVATIONS = [Observation(1476680400 + i, 20.0 + i, 101.3, 50.0, 3.0) for i in range(3)]
+
+class FakePublisher(Publisher):
+    # Records each batch, or raises error instead
+    def __init__(self, name, error=None, realtime=False):
+        self.name = name
+        self.error = error
+        self.realtime = realtime
+        self.batches = []
+
+    def publish(self, observations):
+        if self.error is not None:
+            raise self.error
+        self.batches.append(list(observations))
+
+class BlockingPublisher(Publisher):
+    # Hangs, like a sink that stopped answering, until released
+    name = 'blocking'
+
+    def __init__(self):
+        self.release = threading.Event()
+
+    def publish(self, observations):
+        self.release.wait()
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+class FakeTransport(object):
+    # Answers every Weather Underground upload with status and body, or
+    # with each of responses in turn, then status and body
+    def __init__(self, status, body, responses=()):
+        self.status = status
+        self.body = body
+        self.responses = list(responses)
+        self.uploads = []
+
+    def get(self, url, parameters=None):
+        self.uploads.append(parameters['dateutc'])
+        if self.responses:
+            return self.responses.pop(0)
+        return self.status, self.body
+
+    def close(self):
+        pass
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+def uploader(spool, publisher, **kwargs):
+    return Uploader(publisher, spool.queue(publisher.name), **kwargs)
+
+def spooled(uploader):
+    return [observation for _, observation in uploader.spool.peek(100)]
+
+@pytest.mark.parametrize('failures, low, high', [
+    (1, 2.5, 5),
+    (2, 5, 10),
+    (4, 20, 40),
+    (20, 150, 300),
+])
+def test_backoff_is_jittered_and_capped(monkeypatch, failures, low, high):
+    each = Uploader(FakePublisher('sink'), retry_base=5, retry_max=300)
+    each.failures = failures
+
+    monkeypatch.setattr(random, 'uniform', lambda a, b: a)
+    assert each.backoff() == low
+    monkeypatch.setattr(random, 'uniform', lambda a, b: b)
+    assert each.backoff() == high
+
+def test_failed_batch_is_retried_after_backoff(monkeypatch):
+    monkeypatch.setattr(random, 'uniform', lambda a, b: b)
+    clock = Clock()
+    publisher = FakePublisher('sink', PublishError('stand-in outage'))
+    each = uploader(Spool(), publisher, batch=5, retry_base=5, clock=clock)
+
+    for observation in OBSERVATIONS:
+        each.submit(observation)
+
+    assert each.process() == 5
+    assert each.failures == 1
+    assert spooled(each) == OBSERVATIONS
+
+    # Not before the backoff is up
+    publisher.error = None
+    clock.now += 3
+    assert each.process() == 2
+    assert publisher.batches == []
+
+    clock.now += 2
+    assert each.process() is None
+    assert publisher.batches == [OBSERVATIONS]
+    assert spooled(each) == []
+    assert each.failures == 0
+
+def test_rejected_batch_is_dropped():
+    clock = Clock()
+    publisher = FakePublisher('sink', PublishRejected('stand-in rejection'))
+    each = uploader(Spool(), publisher, batch=2, interval=2, clock=clock)
+
+    for observation in OBSERVATIONS:
+        each.submit(observation)
+
+    # The first batch is gone, without a backoff, the rest follows
+    assert each.process() == 2
+    assert each.failures == 0
+    assert spooled(each) == OBSERVATIONS[2:]
+
+    publisher.error = None
+    assert each.process() is None
+    assert publisher.batches == [OBSERVATIONS[2:]]
+
+def test_weather_underground_outage_keeps_the_backlog():
+    publisher = PWS('KTEST1', 'secret', transport=FakeTransport(503, b'<html>Outage</html>'))
+    each = uploader(Spool(), publisher, clock=Clock())
+
+    for observation in OBSERVATIONS:
+        each.submit(observation)
+    each.process()
+
+    assert each.failures == 1
+    assert spooled(each) == OBSERVATIONS
+
+BATCH = [Observation(1476680400 + i, 20.0, 101.3, 50.0, 3.0) for i in range(5)]
+
+def test_weather_underground_rejection_mid_batch():
+    # The second of five is refused, the rest of the batch is still sent
+    transport = FakeTransport(200, b'success', [(200, b'success'), (200, b'INVALID dateutc')])
+    each = uploader(Spool(), PWS('KTEST1', 'secret', transport=transport), batch=5,
+                    clock=Clock())
+
+    for observation in BATCH:
+        each.submit(observation)
+
+    assert each.process() == each.interval
+    assert each.failures == 0
+    assert spooled(each) == BATCH[2:]
+
+    assert each.process() is None
+    assert transport.uploads == [observation.dateutc for observation in BATCH]
+    assert spooled(each) == []
+
+def test_weather_underground_failure_mid_batch(monkeypatch):
+    # What went through before the outage is not sent again
+    monkeypatch.setattr(random, 'uniform', lambda a, b: b)
+    clock = Clock()
+    transport = FakeTransport(200, b'success', [(200, b'success'), (200, b'success'),
+                                                (503, b'Service Unavailable')])
+    each = uploader(Spool(), PWS('KTEST1', 'secret', transport=transport), batch=5,
+                    retry_base=5, clock=clock)
+
+    for observation in BATCH:
+        each.submit(observation)
+
+    assert each.process() == 5
+    assert each.failures == 1
+    assert spooled(each) == BATCH[2:]
+
+    clock.now += 5
+    assert each.process() is None
+    assert transport.uploads == [o.dateutc for o in BATCH[:3] + BATCH[2:]]
+    assert spooled(each) == []
+
+def test_weather_underground_connection_error_mid_batch():
+    class Dropping(FakeTransport):
+        def get(self, url, parameters=None):
+            if len(self.uploads) == 1:
+                self.uploads.append(None)
+                raise ConnectionResetError('stand-in reset')
+            return FakeTransport.get(self, url, parameters)
+
+    each = uploader(Spool(), PWS('KTEST1', 'secret', transport=Dropping(200, b'success')),
+                    batch=5, clock=Clock())
+    for observation in BATCH:
+        each.submit(observation)
+
+    each.process()
+    assert each.failures == 1
+    assert spooled(each) == BATCH[1:]
+
+def test_nothing_is_published_offline():
+    online = [False]
+    publisher = FakePublisher('sink')
+    each = uploader(Spool(), publisher, online=lambda: online[0], clock=Clock())
+
+    each.submit(OBSERVATIONS[0])
+    assert each.process() is None
+    assert publisher.batches == []
+
+    online[0] = True
+    each.process()
+    assert publisher.batches == [OBSERVATIONS[:1]]
+
+def test_realtime_sends_only_the_latest(monkeypatch):
+    monkeypatch.setattr(random, 'uniform', lambda a, b: b)
+    clock = Clock()
+    publisher = FakePublisher('sink', PublishError('stand-in outage'), realtime=True)
+    each = Uploader(publisher, retry_base=5, clock=clock)
+
+    each.submit(OBSERVATIONS[0])
+    assert each.process() == 5
+
+    # Replaces the failed one, rather than queueing behind it
+    each.submit(OBSERVATIONS[1])
+    each.submit(OBSERVATIONS[2])
+    publisher.error = None
+    clock.now += 5
+
+    assert each.process() is None
+    assert publisher.batches == [OBSERVATIONS[2:]]
+
+    # Nothing new, nothing sent
+    assert each.process() is None
+    assert len(publisher.batches) == 1
+
+def test_fan_out_failing_sink_keeps_its_own_backlog():
+    spool = Spool()
+    good = FakePublisher('good')
+    down = FakePublisher('down', PublishError('stand-in outage'))
+    uploaders = [uploader(spool, good), uploader(spool, down)]
+    fan_out = FanOut(uploaders)
+
+    for observation in OBSERVATIONS:
+        fan_out.submit(observation)
+    for each in uploaders:
+        each.process()
+
+    assert good.batches == [OBSERVATIONS]
+    assert len(uploaders[0].spool) == 0
+
+    assert uploaders[1].failures == 1
+    assert [observation for _, observation in uploaders[1].spool.peek(10)] == OBSERVATIONS
+
+def test_fan_out_hung_sink_does_not_delay_others():
+    spool = Spool()
+    good = FakePublisher('good')
+    hung = BlockingPublisher()
+    fan_out = FanOut([uploader(spool, good), uploader(spool, hung)])
+    fan_out.start()
+
+    try:
+        for observation in OBSERVATIONS:
+            fan_out.submit(observation)
+
+        wait_for(lambda: sum(len(batch) for batch in good.batches) == 3)
+        assert [o for batch in good.batches for o in batch] == OBSERVATIONS
+    finally:
+        hung.release.set()
+        fan_out.stop()
@@ -0,0 +1,73 @@
+# Copyright (c) 2016 Joseph Kogut
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import pytest
+
+from weatherstation.observation import Observation
+from weatherstation.publish import PublishError, PublishRejected
+from weatherstation.weatherunderground import PWS
+
+class FakeTransport(object):
+    def __init__(self, status, body):
+        self.status = status
+        self.body = body
+        self.requests = []
+
+    def get(self, url, parameters=None):
+        self.requests.append((url, parameters))
+        return self.status, self.body
+
+    def close(self):
+        pass
+
+OBSERVATION = Observation(1476680400, 20.0, 101.3, 50.0, 3.0)
+
+def publish(status, body):
+    transport = FakeTransport(status, body)
+    PWS('KTEST1', 'secret', transport=transport).publish([OBSERVATION])
+    return transport
+
+def test_success():
+    url, parameters = publish(200, b'success\n').requests[0]
+
+    assert url == PWS.url
+    assert parameters['ID'] == 'KTEST1'
+    assert parameters['dateutc'] == '2016-10-17 05:00:00'
+    assert parameters['tempf'] == pytest.approx(68.0)
+
+@pytest.mark.parametrize('status, body', [
+    (500, b'<html>Internal Server Error</html>'),
+    (502, b'Bad Gateway'),
+    (503, b'success'),
+    (200, b'<html>Captive portal</html>'),
+    (200, b''),
+])
+def test_outages_are_retried(status, body):
+    with pytest.raises(PublishError):
+        publish(status, body)
+
+@pytest.mark.parametrize('body', [
+    b'INVALIDPASSWORDID|Password or key and/or id are incorrect\n',
+    b'INVALID dateutc\n',
+])
+def test_rejections_are_dropped(body):
+    with pytest.raises(PublishRejected):
+        publish(200, body)
@@ -0,0 +1,77 @@
+# Copyright (c) 2016 Joseph Kogut
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import json
+
+import pytest
+
+from weatherstation import web
+from weatherstation.tracer import Tracer
+
+class Station(object):
+    # The parts of the Daemon the tracer endpoint reads
+    observation = None
+    generation = 0
+
+    def __init__(self, tracer):
+        self.tracer = tracer
+
+@pytest.fixture
+def tracer():
+    # Never started, so nothing is sampled or written
+    return Tracer(None)
+
+def post(tracer, control, address, enabled='true'):
+    web.init(Station(tracer), tracer_control=control)
+    client = web.app.test_client()
+    return client.post('/debug/tracer', data={'enabled': enabled},
+                       environ_base={'REMOTE_ADDR': address})
+
+@pytest.mark.parametrize('address', ['127.0.0.1', '::1', '::ffff:127.0.0.1'])
+def test_loopback_clients_can_switch_tracing(tracer, address):
+    response = post(tracer, 'loopback', address)
+
+    assert response.status_code == 200
+    assert json.loads(response.get_data(as_text=True))['enabled'] is True
+    assert tracer.enabled
+
+@pytest.mark.parametrize('address', ['192.168.1.20', '10.0.0.1', '::ffff:192.168.1.20', ''])
+def test_other_clients_are_refused_by_default(tracer, address):
+    response = post(tracer, 'loopback', address)
+
+    assert response.status_code == 403
+    assert not tracer.enabled
+
+def test_any_client(tracer):
+    assert post(tracer, 'any', '192.168.1.20').status_code == 200
+    assert tracer.enabled
+
+def test_off(tracer):
+    assert post(tracer, 'off', '127.0.0.1').status_code == 404
+    assert not tracer.enabled
+
+def test_invalid_control(tracer):
+    with pytest.raises(ValueError):
+        web.init(Station(tracer), tracer_control='everyone')
+
+def test_invalid_enabled(tracer):
+    assert post(tracer, 'loopback', '127.0.0.1', enabled='maybe').status_code == 400
+    assert not tracer.enabled
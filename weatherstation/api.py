@@ -0,0 +1,204 @@
+# Copyright (c) 2016 Joseph Kogut
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# JSON API over the station's current conditions and history.
+#
+# Responses are rendered to bytes once per sample and cached, keyed by the
+# request, until the daemon's generation counter moves on. Each one carries an
+# ETag, from a hash of the body, and a Last-Modified time, the time of the
+# latest sample, so polling clients can revalidate for a 304.
+
+import hashlib
+import json
+import math
+import threading
+import time
+from collections import namedtuple
+
+from weatherstation import units
+from weatherstation.history import FIELDS
+
+# Points returned by a history query without a step
+DEFAULT_POINTS = 300
+
+# Length of a history query without a start, in seconds
+DEFAULT_RANGE = 3600
+
+# Most raw samples a history query returns, beyond this it is answered
+# from the finest rollup instead
+MAX_RAW_POINTS = 20000
+
+# Latest timestamp a query may name, the end of year 9999
+MAX_TIMESTAMP = 253402300799
+
+# Distinct responses cached per generation
+CACHE_SIZE = 64
+
+CachedResponse = namedtuple('CachedResponse', ['body', 'etag', 'last_modified'])
+
+class APIError(ValueError):
+    pass
+
+def current(daemon):
+    observation = daemon.observation
+    if observation is None:
+        return {}
+
+    def convert(conversion, value):
+        return None if value is None else conversion(value)
+
+    return {
+        'timestamp': observation.timestamp,
+        'dateutc': observation.dateutc,
+        'tempc': observation.tempc,
+        'tempf': convert(units.DEGC_TO_DEGF, observation.tempc),
+        'barom_kPa': observation.barom_kPa,
+        'barom_inHg': convert(units.KPA_TO_INHG, observation.barom_kPa),
+        'humidity_pct': observation.humidity_pct,
+        'uv': observation.uv,
+    }
+
+def _number(value, name):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise APIError('{} must be a number'.format(name))
+
+    if not math.isfinite(number):
+        raise APIError('{} must be finite'.format(name))
+
+    return number
+
+def _timestamp(value, name):
+    timestamp = _number(value, name)
+    if not 0 <= timestamp <= MAX_TIMESTAMP:
+        raise APIError('{} must be between 0 and {}'.format(name, MAX_TIMESTAMP))
+
+    return timestamp
+
+def _raw(daemon, field, start, end):
+    # Raw samples from memory, or from the archive if memory doesn't reach
+    # back far enough. Returns None if there are more than MAX_RAW_POINTS.
+    source = daemon.history
+    oldest = source.segments()[:1]
+    if daemon.archive is not None and (not oldest or oldest[0][0][0] > start):
+        source = daemon.archive
+
+    segments = source.segments(start, end)
+    if sum(len(timestamps) for timestamps, _ in segments) > MAX_RAW_POINTS:
+        return None
+
+    rows = []
+    for timestamps, columns in segments:
+        values = columns[field]
+        rows.extend([timestamp, None if value != value else value]
+                    for timestamp, value in zip(timestamps, values))
+
+    return rows
+
+def history(daemon, field, start=None, end=None, step=None):
+    # Returns field between start and end, both seconds since the epoch.
+    #
+    # A step under a minute returns raw samples, any other step the rollup
+    # with the coarsest resolution no larger than it. Without a step, raw
+    # samples are returned if the minute rollup would give too few points,
+    # otherwise the coarsest rollup that gives enough. More than
+    # MAX_RAW_POINTS raw samples are answered from the minute rollup.
+    if field not in FIELDS:
+        raise APIError('field must be one of {}'.format(', '.join(FIELDS)))
+
+    if end is None:
+        latest = daemon.observation
+        end = (latest.timestamp if latest is not None else time.time()) + 1
+    end = _timestamp(end, 'to')
+    start = max(0, end - DEFAULT_RANGE) if start is None else _timestamp(start, 'from')
+
+    if start >= end:
+        raise APIError('from must be before to')
+
+    rollups = daemon.rollups.rollups
+    if step is not None:
+        step = _number(step, 'step')
+        if step <= 0:
+            raise APIError('step must be positive')
+        points = (end - start) / step
+    else:
+        points = DEFAULT_POINTS
+
+    if step is not None:
+        raw = step < rollups[0].resolution
+    else:
+        raw = (end - start) / rollups[0].resolution < points
+
+    result = {'field': field, 'from': start, 'to': end}
+
+    rows = _raw(daemon, field, start, end) if raw else None
+
+    if rows is not None:
+        result['step'] = None
+        result['columns'] = ['timestamp', 'value']
+        result['points'] = rows
+    else:
+        resolution, aggregates = daemon.rollups.query(field, start, end, points)
+        result['step'] = resolution
+        result['columns'] = ['timestamp', 'min', 'max', 'mean', 'last']
+        result['points'] = [list(aggregate) for aggregate in aggregates]
+
+    return result
+
+class ResponseCache(object):
+    def __init__(self, daemon, size=CACHE_SIZE):
+        self.daemon = daemon
+        self.size = size
+
+        self._generation = None
+        self._responses = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, build):
+        # Returns the CachedResponse for key, calling build() to make the
+        # content if there is nothing cached for the current sample
+        generation = self.daemon.generation
+
+        with self._lock:
+            if generation != self._generation:
+                self._generation = generation
+                self._responses = {}
+
+            response = self._responses.get(key)
+            if response is not None:
+                return response
+
+        content = build()
+        if isinstance(content, bytes):
+            body = content
+        else:
+            body = json.dumps(content, separators=(',', ':')).encode('UTF-8')
+
+        observation = self.daemon.observation
+        response = CachedResponse(body, hashlib.sha1(body).hexdigest()[:20],
+                                  observation.timestamp if observation is not None else None)
+
+        with self._lock:
+            # Only keep it if no sample arrived while building it
+            if generation == self._generation and len(self._responses) < self.size:
+                self._responses[key] = response
+
+        return response
@@ -0,0 +1,393 @@
+# Copyright (c) 2016 Joseph Kogut
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# On-disk archive of every observation.
+#
+# The archive is partitioned by UTC day. A day is a directory holding one
+# file per column: little endian doubles for the timestamps, and single
+# precision floats for each field, missing values stored as NaN. Every
+# column has the same fixed-width record count, so a range query maps the
+# files and casts them to typed memoryviews, without decoding or copying
+# anything, in the same (timestamps, columns) segments as History.
+#
+# Appends are buffered, and written out with one fsync per column every
+# flush_count samples or flush_interval seconds. After a crash the columns
+# may be of different lengths; they are cut back to the shortest one when
+# the day is next opened.
+#
+# compact() rolls the days of each complete month into one gzip compressed
+# file, holding the month's record count and then each column in turn.
+# Reading a compacted month decompresses it into memory once, the most recent
+# months are kept around. Days written for a month after it was compacted are
+# only visible once it is compacted again. The month file is installed
+# before its days are removed, so a crash in between leaves days behind that
+# the month already holds; compacting again merges them without duplicating
+# their samples.
+
+import bisect
+import calendar
+import gzip
+import logging
+import mmap
+import os
+import shutil
+import struct
+import sys
+import threading
+import time
+from array import array
+
+from weatherstation.history import FIELDS, NAN
+from weatherstation.observation import Observation
+
+COLUMNS = ('timestamp',) + FIELDS
+TYPECODES = {'timestamp': 'd'}
+TYPECODES.update((field, 'f') for field in FIELDS)
+
+MONTH_HEADER = struct.Struct('<I')
+
+# Compacted months kept decompressed in memory
+MONTH_CACHE = 2
+
+def _day(timestamp):
+    return time.strftime('%Y-%m-%d', time.gmtime(timestamp))
+
+def _new_columns():
+    return {column: array(TYPECODES[column]) for column in COLUMNS}
+
+def _little_endian(column):
+    if sys.byteorder != 'little':
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column
+
+def _typed_view(buffer, column):
+    view = memoryview(buffer).cast(TYPECODES[column])
+    if sys.byteorder != 'little':
+        # Big endian hosts pay for a copy
+        view = memoryview(_little_endian(array(TYPECODES[column], view)))
+    return view
+
+def _fsync_dir(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+class Archive(object):
+    def __init__(self, path, flush_count=60, flush_interval=60, clock=time.monotonic):
+        self.logger = logging.getLogger('.' + self.__class__.__name__)
+
+        self.path = path
+        self.flush_count = flush_count
+        self.flush_interval = flush_interval
+        self.clock = clock
+
+        os.makedirs(path, exist_ok=True)
+
+        # Samples not yet written, by day
+        self._pending = {}
+        self._pending_count = 0
+        self._last_flush = self.clock()
+
+        # Days already checked for torn writes
+        self._checked = set()
+
+        self._months = {}
+        self._lock = threading.RLock()
+
+    def _day_path(self, day):
+        return os.path.join(self.path, day)
+
+    def _month_path(self, month):
+        return os.path.join(self.path, month + '.gz')
+
+    def append(self, observation):
+        with self._lock:
+            day = _day(observation.timestamp)
+            columns = self._pending.get(day)
+            if columns is None:
+                columns = self._pending[day] = _new_columns()
+
+            columns['timestamp'].append(observation.timestamp)
+            for field in FIELDS:
+                value = getattr(observation, field)
+                columns[field].append(NAN if value is None else value)
+
+            self._pending_count += 1
+            if (self._pending_count >= self.flush_count or
+                    self.clock() - self._last_flush >= self.flush_interval):
+                self.flush()
+
+    def _repair(self, path):
+        # Cuts every column back to the length of the shortest
+        sizes = {}
+        for column in COLUMNS:
+            try:
+                sizes[column] = os.path.getsize(os.path.join(path, column))
+            except FileNotFoundError:
+                sizes[column] = 0
+
+        count = min(sizes[column] // array(TYPECODES[column]).itemsize for column in COLUMNS)
+        for column in COLUMNS:
+            size = count * array(TYPECODES[column]).itemsize
+            if sizes[column] != size:
+                self.logger.warning('Truncating torn write to {}'.format(
+                    os.path.join(path, column)))
+                with open(os.path.join(path, column), 'ab') as f:
+                    f.truncate(size)
+
+    def flush(self):
+        # Writes out pending samples, returns once they are on disk
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._pending_count = 0
+            self._last_flush = self.clock()
+
+            for day, columns in sorted(pending.items()):
+                path = self._day_path(day)
+                created = not os.path.isdir(path)
+                os.makedirs(path, exist_ok=True)
+
+                if day not in self._checked:
+                    self._repair(path)
+                    self._checked.add(day)
+
+                for column in COLUMNS:
+                    with open(os.path.join(path, column), 'ab') as f:
+                        _little_endian(columns[column]).tofile(f)
+                        f.flush()
+                        os.fsync(f.fileno())
+
+                if created:
+                    _fsync_dir(path)
+                    _fsync_dir(self.path)
+
+    def partitions(self):
+        # Returns the sorted names of the day and month partitions on disk
+        days, months = [], []
+        for name in os.listdir(self.path):
+            if name.endswith('.gz'):
+                months.append(name[:-3])
+            elif os.path.isdir(self._day_path(name)):
+                days.append(name)
+
+        return sorted(days), sorted(months)
+
+    def _read_day(self, day):
+        # Returns the columns of a day partition as typed memoryviews, or
+        # None if there are none, e.g. if it was just compacted
+        path = self._day_path(day)
+
+        columns = {}
+        try:
+            with self._lock:
+                if day not in self._checked:
+                    self._repair(path)
+                    self._checked.add(day)
+
+            for column in COLUMNS:
+                with open(os.path.join(path, column), 'rb') as f:
+                    if os.fstat(f.fileno()).st_size == 0:
+                        return None
+                    # The map outlives the file, and is closed with the last view
+                    buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                columns[column] = _typed_view(buffer, column)
+        except FileNotFoundError:
+            return None
+
+        # Columns may have grown between maps
+        count = min(len(view) for view in columns.values())
+        return {column: view[:count] for column, view in columns.items()}
+
+    def _read_month(self, month):
+        with self._lock:
+            columns = self._months.get(month)
+        if columns is not None:
+            return columns
+
+        with gzip.open(self._month_path(month), 'rb') as f:
+            data = f.read()
+
+        count, = MONTH_HEADER.unpack_from(data)
+        columns = {}
+        offset = MONTH_HEADER.size
+        for column in COLUMNS:
+            size = count * array(TYPECODES[column]).itemsize
+            columns[column] = _typed_view(memoryview(data)[offset:offset + size], column)
+            offset += size
+
+        with self._lock:
+            if len(self._months) >= MONTH_CACHE:
+                self._months.pop(next(iter(self._months)))
+            self._months[month] = columns
+
+        return columns
+
+    def segments(self, start=None, end=None):
+        # Returns the archived samples with start <= timestamp < end, as a
+        # list of (timestamps, columns) pairs like History.segments. Samples
+        # not yet flushed are included.
+        first = None if start is None else _day(start)
+        last = None if end is None else _day(end)
+
+        with self._lock:
+            days, months = self.partitions()
+            months = set(months)
+
+            # Pending samples are still being appended to, so they are copied;
+            # there are at most flush_count of them
+            pending = [{column: memoryview(array(values.typecode, values))
+                        for column, values in columns.items()}
+                       for _, columns in sorted(self._pending.items())]
+
+        sources = [(month, self._read_month) for month in months
+                   if (first is None or month >= first[:7]) and
+                      (last is None or month <= last[:7])]
+        sources.extend((day, self._read_day) for day in days
+                       if day[:7] not in months and
+                          (first is None or day >= first) and
+                          (last is None or day <= last))
+        sources.sort()
+
+        # Partitions are read outside the lock, so a slow read never holds
+        # up appends
+        blocks = [read(name) for name, read in sources] + pending
+
+        segments = []
+        for columns in blocks:
+            if not columns:
+                continue
+
+            timestamps = columns['timestamp']
+            a = 0 if start is None else bisect.bisect_left(timestamps, start)
+            b = len(timestamps) if end is None else bisect.bisect_left(timestamps, end)
+            if a < b:
+                segments.append((timestamps[a:b],
+                                 {field: columns[field][a:b] for field in FIELDS}))
+
+        return segments
+
+    def scan(self, start=None, end=None):
+        # Yields the same segments as segments(), a month at a time, so a
+        # scan over years only holds one month in memory
+        with self._lock:
+            days, months = self.partitions()
+            days.extend(self._pending)
+
+        for month in sorted(set(months) | {day[:7] for day in days}):
+            year, number = int(month[:4]), int(month[5:7])
+            first = calendar.timegm((year, number, 1, 0, 0, 0))
+            last = calendar.timegm((year + number // 12, number % 12 + 1, 1, 0, 0, 0))
+
+            if end is not None and first >= end:
+                break
+            if start is not None and last <= start:
+                continue
+
+            for segment in self.segments(first if start is None else max(first, start),
+                                         last if end is None else min(last, end)):
+                yield segment
+
+    def observations(self, start=None, end=None):
+        # Yields copies of the archived samples in a range, as Observations
+        for timestamps, columns in self.segments(start, end):
+            for i, timestamp in enumerate(timestamps):
+                values = (columns[field][i] for field in FIELDS)
+                yield Observation(timestamp, *(None if v != v else v for v in values))
+
+    def compact(self, now=None):
+        # Rolls the day partitions of every month before the current one
+        # into compressed monthly files, returns the months compacted
+        current = _day(time.time() if now is None else now)[:7]
+
+        with self._lock:
+            days, months = self.partitions()
+
+        by_month = {}
+        for day in days:
+            if day[:7] < current:
+                by_month.setdefault(day[:7], []).append(day)
+
+        for month, month_days in sorted(by_month.items()):
+            self._compact_month(month, month_days, month in months)
+
+        return sorted(by_month)
+
+    def _compact_month(self, month, days, existing):
+        blocks = []
+        if existing:
+            blocks.append(self._read_month(month))
+        blocks.extend(self._read_day(day) for day in days)
+        blocks = [block for block in blocks if block]
+
+        merged = _new_columns()
+        for block in blocks:
+            for column in COLUMNS:
+                merged[column].extend(block[column])
+
+        # Late days may interleave with the existing month, and days left
+        # behind by an interrupted compaction are already in it
+        if existing:
+            timestamps = merged['timestamp']
+            order = sorted(range(len(timestamps)), key=timestamps.__getitem__)
+
+            keep, seen, current = [], set(), None
+            for i in order:
+                if timestamps[i] != current:
+                    current, seen = timestamps[i], set()
+
+                row = tuple(None if v != v else v for v in (merged[f][i] for f in FIELDS))
+                if row not in seen:
+                    seen.add(row)
+                    keep.append(i)
+
+            if len(keep) < len(order):
+                self.logger.warning('Dropped {} samples of {} already in {}'.format(
+                    len(order) - len(keep), month, self._month_path(month)))
+
+            merged = {column: array(TYPECODES[column], (values[i] for i in keep))
+                      for column, values in merged.items()}
+
+        path = self._month_path(month)
+        temp = path + '.tmp'
+        with open(temp, 'wb') as raw:
+            with gzip.GzipFile(fileobj=raw, mode='wb') as f:
+                f.write(MONTH_HEADER.pack(len(merged['timestamp'])))
+                for column in COLUMNS:
+                    f.write(_little_endian(merged[column]).tobytes())
+            raw.flush()
+            os.fsync(raw.fileno())
+
+        with self._lock:
+            os.replace(temp, path)
+            _fsync_dir(self.path)
+            self._months.pop(month, None)
+
+            # From here on reads take the month file over its days
+            for day in days:
+                shutil.rmtree(self._day_path(day))
+                self._checked.discard(day)
+
+        self.logger.info('Compacted {} days of {} into {}'.format(len(days), month, path))
+
+    def close(self):
+        self.flush()
@@ -21,8 +21,12 @@
 # LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
+import json
 import logging
+import os
+import struct
 import time
+from collections import namedtuple
 
 
 # BME280 default address.
@@ -35,6 +39,54 @@ BME280_OSAMPLE_4 = 3
 BME280_OSAMPLE_8 = 4
 BME280_OSAMPLE_16 = 5
 
+# Power modes (ctrl_meas mode bits)
+BME280_SLEEP_MODE = 0
+BME280_FORCED_MODE = 1
+BME280_NORMAL_MODE = 3
+
+# Normal mode standby time between conversions (config t_sb bits)
+BME280_STANDBY_0_5 = 0  # 0.5 ms
+BME280_STANDBY_62_5 = 1
+BME280_STANDBY_125 = 2
+BME280_STANDBY_250 = 3
+BME280_STANDBY_500 = 4
+BME280_STANDBY_1000 = 5
+BME280_STANDBY_10 = 6
+BME280_STANDBY_20 = 7
+
+BME280_STANDBY_MS = {
+    0.5: BME280_STANDBY_0_5, 62.5: BME280_STANDBY_62_5,
+    125: BME280_STANDBY_125, 250: BME280_STANDBY_250,
+    500: BME280_STANDBY_500, 1000: BME280_STANDBY_1000,
+    10: BME280_STANDBY_10, 20: BME280_STANDBY_20,
+}
+
+# IIR filter coefficient (config filter bits)
+BME280_FILTER_OFF = 0
+BME280_FILTER_2 = 1
+BME280_FILTER_4 = 2
+BME280_FILTER_8 = 3
+BME280_FILTER_16 = 4
+
+BME280_FILTER_COEFFICIENTS = {
+    0: BME280_FILTER_OFF, 2: BME280_FILTER_2, 4: BME280_FILTER_4,
+    8: BME280_FILTER_8, 16: BME280_FILTER_16,
+}
+
+# Status register bits
+BME280_STATUS_MEASURING = 0x08
+BME280_STATUS_IM_UPDATE = 0x01
+
+# Compensation arithmetic. The integer modes follow the Bosch reference
+# code: int32 uses 32 bit routines throughout, int64 uses the higher
+# resolution 64 bit pressure routine.
+BME280_COMPENSATION_FLOAT = 'float'
+BME280_COMPENSATION_INT32 = 'int32'
+BME280_COMPENSATION_INT64 = 'int64'
+
+# Interval between status polls while waiting on a forced conversion
+BME280_POLL_INTERVAL = 0.0005
+
 # BME280 Registers
 
 BME280_REGISTER_DIG_T1 = 0x88  # Trimming parameter registers
@@ -64,16 +116,226 @@ BME280_REGISTER_VERSION = 0xD1
 BME280_REGISTER_SOFTRESET = 0xE0
 
 BME280_REGISTER_CONTROL_HUM = 0xF2
+BME280_REGISTER_STATUS = 0xF3
 BME280_REGISTER_CONTROL = 0xF4
 BME280_REGISTER_CONFIG = 0xF5
 BME280_REGISTER_PRESSURE_DATA = 0xF7
 BME280_REGISTER_TEMP_DATA = 0xFA
 BME280_REGISTER_HUMIDITY_DATA = 0xFD
 
+# Calibration blocks, 0x88..0xA1 and 0xE1..0xE7
+BME280_CALIB_BLOCK1_LEN = 26
+BME280_CALIB_BLOCK2_LEN = 7
+
+
+BME280Calibration = namedtuple('BME280Calibration', [
+    'dig_T1', 'dig_T2', 'dig_T3',
+    'dig_P1', 'dig_P2', 'dig_P3', 'dig_P4', 'dig_P5', 'dig_P6', 'dig_P7',
+    'dig_P8', 'dig_P9',
+    'dig_H1', 'dig_H2', 'dig_H3', 'dig_H4', 'dig_H5', 'dig_H6',
+])
+
+
+def parse_calibration(block1, block2):
+    """Builds a BME280Calibration from the two raw trimming blocks."""
+    block1 = bytes(bytearray(block1))
+    block2 = bytes(bytearray(block2))
+
+    t_p = struct.unpack_from('<HhhHhhhhhhhh', block1)
+    dig_H1 = block1[25]
+
+    dig_H2, dig_H3, e4, e5, e6, dig_H6 = struct.unpack('<hBbBbb', block2)
+    # H4 and H5 are 12 bit signed values sharing the nibbles of 0xE5
+    dig_H4 = (e4 << 4) | (e5 & 0x0F)
+    dig_H5 = (e6 << 4) | (e5 >> 4 & 0x0F)
+
+    return BME280Calibration(*(t_p + (dig_H1, dig_H2, dig_H3, dig_H4, dig_H5,
+                                      dig_H6)))
+
+
+def compensate_temperature(adc, cal):
+    """Compensates a raw temperature reading.
+
+    Returns (degrees celsius, t_fine), t_fine being the fine resolution
+    temperature the pressure and humidity compensation depends on.
+    """
+    # float in Python is double precision
+    UT = float(adc)
+    var1 = (UT / 16384.0 - cal.dig_T1 / 1024.0) * float(cal.dig_T2)
+    var2 = ((UT / 131072.0 - cal.dig_T1 / 8192.0) * (
+    UT / 131072.0 - cal.dig_T1 / 8192.0)) * float(cal.dig_T3)
+    t_fine = int(var1 + var2)
+    temp = (var1 + var2) / 5120.0
+    return temp, t_fine
+
+
+def compensate_pressure(adc, t_fine, cal):
+    """Compensates a raw pressure reading, returning Pascals."""
+    var1 = t_fine / 2.0 - 64000.0
+    var2 = var1 * var1 * cal.dig_P6 / 32768.0
+    var2 = var2 + var1 * cal.dig_P5 * 2.0
+    var2 = var2 / 4.0 + cal.dig_P4 * 65536.0
+    var1 = (
+           cal.dig_P3 * var1 * var1 / 524288.0 + cal.dig_P2 * var1) / 524288.0
+    var1 = (1.0 + var1 / 32768.0) * cal.dig_P1
+    if var1 == 0:
+        return 0
+    p = 1048576.0 - adc
+    p = ((p - var2 / 4096.0) * 6250.0) / var1
+    var1 = cal.dig_P9 * p * p / 2147483648.0
+    var2 = p * cal.dig_P8 / 32768.0
+    p = p + (var1 + var2 + cal.dig_P7) / 16.0
+    return p
+
+
+def compensate_humidity(adc, t_fine, cal):
+    """Compensates a raw humidity reading, returning %RH."""
+    h = t_fine - 76800.0
+    h = (adc - (cal.dig_H4 * 64.0 + cal.dig_H5 / 16384.8 * h)) * (
+    cal.dig_H2 / 65536.0 * (1.0 + cal.dig_H6 / 67108864.0 * h * (
+    1.0 + cal.dig_H3 / 67108864.0 * h)))
+    h = h * (1.0 - cal.dig_H1 * h / 524288.0)
+    if h > 100:
+        h = 100
+    elif h < 0:
+        h = 0
+    return h
+
+
+def _s32(value):
+    """Wraps an integer to a signed 32 bit value, as C would."""
+    value &= 0xFFFFFFFF
+    return value - 0x100000000 if value & 0x80000000 else value
+
+
+def _u32(value):
+    return value & 0xFFFFFFFF
+
+
+def _cdiv(a, b):
+    """Integer division truncating towards zero, as C would."""
+    q = abs(a) // abs(b)
+    return q if (a < 0) == (b < 0) else -q
+
+
+def compensate_temperature_int32(adc, cal):
+    """Fixed point temperature compensation.
+
+    Returns (temperature in 0.01 degrees celsius, t_fine).
+    """
+    var1 = (((adc >> 3) - (cal.dig_T1 << 1)) * cal.dig_T2) >> 11
+    var2 = (((((adc >> 4) - cal.dig_T1) * ((adc >> 4) - cal.dig_T1)) >> 12) *
+            cal.dig_T3) >> 14
+    t_fine = _s32(var1 + var2)
+    return (t_fine * 5 + 128) >> 8, t_fine
+
+
+def compensate_pressure_int32(adc, t_fine, cal):
+    """32 bit fixed point pressure compensation, returning Pascals."""
+    var1 = (t_fine >> 1) - 64000
+    var2 = (((var1 >> 2) * (var1 >> 2)) >> 11) * cal.dig_P6
+    var2 = var2 + ((var1 * cal.dig_P5) << 1)
+    var2 = (var2 >> 2) + (cal.dig_P4 << 16)
+    var1 = (((cal.dig_P3 * (((var1 >> 2) * (var1 >> 2)) >> 13)) >> 3) +
+            ((cal.dig_P2 * var1) >> 1)) >> 18
+    var1 = ((32768 + var1) * cal.dig_P1) >> 15
+    if var1 == 0:
+        return 0
+    p = _u32(_u32(1048576 - adc - (var2 >> 12)) * 3125)
+    if p < 0x80000000:
+        p = _u32(p << 1) // _u32(var1)
+    else:
+        p = (p // _u32(var1)) * 2
+    var1 = (cal.dig_P9 * _s32(_u32((p >> 3) * (p >> 3)) >> 13)) >> 12
+    var2 = (_s32(p >> 2) * cal.dig_P8) >> 13
+    return _u32(_s32(p) + ((var1 + var2 + cal.dig_P7) >> 4))
+
+
+def compensate_pressure_int64(adc, t_fine, cal):
+    """64 bit fixed point pressure compensation, returning Pascals as a
+    Q24.8 value (divide by 256)."""
+    var1 = t_fine - 128000
+    var2 = var1 * var1 * cal.dig_P6
+    var2 = var2 + ((var1 * cal.dig_P5) << 17)
+    var2 = var2 + (cal.dig_P4 << 35)
+    var1 = ((var1 * var1 * cal.dig_P3) >> 8) + ((var1 * cal.dig_P2) << 12)
+    var1 = (((1 << 47) + var1) * cal.dig_P1) >> 33
+    if var1 == 0:
+        return 0
+    p = 1048576 - adc
+    p = _cdiv(((p << 31) - var2) * 3125, var1)
+    var1 = (cal.dig_P9 * (p >> 13) * (p >> 13)) >> 25
+    var2 = (cal.dig_P8 * p) >> 19
+    return _u32(((p + var1 + var2) >> 8) + (cal.dig_P7 << 4))
+
+
+def compensate_humidity_int32(adc, t_fine, cal):
+    """Fixed point humidity compensation, returning %RH as a Q22.10 value
+    (divide by 1024)."""
+    v_x1 = t_fine - 76800
+    v_x1 = (((((adc << 14) - (cal.dig_H4 << 20) - (cal.dig_H5 * v_x1)) +
+              16384) >> 15) *
+            (((((((v_x1 * cal.dig_H6) >> 10) *
+                 (((v_x1 * cal.dig_H3) >> 11) + 32768)) >> 10) +
+               2097152) * cal.dig_H2 + 8192) >> 14))
+    v_x1 = v_x1 - (((((v_x1 >> 15) * (v_x1 >> 15)) >> 7) * cal.dig_H1) >> 4)
+    v_x1 = 0 if v_x1 < 0 else v_x1
+    v_x1 = 419430400 if v_x1 > 419430400 else v_x1
+    return v_x1 >> 12
+
+
+def compensate_batch(raw_t, raw_p, raw_h, calibration):
+    """Compensates arrays of raw readings in one pass.
+
+    Takes array-likes of raw temperature, pressure and humidity ADC values
+    and returns NumPy arrays of degrees celsius, Pascals and %RH. The
+    operations are the same, in the same order, as the scalar functions
+    above, so results match them exactly.
+    """
+    import numpy as np
+
+    cal = calibration
+    UT = np.asarray(raw_t, dtype=np.float64)
+    adc_p = np.asarray(raw_p, dtype=np.float64)
+    adc_h = np.asarray(raw_h, dtype=np.float64)
+
+    # Temperature
+    var1 = (UT / 16384.0 - cal.dig_T1 / 1024.0) * float(cal.dig_T2)
+    var2 = UT / 131072.0 - cal.dig_T1 / 8192.0
+    var2 = (var2 * var2) * float(cal.dig_T3)
+    t_sum = var1 + var2
+    t_fine = np.trunc(t_sum)
+    temp = t_sum / 5120.0
+
+    # Pressure
+    var1 = t_fine / 2.0 - 64000.0
+    var2 = var1 * var1 * cal.dig_P6 / 32768.0
+    var2 = var2 + var1 * cal.dig_P5 * 2.0
+    var2 = var2 / 4.0 + cal.dig_P4 * 65536.0
+    var1 = (cal.dig_P3 * var1 * var1 / 524288.0 + cal.dig_P2 * var1) / 524288.0
+    var1 = (1.0 + var1 / 32768.0) * cal.dig_P1
+    with np.errstate(divide='ignore', invalid='ignore'):
+        p = 1048576.0 - adc_p
+        p = ((p - var2 / 4096.0) * 6250.0) / var1
+        var2 = p * cal.dig_P8 / 32768.0
+        p = p + (cal.dig_P9 * p * p / 2147483648.0 + var2 + cal.dig_P7) / 16.0
+    pressure = np.where(var1 == 0, 0.0, p)
+
+    # Humidity
+    h = t_fine - 76800.0
+    h = (adc_h - (cal.dig_H4 * 64.0 + cal.dig_H5 / 16384.8 * h)) * (
+        cal.dig_H2 / 65536.0 * (1.0 + cal.dig_H6 / 67108864.0 * h * (
+            1.0 + cal.dig_H3 / 67108864.0 * h)))
+    h = h * (1.0 - cal.dig_H1 * h / 524288.0)
+    humidity = np.clip(h, 0.0, 100.0)
+
+    return temp, pressure, humidity
+
 
 class BME280(object):
     def __init__(self, mode=BME280_OSAMPLE_1, address=BME280_I2CADDR, i2c=None,
-                 **kwargs):
+                 calibration_cache=None,
+                 compensation=BME280_COMPENSATION_FLOAT, **kwargs):
         self._logger = logging.getLogger('Adafruit_BMP.BMP085')
         # Check that mode is valid.
         if mode not in [BME280_OSAMPLE_1, BME280_OSAMPLE_2, BME280_OSAMPLE_4,
@@ -81,137 +343,244 @@ class BME280(object):
             raise ValueError(
                 'Unexpected mode value {0}.  Set mode to one of BME280_ULTRALOWPOWER, BME280_STANDARD, BME280_HIGHRES, or BME280_ULTRAHIGHRES'.format(mode))
         self._mode = mode
-        # Create I2C device.
+        if compensation not in [BME280_COMPENSATION_FLOAT,
+                                BME280_COMPENSATION_INT32,
+                                BME280_COMPENSATION_INT64]:
+            raise ValueError(
+                'Unexpected compensation {0}.  Set compensation to one of BME280_COMPENSATION_FLOAT, BME280_COMPENSATION_INT32 or BME280_COMPENSATION_INT64'.format(compensation))
+        self._compensation = compensation
+        # Datasheet typical and maximum conversion times for T, P and H all
+        # oversampled by the same ratio, in seconds
+        osr = 1 << (mode - 1)
+        self._typical_measurement_time = (1.0 + 2.0 * osr * 3 + 0.5 * 2) / 1000.0
+        self._max_measurement_time = (1.25 + 2.3 * osr * 3 + 0.575 * 2) / 1000.0
+        self._power_mode = BME280_FORCED_MODE
+        self._measurement_started = None
+        self._address = address
+        self._busnum = kwargs.get('busnum', -1)
+        self._calibration_cache = calibration_cache
+        # Create I2C device, on the board's bus unless another is given
+        from weatherstation.bus import I2CBus, TimedDevice
         if i2c is None:
-            from Adafruit_I2C import Adafruit_I2C as I2C
-            i2c = I2C
-        #self._device = i2c.get_i2c_device(address, **kwargs)
-        self._device = I2C(address, **kwargs)
-	# Load calibration values.
+            i2c = I2CBus(**kwargs)
+        self._device = TimedDevice(i2c.device(address), 'bme280')
+        # Load calibration values.
         self._load_calibration()
         self._device.write8(BME280_REGISTER_CONTROL, 0x3F)
         self.t_fine = 0.0
+        # Raw (temperature, pressure, humidity) from the last burst read
+        self._raw = None
+
+    def _cache_path(self, chip_id):
+        return os.path.join(
+            self._calibration_cache,
+            'bme280-{}-{:02x}-{:02x}.json'.format(
+                self._busnum, self._address, chip_id))
+
+    def _read_cached_calibration(self, path):
+        try:
+            with open(path) as f:
+                return BME280Calibration(**json.load(f))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, TypeError) as e:
+            self._logger.warning(
+                'Ignoring unreadable calibration cache {}: {}'.format(path, e))
+            return None
+
+    def _write_cached_calibration(self, path, calibration):
+        tmp_path = path + '.tmp'
+        try:
+            os.makedirs(self._calibration_cache, exist_ok=True)
+            with open(tmp_path, 'w') as f:
+                json.dump(calibration._asdict(), f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            self._logger.warning(
+                'Unable to write calibration cache {}: {}'.format(path, e))
+
+    def _read_calibration(self):
+        """Reads both trimming parameter blocks, one transaction each."""
+        block1 = self._device.readList(BME280_REGISTER_DIG_T1,
+                                       BME280_CALIB_BLOCK1_LEN)
+        block2 = self._device.readList(BME280_REGISTER_DIG_H2,
+                                       BME280_CALIB_BLOCK2_LEN)
+        return parse_calibration(block1, block2)
 
     def _load_calibration(self):
+        # Calibration is fused at the factory, so a cached copy is only
+        # revalidated against the chip ID for this bus and address
+        if self._calibration_cache is None:
+            self.calibration = self._read_calibration()
+            return
+
+        chip_id = self._device.readU8(BME280_REGISTER_CHIPID)
+        path = self._cache_path(chip_id)
+
+        calibration = self._read_cached_calibration(path)
+        if calibration is None:
+            calibration = self._read_calibration()
+            self._write_cached_calibration(path, calibration)
+
+        self.calibration = calibration
+
+    def set_normal_mode(self, standby=BME280_STANDBY_1000,
+                        iir_filter=BME280_FILTER_OFF):
+        """Lets the sensor convert continuously, sleeping `standby` between
+        conversions and smoothing pressure and temperature with the IIR
+        filter. Reads then return the latest completed conversion."""
+        # config is only guaranteed to be written while in sleep mode
+        self._device.write8(BME280_REGISTER_CONTROL, BME280_SLEEP_MODE)
+        self._device.write8(BME280_REGISTER_CONFIG,
+                            (standby & 0x07) << 5 | (iir_filter & 0x07) << 2)
+        self._device.write8(BME280_REGISTER_CONTROL_HUM, self._mode)
+        self._device.write8(BME280_REGISTER_CONTROL,
+                            self._mode << 5 | self._mode << 2 | BME280_NORMAL_MODE)
+        self._power_mode = BME280_NORMAL_MODE
+        self._measurement_started = None
+
+    def set_forced_mode(self):
+        """Returns the sensor to sleep, converting only on request."""
+        self._device.write8(BME280_REGISTER_CONTROL, BME280_SLEEP_MODE)
+        self._power_mode = BME280_FORCED_MODE
+        self._measurement_started = None
+
+    def start_measurement(self):
+        """Triggers a forced conversion without waiting for it to finish.
+
+        Returns the worst case time in seconds until the result is ready. In
+        normal mode the sensor is already converting, and this returns 0.
+        """
+        if self._power_mode == BME280_NORMAL_MODE:
+            return 0
+
+        self._device.write8(BME280_REGISTER_CONTROL_HUM, self._mode)
+        self._device.write8(BME280_REGISTER_CONTROL,
+                            self._mode << 5 | self._mode << 2 | BME280_FORCED_MODE)
+        self._measurement_started = time.monotonic()
+        return self._max_measurement_time
+
+    def measurement_ready(self):
+        """Polls the status register for the end of the current conversion."""
+        if self._power_mode == BME280_NORMAL_MODE:
+            return True
 
-        self.dig_T1 = self._device.readU16(BME280_REGISTER_DIG_T1)
-        self.dig_T2 = self._device.readS16(BME280_REGISTER_DIG_T2)
-        self.dig_T3 = self._device.readS16(BME280_REGISTER_DIG_T3)
-
-        self.dig_P1 = self._device.readU16(BME280_REGISTER_DIG_P1)
-        self.dig_P2 = self._device.readS16(BME280_REGISTER_DIG_P2)
-        self.dig_P3 = self._device.readS16(BME280_REGISTER_DIG_P3)
-        self.dig_P4 = self._device.readS16(BME280_REGISTER_DIG_P4)
-        self.dig_P5 = self._device.readS16(BME280_REGISTER_DIG_P5)
-        self.dig_P6 = self._device.readS16(BME280_REGISTER_DIG_P6)
-        self.dig_P7 = self._device.readS16(BME280_REGISTER_DIG_P7)
-        self.dig_P8 = self._device.readS16(BME280_REGISTER_DIG_P8)
-        self.dig_P9 = self._device.readS16(BME280_REGISTER_DIG_P9)
-
-        self.dig_H1 = self._device.readU8(BME280_REGISTER_DIG_H1)
-        self.dig_H2 = self._device.readS16(BME280_REGISTER_DIG_H2)
-        self.dig_H3 = self._device.readU8(BME280_REGISTER_DIG_H3)
-        self.dig_H6 = self._device.readS8(BME280_REGISTER_DIG_H7)
-
-        h4 = self._device.readS8(BME280_REGISTER_DIG_H4)
-        h4 = (h4 << 24) >> 20
-        self.dig_H4 = h4 | (self._device.readU8(BME280_REGISTER_DIG_H5) & 0x0F)
-
-        h5 = self._device.readS8(BME280_REGISTER_DIG_H6)
-        h5 = (h5 << 24) >> 20
-        self.dig_H5 = h5 | (
-        self._device.readU8(BME280_REGISTER_DIG_H5) >> 4 & 0x0F)
-
-        '''
-        print '0xE4 = {0:2x}'.format (self._device.readU8 (BME280_REGISTER_DIG_H4))
-        print '0xE5 = {0:2x}'.format (self._device.readU8 (BME280_REGISTER_DIG_H5))
-        print '0xE6 = {0:2x}'.format (self._device.readU8 (BME280_REGISTER_DIG_H6))
-
-        print 'dig_H1 = {0:d}'.format (self.dig_H1)
-        print 'dig_H2 = {0:d}'.format (self.dig_H2)
-        print 'dig_H3 = {0:d}'.format (self.dig_H3)
-        print 'dig_H4 = {0:d}'.format (self.dig_H4)
-        print 'dig_H5 = {0:d}'.format (self.dig_H5)
-        print 'dig_H6 = {0:d}'.format (self.dig_H6)
-        '''
+        status = self._device.readU8(BME280_REGISTER_STATUS)
+        return not status & BME280_STATUS_MEASURING
+
+    def wait_for_measurement(self):
+        """Blocks until a conversion started by start_measurement() is done.
+
+        Sleeps through the typical conversion time, then polls the status
+        register, giving up at the datasheet maximum.
+        """
+        if self._measurement_started is None:
+            return
+
+        started = self._measurement_started
+        remaining = started + self._typical_measurement_time - time.monotonic()
+        if remaining > 0:
+            time.sleep(remaining)
+
+        deadline = started + self._max_measurement_time
+        while not self.measurement_ready() and time.monotonic() < deadline:
+            time.sleep(BME280_POLL_INTERVAL)
+
+        self._measurement_started = None
+
+    def read_measurement_raw(self):
+        """Collects the raw (temperature, pressure, humidity) from the data
+        registers in a single burst, waiting for a pending conversion."""
+        self.wait_for_measurement()
+
+        # 0xF7..0xFE: press_msb, press_lsb, press_xlsb, temp_msb, temp_lsb,
+        # temp_xlsb, hum_msb, hum_lsb
+        data = self._device.readList(BME280_REGISTER_PRESSURE_DATA, 8)
+        raw_p = ((data[0] << 16) | (data[1] << 8) | data[2]) >> 4
+        raw_t = ((data[3] << 16) | (data[4] << 8) | data[5]) >> 4
+        raw_h = (data[6] << 8) | data[7]
+
+        self._raw = (raw_t, raw_p, raw_h)
+        return self._raw
+
+    def read_measurement(self):
+        """Collects compensated temperature (degrees celsius), pressure
+        (Pascals) and humidity (%RH) for the pending or latest conversion."""
+        raw_t, raw_p, raw_h = self.read_measurement_raw()
+        temp = self._compensate_temperature(raw_t)
+        return (temp,
+                self._compensate_pressure(raw_p),
+                self._compensate_humidity(raw_h))
+
+    def read_all_raw(self):
+        """Triggers a conversion and reads the raw temperature, pressure and
+        humidity in a single burst, so all three come from the same sample.
+
+        Returns a (temperature, pressure, humidity) tuple of raw ADC values.
+        """
+        self.start_measurement()
+        return self.read_measurement_raw()
+
+    def read_all(self):
+        """Gets compensated temperature (degrees celsius), pressure (Pascals)
+        and humidity (%RH) from a single conversion."""
+        self.start_measurement()
+        return self.read_measurement()
 
     def read_raw_temp(self):
         """Reads the raw (uncompensated) temperature from the sensor."""
-        meas = self._mode
-        self._device.write8(BME280_REGISTER_CONTROL_HUM, meas)
-        meas = self._mode << 5 | self._mode << 2 | 1
-        self._device.write8(BME280_REGISTER_CONTROL, meas)
-        sleep_time = 0.00125 + 0.0023 * (1 << self._mode)
-        sleep_time = sleep_time + 0.0023 * (1 << self._mode) + 0.000575
-        sleep_time = sleep_time + 0.0023 * (1 << self._mode) + 0.000575
-        time.sleep(sleep_time)  # Wait the required time
-        msb = self._device.readU8(BME280_REGISTER_TEMP_DATA)
-        lsb = self._device.readU8(BME280_REGISTER_TEMP_DATA + 1)
-        xlsb = self._device.readU8(BME280_REGISTER_TEMP_DATA + 2)
-        raw = ((msb << 16) | (lsb << 8) | xlsb) >> 4
-        return raw
+        return self.read_all_raw()[0]
 
     def read_raw_pressure(self):
         """Reads the raw (uncompensated) pressure level from the sensor."""
         """Assumes that the temperature has already been read """
         """i.e. that enough delay has been provided"""
-        msb = self._device.readU8(BME280_REGISTER_PRESSURE_DATA)
-        lsb = self._device.readU8(BME280_REGISTER_PRESSURE_DATA + 1)
-        xlsb = self._device.readU8(BME280_REGISTER_PRESSURE_DATA + 2)
-        raw = ((msb << 16) | (lsb << 8) | xlsb) >> 4
-        return raw
+        if self._raw is None:
+            self.read_all_raw()
+        return self._raw[1]
 
     def read_raw_humidity(self):
         """Assumes that the temperature has already been read """
         """i.e. that enough delay has been provided"""
-        msb = self._device.readU8(BME280_REGISTER_HUMIDITY_DATA)
-        lsb = self._device.readU8(BME280_REGISTER_HUMIDITY_DATA + 1)
-        raw = (msb << 8) | lsb
-        return raw
+        if self._raw is None:
+            self.read_all_raw()
+        return self._raw[2]
+
+    def _compensate_temperature(self, adc):
+        if self._compensation == BME280_COMPENSATION_FLOAT:
+            temp, self.t_fine = compensate_temperature(adc, self.calibration)
+            return temp
+
+        temp, self.t_fine = compensate_temperature_int32(adc, self.calibration)
+        return temp / 100.0
+
+    def _compensate_pressure(self, adc):
+        if self._compensation == BME280_COMPENSATION_INT64:
+            return compensate_pressure_int64(
+                adc, self.t_fine, self.calibration) / 256.0
+        elif self._compensation == BME280_COMPENSATION_INT32:
+            return float(compensate_pressure_int32(
+                adc, self.t_fine, self.calibration))
+
+        return compensate_pressure(adc, self.t_fine, self.calibration)
+
+    def _compensate_humidity(self, adc):
+        if self._compensation == BME280_COMPENSATION_FLOAT:
+            return compensate_humidity(adc, self.t_fine, self.calibration)
+
+        return compensate_humidity_int32(
+            adc, self.t_fine, self.calibration) / 1024.0
 
     def read_temperature(self):
         """Gets the compensated temperature in degrees celsius."""
-        # float in Python is double precision
-        UT = float(self.read_raw_temp())
-        var1 = (UT / 16384.0 - self.dig_T1 / 1024.0) * float(self.dig_T2)
-        var2 = ((UT / 131072.0 - self.dig_T1 / 8192.0) * (
-        UT / 131072.0 - self.dig_T1 / 8192.0)) * float(self.dig_T3)
-        self.t_fine = int(var1 + var2)
-        temp = (var1 + var2) / 5120.0
-        return temp
+        return self._compensate_temperature(self.read_raw_temp())
 
     def read_pressure(self):
         """Gets the compensated pressure in Pascals."""
-        adc = self.read_raw_pressure()
-        var1 = self.t_fine / 2.0 - 64000.0
-        var2 = var1 * var1 * self.dig_P6 / 32768.0
-        var2 = var2 + var1 * self.dig_P5 * 2.0
-        var2 = var2 / 4.0 + self.dig_P4 * 65536.0
-        var1 = (
-               self.dig_P3 * var1 * var1 / 524288.0 + self.dig_P2 * var1) / 524288.0
-        var1 = (1.0 + var1 / 32768.0) * self.dig_P1
-        if var1 == 0:
-            return 0
-        p = 1048576.0 - adc
-        p = ((p - var2 / 4096.0) * 6250.0) / var1
-        var1 = self.dig_P9 * p * p / 2147483648.0
-        var2 = p * self.dig_P8 / 32768.0
-        p = p + (var1 + var2 + self.dig_P7) / 16.0
-        return p
+        return self._compensate_pressure(self.read_raw_pressure())
 
     def read_humidity(self):
-        adc = self.read_raw_humidity()
-        # print 'Raw humidity = {0:d}'.format (adc)
-        h = self.t_fine - 76800.0
-        h = (adc - (self.dig_H4 * 64.0 + self.dig_H5 / 16384.8 * h)) * (
-        self.dig_H2 / 65536.0 * (1.0 + self.dig_H6 / 67108864.0 * h * (
-        1.0 + self.dig_H3 / 67108864.0 * h)))
-        h = h * (1.0 - self.dig_H1 * h / 524288.0)
-        if h > 100:
-            h = 100
-        elif h < 0:
-            h = 0
-        return h
+        return self._compensate_humidity(self.read_raw_humidity())
 
 if __name__ == "__main__":
 	b = BME280()
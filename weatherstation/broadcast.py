@@ -0,0 +1,162 @@
+# Copyright (c) 2016 Joseph Kogut
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Server-sent events broadcast of each new observation.
+#
+# publish() serializes an event once and hands the same bytes to every
+# subscriber. Each subscriber has a small bounded buffer; one that falls
+# behind by more than max_buffered events is dropped, and its stream ends,
+# rather than holding memory or slowing down the others. Clients reconnect on
+# their own, see the retry field.
+#
+# Streams come in two flavours: events() blocks a thread per client, for
+# Flask's server, and events_async() runs on an asyncio event loop, which is
+# what lets the asyncio runtime hold hundreds of clients.
+
+import asyncio
+import collections
+import json
+import logging
+import threading
+
+# Milliseconds clients wait before reconnecting
+RETRY = 5000
+
+# Seconds between comments sent to idle streams, which also finds clients
+# that went away
+HEARTBEAT = 15
+
+HEARTBEAT_EVENT = b': heartbeat\n\n'
+
+class Subscription(object):
+    def __init__(self, max_buffered, notify):
+        self.max_buffered = max_buffered
+        self.notify = notify
+        self.dropped = False
+
+        self._events = collections.deque()
+
+    def push(self, event):
+        if len(self._events) >= self.max_buffered:
+            self.dropped = True
+        else:
+            self._events.append(event)
+
+        self.notify()
+
+    def pop_all(self):
+        events = []
+        while self._events:
+            events.append(self._events.popleft())
+
+        return events
+
+class Broadcaster(object):
+    def __init__(self, max_buffered=16, event='observation'):
+        self.logger = logging.getLogger('.' + self.__class__.__name__)
+
+        self.max_buffered = max_buffered
+        self.event = event
+
+        self.subscriptions = set()
+        self.dropped = 0
+
+        # The latest event, sent to new subscribers straight away
+        self.last = None
+
+        self._lock = threading.Lock()
+
+    def publish(self, id, data):
+        # Sends data, anything json can serialize, to every subscriber
+        event = 'id: {}\nevent: {}\ndata: {}\n\n'.format(
+            id, self.event, json.dumps(data, separators=(',', ':'))).encode('UTF-8')
+
+        with self._lock:
+            self.last = event
+            subscriptions = list(self.subscriptions)
+
+        for subscription in subscriptions:
+            subscription.push(event)
+
+            if subscription.dropped:
+                self.unsubscribe(subscription)
+
+    def subscribe(self, notify):
+        # notify is called, from the publishing thread, after each event
+        subscription = Subscription(self.max_buffered, notify)
+
+        with self._lock:
+            self.subscriptions.add(subscription)
+            if self.last is not None:
+                subscription.push(self.last)
+
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            if subscription not in self.subscriptions:
+                return
+
+            self.subscriptions.discard(subscription)
+            if subscription.dropped:
+                self.dropped += 1
+                self.logger.info('Dropped a slow event stream client')
+
+    def events(self):
+        # Yields the stream for one client, blocking between events
+        wake = threading.Event()
+        subscription = self.subscribe(wake.set)
+
+        try:
+            yield 'retry: {}\n\n'.format(RETRY).encode()
+
+            while not subscription.dropped:
+                # Cleared first, so an event published meanwhile sets it again
+                wake.clear()
+
+                events = subscription.pop_all()
+                if events:
+                    yield b''.join(events)
+                elif not wake.wait(HEARTBEAT):
+                    yield HEARTBEAT_EVENT
+        finally:
+            self.unsubscribe(subscription)
+
+    async def events_async(self):
+        loop = asyncio.get_event_loop()
+        wake = asyncio.Event()
+        subscription = self.subscribe(lambda: loop.call_soon_threadsafe(wake.set))
+
+        try:
+            yield 'retry: {}\n\n'.format(RETRY).encode()
+
+            while not subscription.dropped:
+                wake.clear()
+
+                events = subscription.pop_all()
+                if events:
+                    yield b''.join(events)
+                else:
+                    try:
+                        await asyncio.wait_for(wake.wait(), HEARTBEAT)
+                    except asyncio.TimeoutError:
+                        yield HEARTBEAT_EVENT
+        finally:
+            self.unsubscribe(subscription)
@@ -0,0 +1,91 @@
+# Copyright (c) 2016 Joseph Kogut
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Hardware access for the sensors and controllers.
+#
+# Drivers never open hardware themselves. They take an I2C bus, which hands
+# out a device per address, or a GPIO bank, which hands out pins, so the
+# board can be swapped for the simulation in weatherstation.sim.
+#
+# An I2C device provides readU8(reg), readU16(reg, little_endian=True),
+# readList(reg, length) and write8(reg, value), as Adafruit_I2C does. A pin
+# provides read(), write(value) and close(), as periphery.GPIO does.
+#
+# Drivers wrap their devices in TimedDevice, which times every transaction.
+
+import time
+
+from weatherstation import metrics
+
+I2C_SECONDS = metrics.histogram('i2c_transaction_seconds',
+                                'Time per I2C transaction, by device', ['device'])
+
+class I2CBus(object):
+    # Chips on this bus are real, see SimI2CBus
+    simulated = False
+
+    def __init__(self, busnum=-1, debug=False):
+        # busnum: -1 picks the board's default bus
+        self.busnum = busnum
+        self.debug = debug
+
+    def device(self, address):
+        from Adafruit_I2C import Adafruit_I2C
+        return Adafruit_I2C(address, busnum=self.busnum, debug=self.debug)
+
+class GPIOBank(object):
+    def pin(self, number, direction):
+        from periphery import GPIO
+        return GPIO(number, direction)
+
+class TimedDevice(object):
+    def __init__(self, device, name):
+        # name: the device label for I2C_SECONDS
+        self.device = device
+        self._seconds = I2C_SECONDS.labels(name)
+
+    def readList(self, reg, length):
+        started = time.perf_counter()
+        try:
+            return self.device.readList(reg, length)
+        finally:
+            self._seconds.observe(time.perf_counter() - started)
+
+    def readU8(self, reg):
+        started = time.perf_counter()
+        try:
+            return self.device.readU8(reg)
+        finally:
+            self._seconds.observe(time.perf_counter() - started)
+
+    def readU16(self, reg, little_endian=True):
+        started = time.perf_counter()
+        try:
+            return self.device.readU16(reg, little_endian)
+        finally:
+            self._seconds.observe(time.perf_counter() - started)
+
+    def write8(self, reg, value):
+        started = time.perf_counter()
+        try:
+            return self.device.write8(reg, value)
+        finally:
+            self._seconds.observe(time.perf_counter() - started)
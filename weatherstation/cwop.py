@@ -0,0 +1,101 @@
+# Copyright (c) 2016 Joseph Kogut
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Publishes observations to the Citizen Weather Observer Program.
+#
+# Reports are APRS weather packets, sent to an APRS-IS server the way CWOP
+# asks for: connect, log in, send one packet and disconnect. CWOP wants at
+# most one report every five minutes and has no use for old data, so only
+# the newest observation is sent, and none sooner than min_interval seconds
+# after the last.
+
+import socket
+import time
+
+from weatherstation import units
+from weatherstation.publish import Publisher, PublishError
+
+def _position(latitude, longitude):
+    # APRS position, DDMM.mmN/DDDMM.mmW
+    def dm(value, width, hemispheres):
+        degrees, minutes = divmod(round(abs(value) * 60, 2), 60)
+        return '{:0{}d}{:05.2f}{}'.format(int(degrees), width, minutes,
+                                          hemispheres[value < 0])
+
+    return '{}/{}'.format(dm(latitude, 2, 'NS'), dm(longitude, 3, 'EW'))
+
+class CWOPPublisher(Publisher):
+    name = 'cwop'
+    realtime = True
+    software = 'weatherstation'
+
+    def __init__(self, callsign, latitude, longitude, passcode='-1', host='cwop.aprs.net',
+                 port=14580, min_interval=300, timeout=10, clock=time.monotonic):
+        self.callsign = callsign.upper()
+        self.position = _position(latitude, longitude)
+        self.passcode = passcode
+        self.host = host
+        self.port = port
+        self.min_interval = min_interval
+        self.timeout = timeout
+        self.clock = clock
+
+        self._last_sent = None
+
+    def packet(self, observation):
+        # Complete weather report with timestamp and position. Wind is unknown.
+        weather = '.../...g...t{:03d}'.format(int(round(units.DEGC_TO_DEGF(observation.tempc))))
+
+        if observation.humidity_pct is not None:
+            weather += 'h{:02d}'.format(int(round(observation.humidity_pct)) % 100)
+        if observation.barom_kPa is not None:
+            weather += 'b{:05d}'.format(int(round(observation.barom_kPa * 100)))
+
+        return '{}>APRS,TCPIP*:@{}z{}_{}'.format(
+            self.callsign, time.strftime('%d%H%M', time.gmtime(observation.timestamp)),
+            self.position, weather)
+
+    def _send(self, packet):
+        with socket.create_connection((self.host, self.port), self.timeout) as sock:
+            reader = sock.makefile('r', encoding='latin-1', newline='\n')
+
+            # Server banner
+            if not reader.readline():
+                raise PublishError('Connection closed by server')
+
+            sock.sendall('user {} pass {} vers {} 1.0\r\n'.format(
+                self.callsign, self.passcode, self.software).encode('latin-1'))
+
+            while True:
+                line = reader.readline()
+                if not line:
+                    raise PublishError('Connection closed by server')
+                if line.startswith('# logresp'):
+                    break
+
+            sock.sendall((packet + '\r\n').encode('latin-1'))
+
+    def publish(self, observations):
+        now = self.clock()
+        if self._last_sent is not None and now - self._last_sent < self.min_interval:
+            return
+
+        self._send(self.packet(observations[-1]))
+        self._last_sent = now
@@ -0,0 +1,197 @@
+# Copyright (c) 2016 Joseph Kogut
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Streaming filters for sensor readings, between the drivers and the sinks.
+#
+# Each field of an observation goes through its own chain: a median over
+# the last few samples drops single sample spikes, an exponential moving
+# average or a one dimensional Kalman filter smooths what is left, and a
+# window accumulates the smoothed values until the next upload takes their
+# mean. So each upload reports every sample since the one before, rather
+# than whichever one happened to be current.
+#
+# Every buffer is allocated up front and has a fixed size, so filtering a
+# sample never grows or allocates a container.
+
+import math
+from array import array
+
+from weatherstation.history import FIELDS
+from weatherstation.observation import Observation
+
+SMOOTHING = ('none', 'ema', 'kalman')
+
+class Median(object):
+    def __init__(self, size=5):
+        # size: samples in the window, odd so the median is a sample; a
+        # spike is dropped as long as it lasts under half the window
+        if size < 1:
+            raise ValueError('Median window must hold at least one sample')
+        self.size = size
+
+        self._ring = array('d', [0.0]) * size
+        self._scratch = [0.0] * size
+        self._count = 0
+        self._next = 0
+
+    def update(self, value):
+        size = self.size
+        ring = self._ring
+        scratch = self._scratch
+
+        ring[self._next] = value
+        self._next = (self._next + 1) % size
+        if self._count < size:
+            self._count += 1
+
+        count = self._count
+        for i in range(count):
+            scratch[i] = ring[i]
+
+        # Until the window fills, pad it evenly above and below, so the
+        # median is that of the samples seen so far, the lower of the middle
+        # two for an even count
+        for i in range(count, size):
+            scratch[i] = -math.inf if (i - count) % 2 == 0 else math.inf
+
+        scratch.sort()
+        return scratch[size // 2]
+
+class EMA(object):
+    def __init__(self, alpha=0.3):
+        # alpha: weight of each new sample, 1 follows the input exactly
+        if not 0 < alpha <= 1:
+            raise ValueError('EMA alpha must be in (0, 1]')
+        self.alpha = alpha
+        self.value = None
+
+    def update(self, value):
+        if self.value is None:
+            self.value = value
+        else:
+            self.value += self.alpha * (value - self.value)
+        return self.value
+
+class Kalman(object):
+    # Estimates a slowly wandering value from noisy measurements of it
+    def __init__(self, process_noise=0.01, measurement_noise=1.0):
+        # Variances of the value's change between samples and of the
+        # measurement error. Once settled only their ratio matters: the
+        # smaller process_noise is against measurement_noise, the smoother.
+        self.process_noise = process_noise
+        self.measurement_noise = measurement_noise
+        self.value = None
+        self.variance = None
+
+    def update(self, value):
+        if self.value is None:
+            self.value = value
+            self.variance = self.measurement_noise
+            return value
+
+        variance = self.variance + self.process_noise
+        gain = variance / (variance + self.measurement_noise)
+        self.value += gain * (value - self.value)
+        self.variance = (1 - gain) * variance
+        return self.value
+
+class Window(object):
+    # Mean of the values since it was last taken
+    def __init__(self):
+        self._sum = 0.0
+        self._count = 0
+
+    def update(self, value):
+        self._sum += value
+        self._count += 1
+        return value
+
+    def take(self):
+        # Returns the mean and starts a new window, None if it is empty
+        if not self._count:
+            return None
+
+        mean = self._sum / self._count
+        self._sum = 0.0
+        self._count = 0
+        return mean
+
+class SensorFilter(object):
+    def __init__(self, median=5, smoothing='ema', ema_alpha=0.3, kalman_process_noise=0.01,
+                 kalman_measurement_noise=1.0, upload_average=True):
+        # Arguments:
+        # median: despiking window in samples, 1 turns it off
+        # smoothing: one of SMOOTHING
+        # upload_average: uploads carry the mean of the samples since the
+        # last upload, rather than the latest one
+        if smoothing not in SMOOTHING:
+            raise ValueError('Unexpected smoothing {}, use one of {}'.format(
+                smoothing, SMOOTHING))
+
+        self.upload_average = upload_average
+
+        # One chain of filters per field, in FIELDS order
+        self._chains = []
+        for _ in FIELDS:
+            chain = []
+            if median > 1:
+                chain.append(Median(median).update)
+            if smoothing == 'ema':
+                chain.append(EMA(ema_alpha).update)
+            elif smoothing == 'kalman':
+                chain.append(Kalman(kalman_process_noise, kalman_measurement_noise).update)
+            self._chains.append(tuple(chain))
+
+        self._windows = [Window() for _ in FIELDS]
+
+    def update(self, observation):
+        # Returns the filtered observation, and adds it to the upload window
+        values = []
+        for chain, window, value in zip(self._chains, self._windows, observation[1:]):
+            for stage in chain:
+                value = stage(value)
+            values.append(window.update(value))
+
+        return Observation(observation.timestamp, *values)
+
+    def take(self, latest):
+        # Returns what to upload: the mean of the window, stamped with the
+        # latest observation's time, or latest itself without averaging
+        means = [window.take() for window in self._windows]
+        if not self.upload_average or means[0] is None:
+            return latest
+
+        return Observation(latest.timestamp, *means)
+
+def load_filters(config):
+    # Returns a SensorFilter configured by the [filter] section, or None if
+    # readings go out as read
+    if not config.has_section('filter'):
+        return None
+
+    return SensorFilter(
+        median=config.getint('filter', 'median', fallback=5),
+        smoothing=config.get('filter', 'smoothing', fallback='ema'),
+        ema_alpha=config.getfloat('filter', 'ema_alpha', fallback=0.3),
+        kalman_process_noise=config.getfloat('filter', 'kalman_process_noise', fallback=0.01),
+        kalman_measurement_noise=config.getfloat('filter', 'kalman_measurement_noise',
+                                                 fallback=1.0),
+        upload_average=config.getboolean('filter', 'upload_average', fallback=True))
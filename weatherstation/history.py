@@ -0,0 +1,130 @@
+# Copyright (c) 2016 Joseph Kogut
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Fixed-capacity in-memory history of recent observations.
+#
+# Samples are kept in preallocated columns, doubles for the timestamps and
+# single precision floats for each field, 24 bytes per sample in all, so two
+# days of 1 Hz samples take about 4 MB. Appends overwrite the oldest sample
+# once the buffer is full. Missing values are stored as NaN.
+#
+# Range queries return memoryviews onto the columns rather than copies. A
+# range that crosses the end of the buffer comes back as two segments. Views
+# are only valid until the buffer wraps around past them, so read them
+# promptly or copy what needs to be kept.
+
+import bisect
+import threading
+from array import array
+
+from weatherstation.observation import Observation
+
+FIELDS = ('tempc', 'barom_kPa', 'humidity_pct', 'uv')
+
+NAN = float('nan')
+
+class _Timestamps(object):
+    # Sequence view of the timestamps in age order, for bisect
+    def __init__(self, history):
+        self.history = history
+
+    def __len__(self):
+        return self.history._count
+
+    def __getitem__(self, i):
+        history = self.history
+        return history._timestamps[(history._start + i) % history.capacity]
+
+class History(object):
+    def __init__(self, capacity=172800):
+        self.capacity = capacity
+
+        self._timestamps = array('d', [0.0]) * capacity
+        self._columns = {field: array('f', [0.0]) * capacity for field in FIELDS}
+
+        # Physical index of the oldest sample, and the number of samples
+        self._start = 0
+        self._count = 0
+
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def nbytes(self):
+        return (self._timestamps.itemsize + 4 * len(FIELDS)) * self.capacity
+
+    def append(self, observation):
+        # Samples are expected in time order
+        with self._lock:
+            if self._count < self.capacity:
+                i = (self._start + self._count) % self.capacity
+                self._count += 1
+            else:
+                i = self._start
+                self._start = (self._start + 1) % self.capacity
+
+            self._timestamps[i] = observation.timestamp
+            for field in FIELDS:
+                value = getattr(observation, field)
+                self._columns[field][i] = NAN if value is None else value
+
+    def latest(self):
+        with self._lock:
+            if not self._count:
+                return None
+
+            return self._observation((self._start + self._count - 1) % self.capacity)
+
+    def _observation(self, i):
+        values = (self._columns[field][i] for field in FIELDS)
+        return Observation(self._timestamps[i], *(None if v != v else v for v in values))
+
+    def segments(self, start=None, end=None):
+        # Returns the samples with start <= timestamp < end as a list of at
+        # most two (timestamps, columns) pairs, oldest first, where columns
+        # maps each field name to a memoryview
+        with self._lock:
+            timestamps = _Timestamps(self)
+            first = 0 if start is None else bisect.bisect_left(timestamps, start)
+            last = self._count if end is None else bisect.bisect_left(timestamps, end)
+
+            if first >= last:
+                return []
+
+            first = (self._start + first) % self.capacity
+            last = (self._start + last - 1) % self.capacity + 1
+
+            if first < last:
+                ranges = [(first, last)]
+            else:
+                ranges = [(first, self.capacity), (0, last)]
+
+            return [(memoryview(self._timestamps)[a:b],
+                     {field: memoryview(column)[a:b] for field, column in self._columns.items()})
+                    for a, b in ranges]
+
+    def observations(self, start=None, end=None):
+        # Yields copies of the samples in a range, as Observations
+        for timestamps, columns in self.segments(start, end):
+            for i, timestamp in enumerate(timestamps):
+                values = (columns[field][i] for field in FIELDS)
+                yield Observation(timestamp, *(None if v != v else v for v in values))
@@ -0,0 +1,359 @@
+# Copyright (c) 2016 Joseph Kogut
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Minimal HTTP/1.1 server for a WSGI application, on an asyncio event loop.
+#
+# It supports what the station's web interface needs: GET/HEAD/POST with a
+# Content-Length body, and persistent connections. The application is called
+# on the event loop thread, or in an executor if one is given. Connections
+# are closed after keepalive_timeout idle seconds between requests, and
+# requests that take longer than request_timeout to arrive get a 408.
+# Bodies are read into memory, so longer ones than max_body get a 413.
+#
+# Long lived responses, such as event streams, are served by stream handlers
+# on the event loop instead, so they don't tie up a thread each. A handler is
+# a coroutine function taking the WSGI environ and returning (status,
+# headers, body), where body is an async iterator of bytes. The connection
+# is closed once the body ends, or once the client stops reading for
+# write_timeout seconds.
+
+import asyncio
+import io
+import logging
+import signal
+import sys
+from urllib.parse import unquote
+
+MAX_LINE = 8192
+MAX_HEADERS = 100
+
+# Seconds a stream waits on a client that is not reading
+WRITE_TIMEOUT = 30
+
+KEEPALIVE_TIMEOUT = 5
+REQUEST_TIMEOUT = 10
+
+# Bytes of request body; the web interface only takes small forms
+MAX_BODY = 65536
+
+class BadRequest(Exception):
+    pass
+
+class RequestTimeout(Exception):
+    pass
+
+class PayloadTooLarge(Exception):
+    pass
+
+class WSGIServer(object):
+    server_software = 'weatherstation'
+
+    def __init__(self, app, host='0.0.0.0', port=5000, executor=None, loop=None,
+                 streams=None, write_timeout=WRITE_TIMEOUT,
+                 keepalive_timeout=KEEPALIVE_TIMEOUT, request_timeout=REQUEST_TIMEOUT,
+                 max_body=MAX_BODY):
+        # Arguments:
+        # streams: stream handlers, by path
+        self.logger = logging.getLogger('.' + self.__class__.__name__)
+
+        self.app = app
+        self.streams = streams or {}
+        self.write_timeout = write_timeout
+        self.keepalive_timeout = keepalive_timeout
+        self.request_timeout = request_timeout
+        self.max_body = max_body
+        self.host = host
+        self.port = int(port)
+        self.executor = executor
+        self.loop = loop
+
+        self._server = None
+        self._connections = set()
+
+    async def start(self):
+        if self.loop is None:
+            self.loop = asyncio.get_event_loop()
+
+        self._server = await asyncio.start_server(
+            self._handle, self.host, self.port, limit=MAX_LINE)
+
+        # Report the bound port, in case port 0 was requested
+        self.port = self._server.sockets[0].getsockname()[1]
+        self.logger.info('Serving on {}:{}'.format(self.host, self.port))
+
+    async def stop(self):
+        if self._server is None:
+            return
+
+        self._server.close()
+
+        # Streams and idle keep-alive connections would otherwise stay open
+        for task in list(self._connections):
+            task.cancel()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+
+        await self._server.wait_closed()
+        self._server = None
+
+    async def _read_request(self, reader, idle_timeout):
+        # Returns (method, target, version, headers, body), or None if the
+        # client closed the connection, or sent nothing for idle_timeout
+        try:
+            first = await asyncio.wait_for(reader.readexactly(1), idle_timeout)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError):
+            return None
+
+        # From its first byte, the whole request must arrive in time
+        try:
+            return await asyncio.wait_for(self._read_rest(reader, first), self.request_timeout)
+        except asyncio.TimeoutError:
+            raise RequestTimeout()
+
+    async def _read_rest(self, reader, first):
+        # Reads the rest of the request, whose first byte has been read
+        line = first + await reader.readline()
+        if not line.endswith(b'\n'):
+            raise BadRequest('Connection closed in request line')
+
+        try:
+            method, target, version = line.decode('latin-1').split()
+        except ValueError:
+            raise BadRequest('Malformed request line')
+
+        headers = []
+        while True:
+            line = await reader.readline()
+            if not line:
+                raise BadRequest('Connection closed in headers')
+            if line in (b'\r\n', b'\n'):
+                break
+            if len(headers) >= MAX_HEADERS:
+                raise BadRequest('Too many headers')
+
+            name, sep, value = line.decode('latin-1').partition(':')
+            if not sep:
+                raise BadRequest('Malformed header')
+            headers.append((name.strip().lower(), value.strip()))
+
+        length = dict(headers).get('content-length', '0')
+        try:
+            length = int(length)
+        except ValueError:
+            raise BadRequest('Bad Content-Length')
+        if length < 0:
+            raise BadRequest('Bad Content-Length')
+        if length > self.max_body:
+            raise PayloadTooLarge()
+
+        body = await reader.readexactly(length) if length else b''
+
+        return method, target, version, headers, body
+
+    def _environ(self, writer, method, target, version, headers, body):
+        path, _, query = target.partition('?')
+        peer = writer.get_extra_info('peername') or ('', 0)
+
+        environ = {
+            'REQUEST_METHOD': method,
+            'SCRIPT_NAME': '',
+            'PATH_INFO': unquote(path, 'latin-1'),
+            'QUERY_STRING': query,
+            'SERVER_NAME': self.host,
+            'SERVER_PORT': str(self.port),
+            'SERVER_PROTOCOL': version,
+            'SERVER_SOFTWARE': self.server_software,
+            'REMOTE_ADDR': peer[0],
+            'REMOTE_PORT': str(peer[1]),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': self.executor is not None,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+
+        for name, value in headers:
+            key = name.upper().replace('-', '_')
+            if key in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                environ[key] = value
+                continue
+
+            key = 'HTTP_' + key
+            if key in environ:
+                environ[key] += ',' + value
+            else:
+                environ[key] = value
+
+        return environ
+
+    def _call_app(self, environ):
+        # Runs the application to completion, returning (status, headers, body)
+        response = []
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and response:
+                raise exc_info[1].with_traceback(exc_info[2])
+            response[:] = [status, headers]
+
+        result = self.app(environ, start_response)
+        try:
+            body = b''.join(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+
+        status, headers = response
+        return status, headers, body
+
+    async def _respond(self, writer, version, status, headers, body, keep_alive, head):
+        names = {name.lower() for name, _ in headers}
+        if 'content-length' not in names:
+            headers.append(('Content-Length', str(len(body))))
+        if version == 'HTTP/1.0' and keep_alive:
+            headers.append(('Connection', 'keep-alive'))
+        elif not keep_alive:
+            headers.append(('Connection', 'close'))
+
+        lines = ['{} {}'.format(version if version == 'HTTP/1.0' else 'HTTP/1.1', status)]
+        lines.extend('{}: {}'.format(name, value) for name, value in headers)
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        if not head:
+            writer.write(body)
+        await writer.drain()
+
+    async def _stream(self, writer, version, handler, environ):
+        status, headers, body = await handler(environ)
+
+        headers = list(headers) + [('Connection', 'close')]
+        lines = ['{} {}'.format(version if version == 'HTTP/1.0' else 'HTTP/1.1', status)]
+        lines.extend('{}: {}'.format(name, value) for name, value in headers)
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+
+        try:
+            async for chunk in body:
+                writer.write(chunk)
+
+                # A client that stops reading is cut off, and the drain
+                # fails. Not wait_for, which loses a cancellation from stop()
+                # that arrives just as the drain finishes.
+                timer = self.loop.call_later(self.write_timeout, writer.transport.abort)
+                try:
+                    await writer.drain()
+                finally:
+                    timer.cancel()
+        finally:
+            await body.aclose()
+
+    async def _handle(self, reader, writer):
+        task = asyncio.current_task()
+        self._connections.add(task)
+
+        try:
+            # The first request gets as long as any other to arrive
+            idle_timeout = self.request_timeout
+
+            while True:
+                try:
+                    request = await self._read_request(reader, idle_timeout)
+                except BadRequest as e:
+                    await self._respond(writer, 'HTTP/1.1', '400 Bad Request', [],
+                                        str(e).encode(), False, False)
+                    break
+                except RequestTimeout:
+                    await self._respond(writer, 'HTTP/1.1', '408 Request Timeout', [],
+                                        b'Request Timeout', False, False)
+                    break
+                except PayloadTooLarge:
+                    # The body is left unread, so the connection can't be reused
+                    await self._respond(writer, 'HTTP/1.1', '413 Payload Too Large', [],
+                                        b'Payload Too Large', False, False)
+                    break
+
+                idle_timeout = self.keepalive_timeout
+
+                if request is None:
+                    break
+
+                method, target, version, headers, body = request
+                connection = dict(headers).get('connection', '').lower()
+                if version == 'HTTP/1.0':
+                    keep_alive = connection == 'keep-alive'
+                else:
+                    keep_alive = connection != 'close'
+
+                environ = self._environ(writer, method, target, version, headers, body)
+
+                handler = self.streams.get(environ['PATH_INFO'])
+                if handler is not None and method == 'GET':
+                    await self._stream(writer, version, handler, environ)
+                    break
+
+                try:
+                    if self.executor is None:
+                        status, resp_headers, resp_body = self._call_app(environ)
+                    else:
+                        status, resp_headers, resp_body = await self.loop.run_in_executor(
+                            self.executor, self._call_app, environ)
+                except Exception:
+                    self.logger.exception('Error handling {} {}'.format(method, target))
+                    status, resp_headers, resp_body = (
+                        '500 Internal Server Error', [], b'Internal Server Error')
+                    keep_alive = False
+
+                await self._respond(writer, version, status, resp_headers, resp_body,
+                                    keep_alive, method == 'HEAD')
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                ConnectionError, ValueError):
+            pass
+        except asyncio.CancelledError:
+            # Closed by stop()
+            pass
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+def serve(app, host='0.0.0.0', port=5000, workers=0, streams=None, **kwargs):
+    # Serves app until interrupted, for callers without an event loop of
+    # their own. With workers, the application runs on that many threads.
+    from concurrent.futures import ThreadPoolExecutor
+
+    executor = ThreadPoolExecutor(max_workers=workers) if workers else None
+    loop = asyncio.new_event_loop()
+    server = WSGIServer(app, host, port, executor=executor, loop=loop, streams=streams,
+                        **kwargs)
+
+    # Return normally on Ctrl-C or SIGTERM, so the caller can clean up
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, loop.stop)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+    try:
+        loop.run_until_complete(server.start())
+        loop.run_forever()
+    finally:
+        loop.run_until_complete(server.stop())
+        loop.close()
+        if executor is not None:
+            executor.shutdown(wait=True)
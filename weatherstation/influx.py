@@ -0,0 +1,81 @@
+# Copyright (c) 2016 Joseph Kogut
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Publishes observations to InfluxDB, in line protocol.
+#
+# A batch of observations is written as one POST of one line each, over a
+# persistent connection, to an InfluxDB 1.x style /write endpoint. The url
+# carries the database and any credentials, for example
+# http://localhost:8086/write?db=weather
+
+import http.client
+
+from weatherstation.publish import Publisher, PublishError, PublishRejected
+from weatherstation.transport import HTTPTransport
+
+FIELDS = ('tempc', 'barom_kPa', 'humidity_pct', 'uv')
+
+def _escape(s):
+    # Escapes a measurement, tag key or tag value
+    return s.replace('\\', '\\\\').replace(',', '\\,').replace(' ', '\\ ').replace('=', '\\=')
+
+class InfluxPublisher(Publisher):
+    name = 'influx'
+
+    def __init__(self, url='http://localhost:8086/write?db=weather', measurement='weather',
+                 tags=None, batch=500, timeout=10, transport=None):
+        self.url = url
+        self.batch = batch
+        self.transport = transport if transport is not None else HTTPTransport(timeout)
+
+        # Everything but the fields and timestamp is the same on every line
+        self._prefix = _escape(measurement) + ''.join(
+            ',{}={}'.format(_escape(key), _escape(value))
+            for key, value in sorted((tags or {}).items()))
+
+        separator = '&' if '?' in url else '?'
+        self._write_url = url + separator + 'precision=ms'
+
+    def line(self, observation):
+        fields = ','.join('{}={!r}'.format(name, float(getattr(observation, name)))
+                          for name in FIELDS if getattr(observation, name) is not None)
+
+        return '{} {} {}'.format(self._prefix, fields, int(round(observation.timestamp * 1000)))
+
+    def publish(self, observations):
+        body = '\n'.join(self.line(observation) for observation in observations)
+
+        status, response = self.transport.request(
+            'POST', self._write_url, body.encode('UTF-8'),
+            {'Content-Type': 'text/plain; charset=utf-8'})
+
+        if 200 <= status < 300:
+            return
+
+        message = '{} {}'.format(status, response.decode('UTF-8', 'replace').strip())
+
+        # Bad data won't get any better, anything else may be temporary
+        if status == http.client.BAD_REQUEST:
+            raise PublishRejected(message)
+
+        raise PublishError(message)
+
+    def close(self):
+        self.transport.close()
@@ -18,29 +18,36 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-from threading import Thread
+from threading import Event, Thread
 import time
 
-from periphery import GPIO
-
 class LEDController(Thread):
-    idle_interval = 0.01
     commands = ['on', 'off', 'blink', 'blink_once']
     blink_interval = 0.5
 
     running = True
     daemon = True
 
-    def __init__(self, config, **kwargs):
+    def __init__(self, config, gpio=None, **kwargs):
         super(LEDController, self).__init__(**kwargs)
 
+        # Pins come from gpio, the board's own by default
+        if gpio is None:
+            from weatherstation.bus import GPIOBank
+            gpio = GPIOBank()
+
         self.led_context = {
-            led_name: {'cmd': 'off', 'state': False, 'last_mod': 0}
+            led_name: {'cmd': 'off', 'state': False, 'written': None, 'last_mod': 0}
             for led_name in dict(config.items('led')).keys() 
         }
 
+        # Called whenever a command changes; whoever drives _update() replaces
+        # this to be woken up
+        self._wake = Event()
+        self.on_change = self._wake.set
+
         for name, led in self.led_context.items():
-            led['gpio'] = GPIO(config.getint('led', name), 'out')
+            led['gpio'] = gpio.pin(config.getint('led', name), 'out')
 
     def __del__(self):
         for led in self.led_context.values():
@@ -56,37 +63,56 @@ class LEDController(Thread):
                     'LED is not initialized.')
 
         self.led_context[name]['cmd'] = cmd
+        self.on_change()
 
     def run(self):
         while(self.running):
-            self._update()
-            self._idle()
+            self._wake.clear()
+            timeout = self._update()
+            self._wake.wait(timeout)
 
     def stop(self):
         self.running = False
+        self.on_change()
         self.join()
 
     def _update(self):
+        # Applies pending commands, writing only the LEDs whose state changed.
+        # Returns the seconds until the next blink transition, or None.
+        now = time.time()
+        timeout = None
+
         for led in self.led_context.values():
+            wait = None
+
             if led['cmd'] == 'on':
                 led['state'] = True
             elif led['cmd'] == 'off':
                 led['state'] = False
             elif led['cmd'] == 'blink_once':
+                if not led['state']:
+                    led['state'] = True
+                    led['last_mod'] = now
+                    wait = self.blink_interval
+                elif now - led['last_mod'] >= self.blink_interval:
+                    led['state'] = False
+                    led['cmd'] = 'off'
+                else:
+                    wait = led['last_mod'] + self.blink_interval - now
+            elif led['cmd'] == 'blink':
+                if now - led['last_mod'] >= self.blink_interval:
                     led['state'] = not led['state']
-                    led['last_mod'] = time.time()
-
-                    if time.time() - led['last_mod'] > self.blink_interval:
-                        led['cmd'] = 'off'
+                    led['last_mod'] = now
+                wait = led['last_mod'] + self.blink_interval - now
 
-            elif led['cmd'] == 'blink' and time.time() - led['last_mod'] > self.blink_interval:
-                led['state'] = not led['state']
-                led['last_mod'] = time.time()
+            if led['state'] != led['written']:
+                led['gpio'].write(led['state'])
+                led['written'] = led['state']
 
-            led['gpio'].write(led['state'])
+            if wait is not None and (timeout is None or wait < timeout):
+                timeout = wait
 
-    def _idle(self):
-        time.sleep(self.idle_interval)
+        return timeout
 
 if __name__ == '__main__':
     from configparser import ConfigParser
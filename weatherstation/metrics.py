@@ -0,0 +1,214 @@
+# Copyright (c) 2016 Joseph Kogut
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Low overhead counters and histograms for the hot paths.
+#
+# Every metric keeps one accumulator per thread, keyed by thread ident, and
+# a thread only ever updates its own, so recording takes no lock. A thread
+# that exits leaves its accumulator to whichever thread is next given the
+# same ident, so totals never go backwards and short lived request threads
+# don't pile up accumulators. render() sums them, in the Prometheus text
+# format, for the /metrics endpoint.
+#
+# Metrics are declared once, at import, as families with label names;
+# labels() returns the child for a set of label values, which callers on a
+# hot path should look up once and keep.
+
+import bisect
+import threading
+import time
+
+PREFIX = 'weatherstation_'
+
+# Seconds, from I2C transactions to slow uploads
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+           0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_get_ident = threading.get_ident
+
+class Counter(object):
+    def __init__(self):
+        self._shards = {}
+
+    def inc(self, amount=1):
+        shard = self._shards.get(_get_ident())
+        if shard is None:
+            shard = self._shards.setdefault(_get_ident(), [0])
+        shard[0] += amount
+
+    def value(self):
+        return sum(shard[0] for shard in list(self._shards.values()))
+
+class Histogram(object):
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(buckets)
+
+        # Per thread: a count per bucket, then +Inf, then the sum
+        self._size = len(self.buckets) + 2
+        self._shards = {}
+
+    def observe(self, value):
+        shard = self._shards.get(_get_ident())
+        if shard is None:
+            shard = self._shards.setdefault(_get_ident(), [0] * self._size)
+        shard[bisect.bisect_left(self.buckets, value)] += 1
+        shard[-1] += value
+
+    def time(self):
+        # Context manager observing the seconds its block takes
+        return _Timer(self)
+
+    def snapshot(self):
+        # Returns (count per bucket and +Inf, not cumulative, sum)
+        totals = [0] * self._size
+        for shard in list(self._shards.values()):
+            for i, value in enumerate(shard):
+                totals[i] += value
+
+        return totals[:-1], totals[-1]
+
+class _Timer(object):
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self._started)
+
+class Family(object):
+    def __init__(self, name, help, kind, label_names, factory):
+        self.name = PREFIX + name
+        self.help = help
+        self.kind = kind
+        self.label_names = tuple(label_names)
+
+        self._factory = factory
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.label_names):
+                raise ValueError('{} takes labels {}'.format(self.name, self.label_names))
+
+            with self._lock:
+                child = self._children.setdefault(values, self._factory())
+
+        return child
+
+    def children(self):
+        with self._lock:
+            return sorted(self._children.items())
+
+class Gauge(object):
+    # Read when rendered, from a function returning a number
+    def __init__(self, name, help, function):
+        self.name = PREFIX + name
+        self.help = help
+        self.kind = 'gauge'
+        self.function = function
+
+_families = {}
+_lock = threading.Lock()
+
+def _register(name, make):
+    # Declaring a family twice returns the first one
+    with _lock:
+        family = _families.get(name)
+        if family is None:
+            family = _families[name] = make()
+        return family
+
+def counter(name, help, labels=()):
+    return _register(name, lambda: Family(name, help, 'counter', labels, Counter))
+
+def histogram(name, help, labels=(), buckets=BUCKETS):
+    return _register(name, lambda: Family(name, help, 'histogram', labels,
+                                          lambda: Histogram(buckets)))
+
+def gauge(name, help, function):
+    # Unlike the others, a later declaration replaces the function
+    with _lock:
+        _families[name] = Gauge(name, help, function)
+        return _families[name]
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+
+    return '{' + ','.join('{}="{}"'.format(name, _escape(value))
+                          for name, value in pairs) + '}'
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def render():
+    # Returns every metric in the Prometheus text exposition format
+    lines = []
+
+    with _lock:
+        families = sorted(_families.values(), key=lambda family: family.name)
+
+    for family in families:
+        if family.kind == 'gauge':
+            try:
+                value = family.function()
+            except Exception:
+                # Whatever it reads from may be gone, e.g. during shutdown
+                continue
+
+        lines.append('# HELP {} {}'.format(family.name, family.help))
+        lines.append('# TYPE {} {}'.format(family.name, family.kind))
+
+        if family.kind == 'gauge':
+            lines.append('{} {}'.format(family.name, _number(value)))
+            continue
+
+        for values, child in family.children():
+            if family.kind == 'counter':
+                lines.append('{}_total{} {}'.format(
+                    family.name, _labels(family.label_names, values), _number(child.value())))
+                continue
+
+            counts, total = child.snapshot()
+            cumulative = 0
+            for bound, count in zip(child.buckets + (float('inf'),), counts):
+                cumulative += count
+                lines.append('{}_bucket{} {}'.format(
+                    family.name,
+                    _labels(family.label_names, values, [('le', _number(bound))]),
+                    cumulative))
+            lines.append('{}_sum{} {}'.format(
+                family.name, _labels(family.label_names, values), _number(total)))
+            lines.append('{}_count{} {}'.format(
+                family.name, _labels(family.label_names, values), cumulative))
+
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,172 @@
+# Copyright (c) 2016 Joseph Kogut
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Publishes observations to an MQTT broker.
+#
+# A minimal MQTT 3.1.1 client, enough to publish at QoS 1 over a single
+# persistent connection. Each observation is sent as a JSON object. A batch
+# is written in one go and then every PUBACK is collected, so a backlog costs
+# one round trip rather than one per observation.
+
+import json
+import socket
+import struct
+
+from weatherstation.publish import Publisher, PublishError
+
+CONNECT = 0x10
+CONNACK = 0x20
+PUBLISH = 0x30
+PUBACK = 0x40
+DISCONNECT = 0xE0
+
+QOS_1 = 0x02
+RETAIN = 0x01
+
+def _length(n):
+    # Remaining length, as a variable length integer
+    encoded = bytearray()
+    while True:
+        n, digit = divmod(n, 128)
+        encoded.append(digit | 0x80 if n else digit)
+        if not n:
+            return bytes(encoded)
+
+def _string(s):
+    data = s.encode('UTF-8')
+    return struct.pack('!H', len(data)) + data
+
+def _packet(header, body):
+    return bytes([header]) + _length(len(body)) + body
+
+class MQTTPublisher(Publisher):
+    name = 'mqtt'
+
+    def __init__(self, host='localhost', port=1883, topic='weatherstation/observation',
+                 client_id='weatherstation', username=None, password=None, retain=True,
+                 timeout=10):
+        self.host = host
+        self.port = port
+        self.topic = topic
+        self.client_id = client_id
+        self.username = username
+        self.password = password
+        self.retain = retain
+        self.timeout = timeout
+
+        self._sock = None
+        self._buffer = b''
+        self._packet_id = 0
+
+    def _recv_exactly(self, n):
+        while len(self._buffer) < n:
+            data = self._sock.recv(4096)
+            if not data:
+                raise PublishError('Connection closed by broker')
+            self._buffer += data
+
+        data, self._buffer = self._buffer[:n], self._buffer[n:]
+        return data
+
+    def _read_packet(self):
+        # Returns (packet type, body)
+        header = self._recv_exactly(1)[0]
+
+        length, shift = 0, 0
+        while True:
+            digit = self._recv_exactly(1)[0]
+            length |= (digit & 0x7F) << shift
+            shift += 7
+            if not digit & 0x80:
+                break
+
+        return header & 0xF0, self._recv_exactly(length)
+
+    def _connect(self):
+        flags = 0x02 # Clean session
+        payload = _string(self.client_id)
+        if self.username is not None:
+            flags |= 0x80
+            payload += _string(self.username)
+        if self.password is not None:
+            flags |= 0x40
+            payload += _string(self.password)
+
+        # A keep alive of 0 lets the connection idle between uploads
+        body = _string('MQTT') + struct.pack('!BBH', 4, flags, 0) + payload
+
+        self._sock = socket.create_connection((self.host, self.port), self.timeout)
+        self._buffer = b''
+        self._sock.sendall(_packet(CONNECT, body))
+
+        packet_type, body = self._read_packet()
+        if packet_type != CONNACK or len(body) != 2 or body[1] != 0:
+            raise PublishError('Connection refused by broker: {!r}'.format(body))
+
+    def _publish(self, observations):
+        header = PUBLISH | QOS_1 | (RETAIN if self.retain else 0)
+        topic = _string(self.topic)
+
+        packets = []
+        pending = set()
+        for observation in observations:
+            self._packet_id = self._packet_id % 0xFFFF + 1
+            pending.add(self._packet_id)
+
+            fields = observation._asdict()
+            fields['dateutc'] = observation.dateutc
+            payload = json.dumps(fields).encode('UTF-8')
+
+            packets.append(_packet(header, topic + struct.pack('!H', self._packet_id) + payload))
+
+        self._sock.sendall(b''.join(packets))
+
+        while pending:
+            packet_type, body = self._read_packet()
+            if packet_type == PUBACK:
+                pending.discard(struct.unpack('!H', body[:2])[0])
+
+    def publish(self, observations):
+        for attempt in range(2):
+            reused = self._sock is not None
+
+            try:
+                if self._sock is None:
+                    self._connect()
+                self._publish(observations)
+                return
+            except (OSError, PublishError):
+                self.close()
+                # The broker may have dropped an idle connection, worth one
+                # more try on a fresh one
+                if not reused or attempt:
+                    raise
+
+    def close(self):
+        if self._sock is None:
+            return
+
+        try:
+            self._sock.sendall(_packet(DISCONNECT, b''))
+        except OSError:
+            pass
+
+        self._sock.close()
+        self._sock = None
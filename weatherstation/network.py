@@ -0,0 +1,144 @@
+# Copyright (c) 2016 Joseph Kogut
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# In-process connectivity monitoring.
+#
+# Connectivity is probed by opening a TCP connection to the upload endpoint,
+# which tests DNS, routing and the service itself without forking a process.
+# While the network is down, probes back off exponentially. State changes are
+# published through a callback, from the monitor's own thread or task, so the
+# sampling path never waits on the network.
+
+import asyncio
+import logging
+import socket
+import threading
+import time
+
+from weatherstation import metrics
+
+PROBE_SECONDS = metrics.histogram('network_probe_seconds', 'Time per connectivity probe')
+PROBES = metrics.counter('network_probes', 'Connectivity probes, by result', ['result'])
+
+class ConnectivityMonitor(object):
+    def __init__(self, host='weatherstation.wunderground.com', port=443,
+                 interval=5, max_interval=300, timeout=3, on_change=None):
+        self.logger = logging.getLogger('.' + self.__class__.__name__)
+
+        self.host = host
+        self.port = port
+        self.interval = interval
+        self.max_interval = max_interval
+        self.timeout = timeout
+
+        # Called with the new state whenever connectivity changes
+        self.on_change = on_change
+
+        self.up = True
+        self.failures = 0
+        self.last_probe = None
+        self.running = True
+
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._async_stop = None
+
+    def next_interval(self):
+        # Seconds until the next probe, doubling for each consecutive failure
+        if self.failures == 0:
+            return self.interval
+
+        return min(self.max_interval, self.interval * 2 ** (self.failures - 1))
+
+    def _record(self, success, started):
+        PROBE_SECONDS.labels().observe(time.perf_counter() - started)
+        PROBES.labels('up' if success else 'down').inc()
+        self.last_probe = time.time()
+
+        if success:
+            self.failures = 0
+        else:
+            self.failures += 1
+
+        if success != self.up:
+            self.up = success
+            self.logger.info('Network connection {}'.format(
+                'regained' if success else 'lost'))
+
+            if self.on_change is not None:
+                self.on_change(success)
+
+    def probe(self):
+        # Blocking probe, returns whether the endpoint accepted a connection
+        started = time.perf_counter()
+        try:
+            sock = socket.create_connection((self.host, self.port), self.timeout)
+        except OSError:
+            success = False
+        else:
+            sock.close()
+            success = True
+
+        self._record(success, started)
+        return success
+
+    async def probe_async(self):
+        started = time.perf_counter()
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port), self.timeout)
+        except (OSError, asyncio.TimeoutError):
+            success = False
+        else:
+            writer.close()
+            success = True
+
+        self._record(success, started)
+        return success
+
+    def run(self):
+        while self.running:
+            self.probe()
+            self._stop_event.wait(self.next_interval())
+
+    async def run_async(self):
+        self._async_stop = asyncio.Event()
+
+        while self.running:
+            await self.probe_async()
+            try:
+                await asyncio.wait_for(self._async_stop.wait(), self.next_interval())
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        # Probes from a background thread, for callers without an event loop
+        self._thread = threading.Thread(target=self.run, name='ConnectivityMonitor')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self.running = False
+        self._stop_event.set()
+        if self._async_stop is not None:
+            self._async_stop.set()
+
+        if self._thread is not None:
+            self._thread.join()
@@ -0,0 +1,35 @@
+# Copyright (c) 2016 Joseph Kogut
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# A single timestamped set of outdoor conditions, in the units the sensors
+# report: degrees C, kPa, percent relative humidity and UV index. Timestamps
+# are seconds since the epoch, UTC.
+
+import time
+from collections import namedtuple
+
+class Observation(namedtuple('Observation',
+                             ['timestamp', 'tempc', 'barom_kPa', 'humidity_pct', 'uv'])):
+    __slots__ = ()
+
+    @property
+    def dateutc(self):
+        # Capture time in the format Weather Underground expects for dateutc
+        return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(self.timestamp))
@@ -0,0 +1,103 @@
+# Copyright (c) 2016 Joseph Kogut
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Output sinks for observations.
+#
+# A Publisher sends a batch of observations somewhere: Weather Underground,
+# an MQTT broker, InfluxDB or CWOP. Each one is driven by its own Uploader,
+# with its own queue, spool and retries, so a sink that is slow or down
+# never delays the others; see weatherstation.uploader.
+#
+# publish() either delivers the whole batch or raises. OSError,
+# http.client.HTTPException and PublishError are treated as temporary, and
+# the batch is sent again later. PublishRejected means the sink refused the
+# data, and the batch is dropped.
+#
+# A sink that sends a batch one observation at a time says how far it got:
+# delivered is the number of observations, from the front of the batch,
+# that went through before the error. Those are not sent again. For
+# PublishRejected, the observation after them is the one refused, and only
+# it is dropped; without delivered the whole batch is.
+
+class PublishError(Exception):
+    def __init__(self, *args, delivered=0):
+        super().__init__(*args)
+        self.delivered = delivered
+
+class PublishRejected(Exception):
+    def __init__(self, *args, delivered=None):
+        super().__init__(*args)
+        self.delivered = delivered
+
+class Publisher(object):
+    # Names the sink in logs, and its table in the spool
+    name = None
+
+    # Only the newest observation is worth sending, see Uploader
+    realtime = False
+
+    # Most observations per publish() call, None for the uploader's default
+    batch = None
+
+    def publish(self, observations):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+def load_publishers(config):
+    # Returns the extra publishers enabled in config, besides Weather
+    # Underground. Each sink is only imported if it is enabled.
+    publishers = []
+
+    if config.getboolean('mqtt', 'enabled', fallback=False):
+        from weatherstation.mqtt import MQTTPublisher
+        publishers.append(MQTTPublisher(
+            config.get('mqtt', 'host', fallback='localhost'),
+            config.getint('mqtt', 'port', fallback=1883),
+            topic=config.get('mqtt', 'topic', fallback='weatherstation/observation'),
+            client_id=config.get('mqtt', 'client_id', fallback='weatherstation'),
+            username=config.get('mqtt', 'username', fallback=None),
+            password=config.get('mqtt', 'password', fallback=None),
+            retain=config.getboolean('mqtt', 'retain', fallback=True),
+            timeout=config.getfloat('mqtt', 'timeout', fallback=10)))
+
+    if config.getboolean('influx', 'enabled', fallback=False):
+        from weatherstation.influx import InfluxPublisher
+        publishers.append(InfluxPublisher(
+            config.get('influx', 'url', fallback='http://localhost:8086/write?db=weather'),
+            measurement=config.get('influx', 'measurement', fallback='weather'),
+            tags={'station': config.get('pws', 'id', fallback='').strip() or 'weatherstation'},
+            batch=config.getint('influx', 'batch', fallback=500),
+            timeout=config.getfloat('influx', 'timeout', fallback=10)))
+
+    if config.getboolean('cwop', 'enabled', fallback=False):
+        from weatherstation.cwop import CWOPPublisher
+        publishers.append(CWOPPublisher(
+            config.get('cwop', 'callsign'),
+            config.getfloat('cwop', 'latitude'),
+            config.getfloat('cwop', 'longitude'),
+            passcode=config.get('cwop', 'passcode', fallback='-1'),
+            host=config.get('cwop', 'host', fallback='cwop.aprs.net'),
+            port=config.getint('cwop', 'port', fallback=14580),
+            min_interval=config.getfloat('cwop', 'min_interval', fallback=300),
+            timeout=config.getfloat('cwop', 'timeout', fallback=10)))
+
+    return publishers
@@ -1,123 +1,280 @@
-from weatherstation.bme280 import BME280
-from weatherstation.si1145 import SI1145
-from weatherstation.weatherunderground import PWS
+# Keep this first, it marks the time the process was started
+from weatherstation import startup
 
+# The sensor drivers, uploader and web interface are imported where they are
+# first used, so that sampling starts before Flask has finished importing.
 from weatherstation.led import LEDController
 from weatherstation.relay import RelayController
 
-import weatherstation.web as web
-
 import os
+import signal
 import sys
 import time
-import logging
-import subprocess
+import urllib.parse
 import logging
 from configparser import ConfigParser
 
-from threading import Thread
+from threading import Thread, Lock
+
+from weatherstation import units
+from weatherstation import api
+from weatherstation import metrics
+from weatherstation.archive import Archive
+from weatherstation.broadcast import Broadcaster
+from weatherstation.history import History
+from weatherstation.network import ConnectivityMonitor
+from weatherstation.observation import Observation
+from weatherstation.filters import load_filters
+from weatherstation.publish import load_publishers
+from weatherstation.rollup import Rollups
+from weatherstation.scheduler import Clock, Scheduler
+from weatherstation.spool import Spool
+from weatherstation.uploader import Uploader, FanOut
 
 class Daemon(Thread):
-    _idle_interval = 0.1
     running = True
 
     leds = None
     relays = None
 
-    def __init__(self, id, password, display_units='imperial', busnum=2, remote_update_interval=300):
+    def __init__(self, id, password, display_units='imperial', busnum=2, remote_update_interval=300,
+                 calibration_cache=None, atm_mode='forced', atm_standby_ms=1000, atm_filter=0,
+                 atm_compensation='float', sample_interval=5, network_check_interval=5,
+                 network_check_max_interval=300, network_check_timeout=3,
+                 rapidfire=False, rapidfire_interval=2.5, upload_timeout=10,
+                 spool_path=None, spool_max_records=100000, spool_commit_interval=60,
+                 backfill_interval=2, backfill_batch=5, upload_queue_size=100,
+                 upload_retry_base=5, upload_retry_max=300, publishers=(),
+                 history_capacity=172800, archive_path=None, archive_flush_interval=60,
+                 archive_compact_interval=86400, i2c=None, clock=None, tracer=None,
+                 filters=None, publish=None):
+        # i2c: bus the sensors are on, the board's own by default
+        # clock: a scheduler.Clock, sped up when simulating
+        # tracer: a tracer.Tracer for slow job runs
+        # filters: a filters.SensorFilter for readings, None keeps them raw
+        # publish: whether readings are spooled and sent to the sinks; by
+        # default they are, unless the sensors are simulated
         super().__init__()
 
+        from weatherstation.bme280 import BME280, BME280_STANDBY_MS, BME280_FILTER_COEFFICIENTS
+        from weatherstation.si1145 import SI1145
+        from weatherstation.weatherunderground import PWS
+
         self.logger = logging.getLogger()
 
         self.id = id
         self.password = password
         self.display_units = display_units
+        self.clock = clock if clock is not None else Clock()
+
+        # Latest Observation, None until the first sample
+        self.observation = None
+        self.filters = filters
+
+        # Counts samples, anything derived from them is stale once it moves
+        self.generation = 0
+
+        # Pushes each sample to event stream clients
+        self.broadcaster = Broadcaster()
 
-        self._remote_update_interval = remote_update_interval
-        self.last_remote_update = None
+        # Every sample, until the oldest are overwritten
+        self.history = History(history_capacity)
+
+        # Minute, hour and day aggregates, for long range queries
+        self.rollups = Rollups()
+
+        # Every sample, on disk, if there is somewhere to put it
+        self.archive = None
+        self._compacting = Lock()
+        if archive_path:
+            self.archive = Archive(archive_path, flush_count=sys.maxsize,
+                                   flush_interval=archive_flush_interval)
+
+            # Rollups start out empty, so fill them in from the archive
+            Thread(target=self._seed_rollups, args=(self.clock.time(),),
+                   name='RollupSeed', daemon=True).start()
 
         self.network_up = True
-        self.ping_interval = 5
-        self.last_ping = None
+        metrics.gauge('network_up', 'Whether the upload endpoint is reachable',
+                      lambda: int(self.network_up))
+
+        simulated = getattr(i2c, 'simulated', False)
+        if simulated:
+            calibration_cache = None
+
+        # Made up readings must never reach the real spool or sinks
+        if publish is None:
+            publish = not simulated
+        if not publish:
+            spool_path = None
+            publishers = ()
 
-        self.atm_sensor = BME280(busnum=busnum)
-        self.uv_sensor = SI1145(busnum=busnum)
+        self.atm_sensor = BME280(busnum=busnum, i2c=i2c, calibration_cache=calibration_cache,
+                                 compensation=atm_compensation)
+        self.uv_sensor = SI1145(i2c=i2c, busnum=busnum)
+
+        if atm_mode == 'normal':
+            self.atm_sensor.set_normal_mode(
+                BME280_STANDBY_MS[atm_standby_ms],
+                BME280_FILTER_COEFFICIENTS[atm_filter])
 
         # The atmospheric sensor wants to be read from first, to introduce
         # a bit of delay
         self.atm_sensor.read_raw_temp()
 
-        self.pws = PWS(id, password)
-
-    def _check_network(self):
-        try:
-            subprocess.check_call(['/bin/ping', '-c1', '-w3', '8.8.8.8'], stdout=subprocess.PIPE)
-            ping_success = True
-        except subprocess.CalledProcessError:
-            ping_success = False
-
-        if not self.network_up and ping_success:
-            self.logger.info('Network connection regained')
-            self.network_up = True
-            self.leds.set('network', 'off')
-        elif self.network_up and not ping_success:
-            self.logger.info('Network connection lost')
-            self.network_up = False
-            self.leds.set('network', 'blink')
-
-    def _idle(self):
-        time.sleep(self._idle_interval)
-
-    def _relay_update(self):
-        #tempf = self.pws.tempf
-        #if tempf and tempf >= 70 and not self.relays.relay_context['k1']['state'] == True:
-        #    self.relays.set('k1', 'on')
-        pass
-
-    def _environ_update(self, update_remote=True):
-        self.pws.tempc = self.atm_sensor.read_temperature()
-        self.pws.barom_kPa = self.atm_sensor.read_pressure() / 1000.0
-        self.pws.humidity_pct = self.atm_sensor.read_humidity()
-        self.pws.uv = self.uv_sensor.readUV() / 100.00
-
-        if update_remote:
-            self.pws.upload_outdoor()
-            self.last_remote_update = time.time()
+        self.pws = PWS(id, password, rapidfire=rapidfire,
+                       rapidfire_interval=rapidfire_interval, timeout=upload_timeout)
+
+        if rapidfire:
+            remote_update_interval = rapidfire_interval
+            sample_interval = min(sample_interval, rapidfire_interval)
+
+        # Observations wait here until they are uploaded. Without a path the
+        # spool lives in memory, and a backlog does not survive a restart.
+        self.spool = Spool(spool_path or ':memory:', max_records=spool_max_records,
+                           commit_interval=spool_commit_interval)
+
+        # Every sink gets its own uploader thread, queue and spool queue, so
+        # a slow sink never delays sampling or the other sinks
+        uploaders = []
+        for publisher in ([self.pws] + list(publishers) if publish else []):
+            queue = None if publisher.realtime else self.spool.queue(publisher.name)
+
+            uploaders.append(Uploader(
+                publisher, queue, online=lambda: self.network_up,
+                queue_size=upload_queue_size, batch=backfill_batch,
+                interval=backfill_interval, retry_base=upload_retry_base,
+                retry_max=upload_retry_max))
+
+        self.publisher = FanOut(uploaders)
+
+        # Probes the upload endpoint from its own thread or task; see
+        # _network_changed
+        host = urllib.parse.urlsplit(PWS.url).hostname
+        self.network = ConnectivityMonitor(
+            host, interval=network_check_interval,
+            max_interval=network_check_max_interval, timeout=network_check_timeout,
+            on_change=self._network_changed)
+
+        # Each job runs at its own cadence; sampling is added first so the
+        # first upload has data. Relays switch on command, see
+        # RelayController, so they have no job.
+        self.scheduler = Scheduler(self.clock.monotonic, self.clock.speed)
+        self.scheduler.tracer = self.tracer = tracer
+        self.scheduler.add('sample', sample_interval, self._environ_update)
+        self.scheduler.add('upload', remote_update_interval, self._remote_update)
+        if self.archive is not None:
+            self.scheduler.add('compact', archive_compact_interval, self._compact_archive,
+                               delay=60)
+
+    def _network_changed(self, up):
+        self.network_up = up
+        self.leds.set('network', 'off' if up else 'blink')
+
+        if up:
+            self.publisher.wake()
+
+    def _remote_update(self):
+        observation = self.observation
+        if observation is None:
+            return
+
+        # The average since the last upload, when filtering
+        if self.filters is not None:
+            observation = self.filters.take(observation)
+        self.publisher.submit(observation)
+
+    def _environ_update(self):
+        # Read the UV sensor while the atmospheric sensor is converting
+        self.atm_sensor.start_measurement()
+        uv = self.uv_sensor.readUV() / 100.00
+
+        tempc, pressure, humidity = self.atm_sensor.read_measurement()
+
+        observation = Observation(self.clock.time(), tempc, pressure / 1000.0, humidity, uv)
+        if self.filters is not None:
+            observation = self.filters.update(observation)
+
+        self.pws.tempc = observation.tempc
+        self.pws.barom_kPa = observation.barom_kPa
+        self.pws.humidity_pct = observation.humidity_pct
+        self.pws.uv = observation.uv
+
+        self.observation = observation
+        self.history.append(self.observation)
+        self.rollups.append(self.observation)
+        if self.archive is not None:
+            self.archive.append(self.observation)
+
+        self.generation += 1
+        self.broadcaster.publish(self.generation, api.current(self))
+
+        startup.mark('first_sample')
+
+    def conditions(self):
+        # Latest conditions, formatted for display
+        observation = self.observation
+        if observation is None:
+            return dict.fromkeys(('temp', 'press', 'humd', 'uv'), 'not available')
+
+        conditions = {
+            'humd': '{:.2f}%'.format(observation.humidity_pct),
+            'uv': '{:.2f}'.format(observation.uv)
+        }
 
         if self.display_units == 'imperial':
-            web.env_data['temp'] = '{:.2f} deg F'.format(self.pws.tempf)
-            web.env_data['press'] = '{:.2f} in Hg'.format(self.pws.barom_inHg)
-            web.env_data['humd'] = '{:.2f}%'.format(self.pws.humidity_pct)
-            web.env_data['uv'] = '{:.2f}'.format(self.pws.uv)
+            conditions['temp'] = '{:.2f} deg F'.format(units.DEGC_TO_DEGF(observation.tempc))
+            conditions['press'] = '{:.2f} in Hg'.format(units.KPA_TO_INHG(observation.barom_kPa))
         elif self.display_units == 'metric':
-            web.env_data['temp'] = '{:.2f} deg C'.format(self.pws.tempc)
-            web.env_data['press'] = '{:.2f} mPa'.format(self.pws.barom_mPa)
-            web.env_data['humd'] = '{:.2f}%'.format(self.pws.humidity_pct)
-            web.env_data['uv'] = '{:.2f}'.format(self.pws.uv)
-
-    def _update(self):
-        self._relay_update()
-
-        if self.last_ping is None \
-        or time.time() > self.last_ping + self.ping_interval:
-            self._check_network()
+            conditions['temp'] = '{:.2f} deg C'.format(observation.tempc)
+            conditions['press'] = '{:.2f} hPa'.format(units.KPA_TO_HPA(observation.barom_kPa))
 
-        remote_update = False
-        if self.network_up is True \
-        and (self.last_remote_update is None \
-        or time.time() > self.last_remote_update + self._remote_update_interval):
-            remote_update = True
+        return conditions
 
-        self._environ_update(remote_update)
+    def _seed_rollups(self, until):
+        started = time.monotonic()
+        try:
+            self.rollups.seed(self.archive.scan, until)
+        except Exception:
+            self.logger.exception('Seeding rollups from the archive failed')
+        else:
+            self.logger.info('Rolled up the archive in {:.1f} s'.format(time.monotonic() - started))
+
+    def _compact_archive(self):
+        # Compressing a month takes a while, so it gets a thread of its own
+        if not self._compacting.acquire(blocking=False):
+            return
+
+        def compact():
+            try:
+                self.archive.compact()
+            except Exception:
+                self.logger.exception('Archive compaction failed')
+            finally:
+                self._compacting.release()
+
+        Thread(target=compact, name='ArchiveCompaction', daemon=True).start()
+
+    def close(self):
+        # Writes out everything held in memory, once sampling has stopped
+        self.publisher.stop()
+        self.spool.close()
+        if self.archive is not None:
+            self.archive.close()
+        if self.tracer is not None:
+            self.tracer.stop()
 
     def run(self):
-        while self.running:
-            self._update()
-            self._idle()
+        self.network.start()
+        self.publisher.start()
+        self.scheduler.run()
 
     def stop(self):
         self.running = False
+        self.network.stop()
+        self.scheduler.stop()
         self.join()
+        self.close()
 
 def init_logger():
     logger = logging.getLogger()
@@ -150,28 +307,121 @@ if __name__ == '__main__':
 
     config = init_config()
 
-    leds = LEDController(config)
-    relays = RelayController(config)
+    # Without hardware, the sensors and GPIO are simulated
+    from weatherstation.sim import load_simulation
+    simulation = load_simulation(config)
+
+    gpio = simulation.gpio if simulation is not None else None
+
+    # Simulated readings stay out of the real spool, archive and sinks,
+    # unless [sim] real_outputs says otherwise
+    archive_path = config.get('pws', 'archive_path', fallback=None)
+    publish = None
+    if simulation is not None:
+        publish = config.getboolean('sim', 'real_outputs', fallback=False)
+        if not publish:
+            archive_path = config.get('sim', 'archive_path', fallback=None)
+            root_logger.info('Simulating: readings are not spooled or uploaded, '
+                             'archive is {}'.format(archive_path or 'off'))
+
+    # Traces slow job runs, toggled by SIGUSR1 or, if [trace] http_control
+    # allows, POST /debug/tracer
+    from weatherstation.tracer import Tracer
+    tracer = Tracer(
+        config.get('trace', 'path', fallback=None),
+        budget=config.getfloat('trace', 'budget', fallback=0.5),
+        interval=config.getfloat('trace', 'interval', fallback=0.01),
+        flush_interval=config.getfloat('trace', 'flush_interval', fallback=60),
+        max_bytes=config.getint('trace', 'max_bytes', fallback=1048576),
+        backup_count=config.getint('trace', 'backup_count', fallback=5),
+        enabled=config.getboolean('trace', 'enabled', fallback=False))
+    tracer.start()
+    signal.signal(signal.SIGUSR1, tracer.toggle)
+    leds = LEDController(config, gpio=gpio)
+    relays = RelayController(config, gpio=gpio)
 
     pws_daemon = Daemon(
         config.get('pws', 'id'),
         config.get('pws', 'password'),
-        config.get('web', 'display_units')
+        config.get('web', 'display_units'),
+        busnum=config.getint('pws', 'i2c_sensor_busnum', fallback=2),
+        calibration_cache=config.get('pws', 'calibration_cache', fallback=None),
+        atm_mode=config.get('pws', 'bme280_mode', fallback='forced'),
+        atm_standby_ms=config.getfloat('pws', 'bme280_standby_ms', fallback=1000),
+        atm_filter=config.getint('pws', 'bme280_filter', fallback=0),
+        atm_compensation=config.get('pws', 'bme280_compensation', fallback='float'),
+        remote_update_interval=config.getfloat('pws', 'upload_interval', fallback=300),
+        sample_interval=config.getfloat('pws', 'sample_interval', fallback=5),
+        network_check_interval=config.getfloat('pws', 'network_check_interval', fallback=5),
+        network_check_max_interval=config.getfloat('pws', 'network_check_max_interval', fallback=300),
+        network_check_timeout=config.getfloat('pws', 'network_check_timeout', fallback=3),
+        rapidfire=config.getboolean('pws', 'rapidfire', fallback=False),
+        rapidfire_interval=config.getfloat('pws', 'rapidfire_interval', fallback=2.5),
+        upload_timeout=config.getfloat('pws', 'upload_timeout', fallback=10),
+        spool_path=config.get('pws', 'spool_path', fallback=None),
+        spool_max_records=config.getint('pws', 'spool_max_records', fallback=100000),
+        spool_commit_interval=config.getfloat('pws', 'spool_commit_interval', fallback=60),
+        backfill_interval=config.getfloat('pws', 'backfill_interval', fallback=2),
+        backfill_batch=config.getint('pws', 'backfill_batch', fallback=5),
+        upload_queue_size=config.getint('pws', 'upload_queue_size', fallback=100),
+        upload_retry_base=config.getfloat('pws', 'upload_retry_base', fallback=5),
+        upload_retry_max=config.getfloat('pws', 'upload_retry_max', fallback=300),
+        publishers=load_publishers(config),
+        history_capacity=config.getint('pws', 'history_capacity', fallback=172800),
+        archive_path=archive_path,
+        archive_flush_interval=config.getfloat('pws', 'archive_flush_interval', fallback=60),
+        i2c=simulation.i2c if simulation is not None else None,
+        clock=simulation.clock if simulation is not None else None,
+        tracer=tracer,
+        filters=load_filters(config),
+        publish=publish
     )
 
     pws_daemon.leds = leds
     pws_daemon.relays = relays
 
+    def load_web():
+        import weatherstation.web as web
+        web.init(pws_daemon,
+                 tracer_control=config.get('trace', 'http_control', fallback='loopback'))
+        return web.app, web.streams
+
+    host = config.get('web', 'listen_address')
+    port = config.getint('web', 'port')
+    web_workers = config.getint('web', 'workers', fallback=2)
+    server_options = {
+        'keepalive_timeout': config.getfloat('web', 'keepalive_timeout', fallback=5),
+        'request_timeout': config.getfloat('web', 'request_timeout', fallback=10),
+        'max_body': config.getint('web', 'max_body', fallback=65536),
+    }
+
+    if config.get('pws', 'runtime', fallback='asyncio') == 'asyncio':
+        from weatherstation.runtime import Runtime
+
+        runtime = Runtime(pws_daemon, [leds, relays], load_web, host=host, port=port,
+                          web_workers=web_workers, server_options=server_options)
+        runtime.run()
+        root_logger.info('Shutting down...')
+        pws_daemon.close()
+        sys.exit()
+
     try:
         leds.start()
         relays.start()
         pws_daemon.start()
 
-        web.app.run(host=config.get('web', 'listen_address'),
-                    port=config.get('web', 'port'))
+        app, streams = load_web()
+
+        if config.get('web', 'server', fallback='builtin') == 'flask':
+            # Threaded, so event streams don't block other requests
+            app.run(host=host, port=port, threaded=True)
+        else:
+            from weatherstation.httpserver import serve
+            serve(app, host, port, workers=web_workers, streams=streams, **server_options)
 
-    except KeyboardInterrupt:
+    finally:
+        # Both servers return normally on Ctrl-C
         root_logger.info('Shutting down...')
         pws_daemon.stop()
-        led_controller.stop()
-        raise
+        leds.stop()
+        relays.stop()
@@ -18,28 +18,35 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-from threading import Thread
+from threading import Event, Thread
 import time
 
-from periphery import GPIO
-
 class RelayController(Thread):
-    idle_interval = 0.01
     commands = ['on', 'off']
 
     running = True
     daemon = True
 
-    def __init__(self, config, **kwargs):
+    def __init__(self, config, gpio=None, **kwargs):
         super(RelayController, self).__init__(**kwargs)
 
+        # Pins come from gpio, the board's own by default
+        if gpio is None:
+            from weatherstation.bus import GPIOBank
+            gpio = GPIOBank()
+
         self.relay_context = {
-                relay_name: {'cmd': 'off'}
+                relay_name: {'cmd': 'off', 'state': False, 'written': None}
             for relay_name in dict(config.items('relay')).keys() 
         }
 
+        # Called whenever a command changes; whoever drives _update() replaces
+        # this to be woken up
+        self._wake = Event()
+        self.on_change = self._wake.set
+
         for name, relay in self.relay_context.items():
-            relay['gpio'] = GPIO(config.getint('relay', name), 'out')
+            relay['gpio'] = gpio.pin(config.getint('relay', name), 'out')
 
     def __del__(self):
         for relay in self.relay_context.values():
@@ -52,27 +59,33 @@ class RelayController(Thread):
                     'Invalid command, supported commands are: {}'.format(self.commands))
 
         self.relay_context[name.lower()]['cmd'] = cmd
+        self.on_change()
 
     def run(self):
         while(self.running):
-            self._update()
-            self._idle()
+            self._wake.clear()
+            timeout = self._update()
+            self._wake.wait(timeout)
 
     def stop(self):
         self.running = False
+        self.on_change()
         self.join()
 
     def _update(self):
+        # Applies pending commands, writing only the relays whose state
+        # changed. Relays never need a timed update, so this returns None.
         for relay in self.relay_context.values():
             if relay['cmd'] == 'on':
                 relay['state'] = True
             elif relay['cmd'] == 'off':
                 relay['state'] = False
 
-            relay['gpio'].write(relay['state'])
+            if relay['state'] != relay['written']:
+                relay['gpio'].write(relay['state'])
+                relay['written'] = relay['state']
 
-    def _idle(self):
-        time.sleep(self.idle_interval)
+        return None
 
 if __name__ == '__main__':
     from configparser import ConfigParser
@@ -0,0 +1,266 @@
+# Copyright (c) 2016 Joseph Kogut
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Incremental multi-resolution rollups of the sample stream.
+#
+# Each Rollup keeps the min, max, mean and last value of every field over
+# fixed time buckets, one minute, one hour and one day by default, updated in
+# place as samples arrive. Buckets live in preallocated ring buffers, so the
+# oldest are dropped once a rollup is full. Buckets without samples are not
+# stored, so gaps in the data stay gaps.
+#
+# Queries pick the coarsest resolution that still gives at least the number
+# of points asked for, so a year long graph reads a few hundred daily
+# buckets rather than millions of samples.
+#
+# Rollups live in memory, so after a restart seed() rebuilds them from the
+# archive, a bucket at a time over slices of its columns, while new samples
+# keep arriving.
+
+import bisect
+import threading
+from array import array
+from collections import namedtuple
+
+from weatherstation.history import FIELDS, NAN
+
+# Resolution in seconds, and how many buckets to keep: a week of minutes,
+# about a year of hours and ten years of days
+RESOLUTIONS = ((60, 10080), (3600, 8784), (86400, 3660))
+
+INF = float('inf')
+
+Aggregate = namedtuple('Aggregate', ['timestamp', 'min', 'max', 'mean', 'last'])
+
+class _Starts(object):
+    # Sequence view of the bucket start times in age order, for bisect
+    def __init__(self, rollup):
+        self.rollup = rollup
+
+    def __len__(self):
+        return self.rollup._count
+
+    def __getitem__(self, i):
+        return self.rollup._starts[self.rollup._index(i)]
+
+class Rollup(object):
+    def __init__(self, resolution, capacity):
+        self.resolution = resolution
+        self.capacity = capacity
+
+        self._starts = array('d', [0.0]) * capacity
+        self._min = {field: array('f', [0.0]) * capacity for field in FIELDS}
+        self._max = {field: array('f', [0.0]) * capacity for field in FIELDS}
+        self._last = {field: array('f', [0.0]) * capacity for field in FIELDS}
+        self._sum = {field: array('d', [0.0]) * capacity for field in FIELDS}
+        self._samples = {field: array('I', [0]) * capacity for field in FIELDS}
+
+        # The same arrays, in FIELDS order, for add()
+        self._arrays = [(self._min[field], self._max[field], self._last[field],
+                         self._sum[field], self._samples[field]) for field in FIELDS]
+
+        # Physical index of the newest bucket, and the number of buckets
+        self._head = -1
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def _index(self, i):
+        # Physical index of the i-th oldest bucket
+        return (self._head - self._count + 1 + i) % self.capacity
+
+    def _open(self, start):
+        # Starts a new bucket, returns its physical index
+        head = self._head = (self._head + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+
+        self._starts[head] = start
+        for min_, max_, last, sum_, samples in self._arrays:
+            min_[head] = INF
+            max_[head] = -INF
+            last[head] = NAN
+            sum_[head] = 0.0
+            samples[head] = 0
+
+        return head
+
+    def _bucket(self, start):
+        # Physical index of the bucket starting at start, opened if need be,
+        # or None if it has been closed
+        if self._count:
+            current = self._starts[self._head]
+            if start == current:
+                return self._head
+            if start < current:
+                return None
+
+        return self._open(start)
+
+    def add(self, timestamp, values):
+        # Adds one sample, values in FIELDS order, None where missing
+        head = self._bucket(timestamp - timestamp % self.resolution)
+        if head is None:
+            # Too late, the bucket has been closed
+            return
+
+        for value, (min_, max_, last, sum_, samples) in zip(values, self._arrays):
+            if value is None or value != value:
+                continue
+
+            if value < min_[head]:
+                min_[head] = value
+            if value > max_[head]:
+                max_[head] = value
+            last[head] = value
+            sum_[head] += value
+            samples[head] += 1
+
+    def add_block(self, timestamps, columns, since=None):
+        # Adds samples in time order, as a (timestamps, columns) segment
+        # like History.segments, skipping those before since. Each bucket's
+        # slice of a column is aggregated by the builtins, rather than
+        # sample by sample.
+        fields = [columns[field] for field in FIELDS]
+        a = 0 if since is None else bisect.bisect_left(timestamps, since)
+        count = len(timestamps)
+
+        while a < count:
+            start = timestamps[a] - timestamps[a] % self.resolution
+            b = bisect.bisect_left(timestamps, start + self.resolution, a)
+
+            head = self._bucket(start)
+            if head is not None:
+                for column, (min_, max_, last, sum_, samples) in zip(fields, self._arrays):
+                    values = column[a:b]
+                    total = sum(values)
+                    if total != total:
+                        # Some are missing
+                        values = [value for value in values if value == value]
+                        if not values:
+                            continue
+                        total = sum(values)
+
+                    low, high = min(values), max(values)
+                    if low < min_[head]:
+                        min_[head] = low
+                    if high > max_[head]:
+                        max_[head] = high
+                    last[head] = values[-1]
+                    sum_[head] += total
+                    samples[head] += len(values)
+
+            a = b
+
+    def _merge(self, other, j):
+        # Adds bucket j of other, newer than anything here but perhaps
+        # sharing a start with the newest bucket
+        head = self._bucket(other._starts[j])
+        if head is None:
+            return
+
+        for (min_, max_, last, sum_, samples), source in zip(self._arrays, other._arrays):
+            other_min, other_max, other_last, other_sum, other_samples = source
+            if not other_samples[j]:
+                continue
+
+            if other_min[j] < min_[head]:
+                min_[head] = other_min[j]
+            if other_max[j] > max_[head]:
+                max_[head] = other_max[j]
+            last[head] = other_last[j]
+            sum_[head] += other_sum[j]
+            samples[head] += other_samples[j]
+
+    def query(self, field, start=None, end=None):
+        # Returns the buckets starting in [start, end) that have a value for
+        # field, oldest first, as Aggregates
+        starts = _Starts(self)
+        first = 0 if start is None else bisect.bisect_left(
+            starts, start - start % self.resolution)
+        last = self._count if end is None else bisect.bisect_left(starts, end)
+
+        aggregates = []
+        for i in range(first, last):
+            j = self._index(i)
+            samples = self._samples[field][j]
+            if not samples:
+                continue
+
+            aggregates.append(Aggregate(self._starts[j], self._min[field][j],
+                                        self._max[field][j], self._sum[field][j] / samples,
+                                        self._last[field][j]))
+
+        return aggregates
+
+class Rollups(object):
+    def __init__(self, resolutions=RESOLUTIONS):
+        self.resolutions = sorted(resolutions)
+        self.rollups = [Rollup(resolution, capacity) for resolution, capacity in self.resolutions]
+
+        self._lock = threading.Lock()
+
+    def append(self, observation):
+        timestamp = observation.timestamp
+        values = observation[1:]
+
+        with self._lock:
+            for rollup in self.rollups:
+                rollup.add(timestamp, values)
+
+    def seed(self, scan, until):
+        # Rolls up the samples before until, from scan(start, end), which
+        # yields (timestamps, columns) segments in time order, e.g.
+        # Archive.scan. Samples appended meanwhile, from until on, are kept.
+        seeded = Rollups(self.resolutions)
+        windows = [until - rollup.resolution * rollup.capacity for rollup in seeded.rollups]
+
+        for timestamps, columns in scan(min(windows), until):
+            for rollup, since in zip(seeded.rollups, windows):
+                rollup.add_block(timestamps, columns, since)
+
+        with self._lock:
+            merged = []
+            for old, live in zip(seeded.rollups, self.rollups):
+                rollup = Rollup(live.resolution, live.capacity)
+                for source in (old, live):
+                    for i in range(source._count):
+                        rollup._merge(source, source._index(i))
+                merged.append(rollup)
+
+            self.rollups = merged
+
+    def choose(self, start, end, points):
+        # Returns the coarsest Rollup with at least points buckets between
+        # start and end, or the finest if none has
+        for rollup in reversed(self.rollups):
+            if (end - start) / rollup.resolution >= points:
+                return rollup
+
+        return self.rollups[0]
+
+    def query(self, field, start, end, points=100):
+        # Returns (resolution, Aggregates) for field between start and end
+        if field not in FIELDS:
+            raise KeyError(field)
+
+        with self._lock:
+            rollup = self.choose(start, end, points)
+            return rollup.resolution, rollup.query(field, start, end)
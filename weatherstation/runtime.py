@@ -0,0 +1,150 @@
+# Copyright (c) 2016 Joseph Kogut
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Single event loop runtime for the station.
+#
+# Instead of a thread per component, the daemon's scheduled jobs, the LED and
+# relay controllers and the web server all run on one asyncio event loop.
+# The loop only wakes for a due job, a controller command or network I/O.
+# Calls that block on I2C or GPIO are handed to a small thread pool, and run
+# one at a time per component, so the loop itself never blocks.
+
+import asyncio
+import logging
+import signal
+from concurrent.futures import ThreadPoolExecutor
+
+from weatherstation.httpserver import WSGIServer
+
+class Runtime(object):
+    def __init__(self, daemon, controllers=(), load_app=None, host='0.0.0.0', port=5000,
+                 executor_workers=2, web_workers=2, server_options=None):
+        # load_app returns the WSGI application to serve, and a dict of
+        # stream handlers for WSGIServer. It is called in the executor once
+        # the other components are running, so importing the web framework
+        # does not delay the first sample.
+        #
+        # web_workers: threads that run the web application, 0 runs it on the
+        # event loop thread
+        # server_options: keyword arguments for WSGIServer, e.g. timeouts
+        self.logger = logging.getLogger('.' + self.__class__.__name__)
+
+        self.daemon = daemon
+        self.controllers = list(controllers)
+        self.load_app = load_app
+        self.host = host
+        self.port = port
+
+        self.loop = asyncio.new_event_loop()
+        self.executor = ThreadPoolExecutor(max_workers=executor_workers)
+        self.web_executor = ThreadPoolExecutor(max_workers=web_workers) if web_workers else None
+        self.server_options = server_options or {}
+        self.server = None
+
+        self._stopped = None
+        self._tasks = []
+
+    def _waker(self, event):
+        # Returns a callback, safe to call from any thread, that sets event
+        def wake():
+            self.loop.call_soon_threadsafe(event.set)
+        return wake
+
+    async def _wait(self, event, timeout):
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        event.clear()
+
+    async def run_scheduler(self, scheduler):
+        changed = asyncio.Event()
+        scheduler.on_change = self._waker(changed)
+
+        while scheduler.running:
+            for job in scheduler.pop_due():
+                await self.loop.run_in_executor(self.executor, scheduler.run_job, job)
+
+            deadline = scheduler.next_deadline()
+            timeout = None if deadline is None else max(0, scheduler.timeout(deadline))
+            await self._wait(changed, timeout)
+
+    async def run_controller(self, controller):
+        changed = asyncio.Event()
+        controller.on_change = self._waker(changed)
+
+        while controller.running:
+            timeout = await self.loop.run_in_executor(self.executor, controller._update)
+            await self._wait(changed, timeout)
+
+    async def _main(self):
+        self._stopped = asyncio.Event()
+
+        # Uploads block on the network for up to the upload timeout, so they
+        # get a thread of their own rather than a shared executor worker
+        self.daemon.publisher.start()
+
+        self._tasks = [self.loop.create_task(self.run_scheduler(self.daemon.scheduler)),
+                       self.loop.create_task(self.daemon.network.run_async())]
+        self._tasks.extend(self.loop.create_task(self.run_controller(controller))
+                           for controller in self.controllers)
+
+        if self.load_app is not None:
+            app, streams = await self.loop.run_in_executor(self.executor, self.load_app)
+            self.server = WSGIServer(app, self.host, self.port, executor=self.web_executor,
+                                     loop=self.loop, streams=streams, **self.server_options)
+            await self.server.start()
+
+        await self._stopped.wait()
+
+        if self.server is not None:
+            await self.server.stop()
+
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+    def stop(self):
+        # Safe to call from any thread, or from a signal handler
+        self.daemon.running = False
+        self.daemon.scheduler.running = False
+        self.daemon.network.running = False
+        for controller in self.controllers:
+            controller.running = False
+
+        if self._stopped is not None:
+            self.loop.call_soon_threadsafe(self._stopped.set)
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                self.loop.add_signal_handler(signum, self.stop)
+            except (NotImplementedError, RuntimeError):
+                pass
+
+        try:
+            self.loop.run_until_complete(self._main())
+        finally:
+            self.executor.shutdown(wait=True)
+            if self.web_executor is not None:
+                self.web_executor.shutdown(wait=True)
+            self.loop.close()
@@ -0,0 +1,209 @@
+# Copyright (c) 2016 Joseph Kogut
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Deadline scheduler for periodic jobs.
+#
+# Jobs are kept in a heap ordered by their next deadline. run() sleeps until
+# the earliest deadline, runs every job that is due, and reschedules each one
+# a full interval later. Adding or removing a job wakes the loop, so jobs can
+# be changed at runtime from any thread.
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+from weatherstation import metrics
+
+JOB_SECONDS = metrics.histogram('job_seconds', 'Time per scheduled job run, by job', ['job'])
+JOB_FAILURES = metrics.counter('job_failures', 'Scheduled job runs that raised, by job',
+                               ['job'])
+
+class Clock(object):
+    # Wall clock and monotonic time, running speed times faster than real
+    # time, so a simulated station can cover a day in minutes
+    def __init__(self, speed=1.0):
+        self.speed = speed
+
+        self._start = time.monotonic()
+        self._wall_start = time.time()
+
+    def _elapsed(self):
+        return (time.monotonic() - self._start) * self.speed
+
+    # At real speed, these are time.monotonic() and time.time() exactly, so
+    # the wall clock still follows NTP adjustments
+
+    def monotonic(self):
+        if self.speed == 1:
+            return time.monotonic()
+        return self._start + self._elapsed()
+
+    def time(self):
+        if self.speed == 1:
+            return time.time()
+        return self._wall_start + self._elapsed()
+
+class Job(object):
+    def __init__(self, name, interval, func, deadline):
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self.deadline = deadline
+        self.cancelled = False
+
+    def __repr__(self):
+        return 'Job({!r}, interval={})'.format(self.name, self.interval)
+
+class Scheduler(object):
+    def __init__(self, clock=time.monotonic, speed=1.0):
+        # speed: seconds of clock time per real second
+        self.logger = logging.getLogger('.' + self.__class__.__name__)
+
+        self.clock = clock
+        self.speed = speed
+        self.running = True
+
+        self._heap = []
+        self._jobs = {}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+        # Called after the jobs change, for loops that wait on something
+        # other than wait(), such as an asyncio event loop
+        self.on_change = None
+
+        # Told about every job run, see tracer.Tracer
+        self.tracer = None
+
+    def _changed(self):
+        self._cond.notify()
+        if self.on_change is not None:
+            self.on_change()
+
+    def _push(self, job):
+        heapq.heappush(self._heap, (job.deadline, next(self._seq), job))
+
+    def add(self, name, interval, func, delay=0):
+        # Schedules func to run every interval seconds, first after delay
+        #
+        # Replaces any job already scheduled under the same name.
+        with self._cond:
+            if name in self._jobs:
+                self._jobs[name].cancelled = True
+
+            job = Job(name, interval, func, self.clock() + delay)
+            self._jobs[name] = job
+            self._push(job)
+            self._changed()
+
+        return job
+
+    def remove(self, name):
+        with self._cond:
+            job = self._jobs.pop(name)
+            job.cancelled = True
+            self._changed()
+
+    def jobs(self):
+        with self._cond:
+            return list(self._jobs.values())
+
+    def next_deadline(self):
+        # Returns the earliest deadline, or None if nothing is scheduled
+        with self._cond:
+            while self._heap and self._heap[0][2].cancelled:
+                heapq.heappop(self._heap)
+
+            return self._heap[0][0] if self._heap else None
+
+    def timeout(self, deadline):
+        # Real seconds until deadline
+        return (deadline - self.clock()) / self.speed
+
+    def pop_due(self):
+        # Removes and returns the jobs that are due, rescheduling each one
+        due = []
+        now = self.clock()
+
+        with self._cond:
+            while self._heap and self._heap[0][0] <= now:
+                deadline, _, job = heapq.heappop(self._heap)
+                if job.cancelled:
+                    continue
+
+                due.append(job)
+
+                # Keep the job's phase, but never queue up missed runs
+                job.deadline = deadline + job.interval
+                if job.deadline <= now:
+                    job.deadline = now + job.interval
+                self._push(job)
+
+        return due
+
+    def run_job(self, job):
+        tracer = self.tracer
+        if tracer is not None:
+            tracer.begin(job.name)
+
+        started = time.perf_counter()
+        try:
+            job.func()
+        except Exception:
+            JOB_FAILURES.labels(job.name).inc()
+            self.logger.exception('Job {} failed'.format(job.name))
+        finally:
+            JOB_SECONDS.labels(job.name).observe(time.perf_counter() - started)
+            if tracer is not None:
+                tracer.end()
+
+    def run_pending(self):
+        # Runs every job that is due, returns the number of jobs run
+        due = self.pop_due()
+        for job in due:
+            self.run_job(job)
+
+        return len(due)
+
+    def wait(self):
+        # Sleeps until the next deadline, a change to the jobs, or stop()
+        with self._cond:
+            deadline = self.next_deadline()
+            if not self.running:
+                return
+
+            if deadline is None:
+                self._cond.wait()
+            else:
+                timeout = self.timeout(deadline)
+                if timeout > 0:
+                    self._cond.wait(timeout)
+
+    def run(self):
+        while self.running:
+            self.run_pending()
+            self.wait()
+
+    def stop(self):
+        with self._cond:
+            self.running = False
+            self._changed()
@@ -19,7 +19,6 @@
 '''
 
 import time
-from Adafruit_I2C import Adafruit_I2C
  
 # COMMANDS
 SI1145_PARAM_QUERY = 0x80
@@ -148,8 +147,12 @@ class DeviceNotFoundError(Exception):
     pass
 
 class SI1145():
-	def __init__(self, **kwargs):
-		self.i2c = Adafruit_I2C(SI1145_ADDR, **kwargs)
+	def __init__(self, i2c=None, **kwargs):
+		# i2c: bus to find the sensor on, the board's own by default
+		from weatherstation.bus import I2CBus, TimedDevice
+		if i2c is None:
+			i2c = I2CBus(**kwargs)
+		self.i2c = TimedDevice(i2c.device(SI1145_ADDR), 'si1145')
 		
 		id = self.read8(SI1145_REG_PARTID)
 		if (id != 0x45):
@@ -0,0 +1,426 @@
+# Copyright (c) 2016 Joseph Kogut
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Hardware-free simulation of the station's board.
+#
+# The BME280 and SI1145 are modelled at the register level, so the real
+# drivers run unchanged against them: calibration is read from the trimming
+# registers, conversions are triggered through ctrl_meas and polled through
+# status, and raw ADC values are derived from a weather model by inverting
+# the compensation formulas. Every bus transaction can be given a latency.
+# GPIO pins record what was written to them.
+#
+# Weather comes from a diurnal model, or from a script of keyframes that is
+# interpolated and looped. Both are functions of the simulation clock, which
+# can run faster than real time, so a day of samples takes minutes.
+
+import csv
+import logging
+import math
+import random
+import struct
+import threading
+import time
+
+from weatherstation import bme280, si1145
+from weatherstation.scheduler import Clock
+
+# Datasheet example trimming, with typical humidity trimming
+SIM_CALIBRATION = bme280.BME280Calibration(
+    dig_T1=27504, dig_T2=26435, dig_T3=-1000,
+    dig_P1=36477, dig_P2=-10685, dig_P3=3024, dig_P4=2855, dig_P5=140,
+    dig_P6=-7, dig_P7=15500, dig_P8=-14600, dig_P9=6000,
+    dig_H1=75, dig_H2=362, dig_H3=0, dig_H4=313, dig_H5=50, dig_H6=30)
+
+SECONDS_PER_DAY = 86400
+
+class SimulationError(Exception):
+    pass
+
+class Diurnal(object):
+    # Daily cycle: temperature and UV peak in the afternoon, humidity is
+    # lowest then, pressure follows a slow semidiurnal tide
+    def __init__(self, tempc=15.0, temp_swing=6.0, barom_kPa=101.325, barom_swing=0.1,
+                 humidity_pct=60.0, humidity_swing=20.0, uv_max=8.0, peak_hour=15):
+        # Arguments are daily means and half the daily swing; peak_hour is
+        # in UTC
+        self.tempc = tempc
+        self.temp_swing = temp_swing
+        self.barom_kPa = barom_kPa
+        self.barom_swing = barom_swing
+        self.humidity_pct = humidity_pct
+        self.humidity_swing = humidity_swing
+        self.uv_max = uv_max
+        self.peak_hour = peak_hour
+
+    def at(self, timestamp):
+        # Returns (tempc, barom_kPa, humidity_pct, uv) at timestamp
+        day = 2 * math.pi * (timestamp - self.peak_hour * 3600) / SECONDS_PER_DAY
+        warmth = math.cos(day)
+
+        # Sun is up for the 12 hours around noon, three hours before the peak
+        sun = math.cos(day + 2 * math.pi * 3 / 24)
+
+        return (self.tempc + self.temp_swing * warmth,
+                self.barom_kPa + self.barom_swing * math.cos(2 * day),
+                self.humidity_pct - self.humidity_swing * warmth,
+                self.uv_max * max(0.0, sun))
+
+class Scripted(object):
+    # Keyframes of (seconds, tempc, barom_kPa, humidity_pct, uv), linearly
+    # interpolated and repeated once the last keyframe is reached
+    def __init__(self, keyframes, start=None):
+        # start: timestamp of the first keyframe, the first call to at() by
+        # default
+        self.keyframes = sorted(keyframes)
+        if len(self.keyframes) < 2:
+            raise SimulationError('A weather script needs at least two keyframes')
+
+        self.start = start
+        self.period = self.keyframes[-1][0] - self.keyframes[0][0]
+
+    def at(self, timestamp):
+        if self.start is None:
+            self.start = timestamp
+
+        offset = self.keyframes[0][0] + (timestamp - self.start) % self.period
+        for before, after in zip(self.keyframes, self.keyframes[1:]):
+            if offset <= after[0]:
+                break
+
+        fraction = (offset - before[0]) / ((after[0] - before[0]) or 1)
+        return tuple(a + (b - a) * fraction for a, b in zip(before[1:], after[1:]))
+
+def load_script(path):
+    # Reads a CSV weather script, with a header naming the columns seconds,
+    # tempc, barom_kPa, humidity_pct and uv
+    columns = ('seconds', 'tempc', 'barom_kPa', 'humidity_pct', 'uv')
+
+    with open(path, newline='') as f:
+        try:
+            return Scripted([tuple(float(row[column]) for column in columns)
+                             for row in csv.DictReader(f)])
+        except (KeyError, ValueError) as e:
+            raise SimulationError('Bad weather script {}: {}'.format(path, e))
+
+class Noisy(object):
+    # Adds reproducible Gaussian noise to another weather model
+    def __init__(self, weather, scale=0.05, seed=0):
+        # scale: standard deviation, as a fraction of each field's unit
+        self.weather = weather
+        self.scale = scale
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def at(self, timestamp):
+        with self._lock:
+            noise = [self._random.gauss(0, self.scale) for _ in range(4)]
+
+        tempc, barom_kPa, humidity_pct, uv = self.weather.at(timestamp)
+        return (tempc + noise[0], barom_kPa + noise[1] / 10, humidity_pct + noise[2],
+                max(0.0, uv + noise[3]))
+
+class SimChip(object):
+    # 256 byte register file. Reads and writes auto-increment, as on the
+    # real parts; subclasses hook the registers with side effects.
+    def __init__(self):
+        self.registers = bytearray(256)
+
+    def read(self, register, length):
+        return list(self.registers[register:register + length])
+
+    def write(self, register, value):
+        self.registers[register] = value & 0xFF
+
+class SimBME280(SimChip):
+    chip_id = 0x60
+
+    def __init__(self, weather, clock, calibration=SIM_CALIBRATION):
+        super().__init__()
+
+        self.weather = weather
+        self.clock = clock
+        self.calibration = calibration
+
+        # Data registers for the conversion in progress, and when it ends,
+        # in real time
+        self._pending = None
+        self._busy_until = 0
+
+        cal = calibration
+        block1 = struct.pack('<HhhHhhhhhhhh', *cal[:12]) + bytes([0, cal.dig_H1])
+        block2 = struct.pack('<hBbBbb', cal.dig_H2, cal.dig_H3, cal.dig_H4 >> 4,
+                             (cal.dig_H4 & 0x0F) | (cal.dig_H5 & 0x0F) << 4,
+                             cal.dig_H5 >> 4, cal.dig_H6)
+        self.registers[bme280.BME280_REGISTER_DIG_T1:bme280.BME280_REGISTER_DIG_T1 +
+                       len(block1)] = block1
+        self.registers[bme280.BME280_REGISTER_DIG_H2:bme280.BME280_REGISTER_DIG_H2 +
+                       len(block2)] = block2
+        self.registers[bme280.BME280_REGISTER_CHIPID] = self.chip_id
+
+    def _oversampling(self):
+        # Oversampling ratios for temperature, pressure and humidity, 0 if
+        # the measurement is skipped
+        ctrl_meas = self.registers[bme280.BME280_REGISTER_CONTROL]
+        codes = (ctrl_meas >> 5, ctrl_meas >> 2 & 0x07,
+                 self.registers[bme280.BME280_REGISTER_CONTROL_HUM] & 0x07)
+        return [0 if code == 0 else 1 << min(code - 1, 4) for code in codes]
+
+    def measurement_time(self):
+        # Datasheet typical conversion time, in seconds
+        osr_t, osr_p, osr_h = self._oversampling()
+        ms = 1.0 + 2.0 * osr_t
+        if osr_p:
+            ms += 2.0 * osr_p + 0.5
+        if osr_h:
+            ms += 2.0 * osr_h + 0.5
+        return ms / 1000.0
+
+    def _convert(self):
+        # Returns the data registers, 0xF7..0xFE, for the current weather
+        tempc, barom_kPa, humidity_pct, _ = self.weather.at(self.clock.time())
+        osr_t, osr_p, osr_h = self._oversampling()
+        cal = self.calibration
+
+        adc_t = _invert(lambda adc: bme280.compensate_temperature(adc, cal)[0], tempc, 0xFFFFF)
+        t_fine = bme280.compensate_temperature(adc_t, cal)[1]
+        adc_p = _invert(lambda adc: -bme280.compensate_pressure(adc, t_fine, cal),
+                        -barom_kPa * 1000, 0xFFFFF)
+        adc_h = _invert(lambda adc: bme280.compensate_humidity(adc, t_fine, cal),
+                        humidity_pct, 0xFFFF)
+
+        # Skipped measurements read back as the reset value
+        adc_t = adc_t if osr_t else 0x80000
+        adc_p = adc_p if osr_p else 0x80000
+        adc_h = adc_h if osr_h else 0x8000
+
+        return bytes([adc_p >> 12 & 0xFF, adc_p >> 4 & 0xFF, adc_p << 4 & 0xF0,
+                      adc_t >> 12 & 0xFF, adc_t >> 4 & 0xFF, adc_t << 4 & 0xF0,
+                      adc_h >> 8, adc_h & 0xFF])
+
+    def _settle(self):
+        # Publishes a finished conversion, and drops back to sleep after a
+        # forced one
+        if self._pending is not None and time.monotonic() >= self._busy_until:
+            start = bme280.BME280_REGISTER_PRESSURE_DATA
+            self.registers[start:start + 8] = self._pending
+            self._pending = None
+            self.registers[bme280.BME280_REGISTER_CONTROL] &= 0xFC
+
+    def read(self, register, length):
+        self._settle()
+
+        mode = self.registers[bme280.BME280_REGISTER_CONTROL] & 0x03
+        start = bme280.BME280_REGISTER_PRESSURE_DATA
+        if mode == bme280.BME280_NORMAL_MODE and register < start + 8 and \
+                register + length > start:
+            self.registers[start:start + 8] = self._convert()
+
+        if register <= bme280.BME280_REGISTER_STATUS < register + length:
+            measuring = time.monotonic() < self._busy_until
+            self.registers[bme280.BME280_REGISTER_STATUS] = \
+                bme280.BME280_STATUS_MEASURING if measuring else 0
+
+        return super().read(register, length)
+
+    def write(self, register, value):
+        if register == bme280.BME280_REGISTER_SOFTRESET:
+            if value == 0xB6:
+                self.registers[bme280.BME280_REGISTER_CONTROL_HUM:
+                               bme280.BME280_REGISTER_CONFIG + 1] = bytes(4)
+                self._pending = None
+            return
+
+        super().write(register, value)
+
+        if register == bme280.BME280_REGISTER_CONTROL and value & 0x03 in (1, 2):
+            self._pending = self._convert()
+            self._busy_until = time.monotonic() + self.measurement_time()
+
+class SimSI1145(SimChip):
+    def __init__(self, weather, clock):
+        super().__init__()
+
+        self.weather = weather
+        self.clock = clock
+
+        self.parameters = bytearray(32)
+        self.registers[si1145.SI1145_REG_PARTID] = 0x45
+
+    def read(self, register, length):
+        if register <= si1145.SI1145_REG_UVINDEX1 and \
+                register + length > si1145.SI1145_REG_ALSVISDATA0:
+            # Visible, IR and proximity, the unused PS2 and PS3, then the UV
+            # index times 100. Light counts over the dark offset grow with UV.
+            uv = self.weather.at(self.clock.time())[3]
+            struct.pack_into('<HHHxxxxH', self.registers, si1145.SI1145_REG_ALSVISDATA0,
+                             260 + int(uv * 250), 250 + int(uv * 500), 0,
+                             min(0xFFFF, int(round(uv * 100))))
+
+        return super().read(register, length)
+
+    def write(self, register, value):
+        super().write(register, value)
+
+        if register != si1145.SI1145_REG_COMMAND:
+            return
+
+        parameter = value & 0x1F
+        if value & 0xE0 == si1145.SI1145_PARAM_SET:
+            self.parameters[parameter] = self.registers[si1145.SI1145_REG_PARAMWR]
+            self.registers[si1145.SI1145_REG_PARAMRD] = self.parameters[parameter]
+        elif value & 0xE0 == si1145.SI1145_PARAM_QUERY:
+            self.registers[si1145.SI1145_REG_PARAMRD] = self.parameters[parameter]
+        elif value == si1145.SI1145_RESET:
+            self.parameters[:] = bytes(32)
+
+def _invert(compensate, target, maximum):
+    # Smallest ADC value in [0, maximum] that compensate() maps to target or
+    # above; compensate must be non-decreasing
+    low, high = 0, maximum
+    while low < high:
+        middle = (low + high) // 2
+        if compensate(middle) < target:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+class SimI2CDevice(object):
+    # The Adafruit_I2C interface, over a simulated chip
+    def __init__(self, bus, address, chip):
+        self.bus = bus
+        self.address = address
+        self.chip = chip
+
+    def readList(self, reg, length):
+        return self.bus.transfer(self.chip.read, reg, length)
+
+    def readU8(self, reg):
+        return self.readList(reg, 1)[0]
+
+    def readS8(self, reg):
+        value = self.readU8(reg)
+        return value - 256 if value > 127 else value
+
+    def readU16(self, reg, little_endian=True):
+        low, high = self.readList(reg, 2)
+        return low | high << 8 if little_endian else low << 8 | high
+
+    def write8(self, reg, value):
+        self.bus.transfer(self.chip.write, reg, value)
+
+class SimI2CBus(object):
+    # The chips' trimming values are made up, and must never be cached as
+    # those of the real chips at the same addresses
+    simulated = True
+
+    def __init__(self, latency=0):
+        # latency: seconds each transaction takes
+        self.latency = latency
+        self.transactions = 0
+
+        self._chips = {}
+        self._lock = threading.Lock()
+
+    def attach(self, address, chip):
+        self._chips[address] = chip
+
+    def device(self, address):
+        if address not in self._chips:
+            # What Adafruit_I2C gets for an address nothing answers on
+            raise OSError(121, 'Remote I/O error')
+
+        return SimI2CDevice(self, address, self._chips[address])
+
+    def transfer(self, operation, *args):
+        # One transaction at a time, as on a real bus
+        with self._lock:
+            self.transactions += 1
+            if self.latency:
+                time.sleep(self.latency)
+            return operation(*args)
+
+class SimPin(object):
+    def __init__(self, number, direction):
+        self.number = number
+        self.direction = direction
+        self.value = False
+        self.writes = 0
+        self.closed = False
+
+    def read(self):
+        return self.value
+
+    def write(self, value):
+        self.value = bool(value)
+        self.writes += 1
+
+    def close(self):
+        self.closed = True
+
+class SimGPIOBank(object):
+    def __init__(self):
+        self.pins = {}
+
+    def pin(self, number, direction):
+        self.pins[number] = SimPin(number, direction)
+        return self.pins[number]
+
+class Simulation(object):
+    def __init__(self, weather=None, speed=1.0, latency=0):
+        # weather: a model with at(timestamp), Diurnal() by default
+        # speed: simulated seconds per real second
+        # latency: seconds each I2C transaction takes
+        self.logger = logging.getLogger('.' + self.__class__.__name__)
+
+        self.clock = Clock(speed)
+        self.weather = weather if weather is not None else Diurnal()
+
+        self.i2c = SimI2CBus(latency)
+        self.i2c.attach(bme280.BME280_I2CADDR, SimBME280(self.weather, self.clock))
+        self.i2c.attach(si1145.SI1145_ADDR, SimSI1145(self.weather, self.clock))
+
+        self.gpio = SimGPIOBank()
+
+        self.logger.info('Simulating the board at {}x speed'.format(speed))
+
+def load_simulation(config):
+    # Returns a Simulation configured by the [sim] section, or None if the
+    # station runs on real hardware
+    if not config.getboolean('sim', 'enabled', fallback=False):
+        return None
+
+    script = config.get('sim', 'script', fallback=None)
+    weather = load_script(script) if script else Diurnal()
+
+    noise = config.getfloat('sim', 'noise', fallback=0.05)
+    if noise:
+        weather = Noisy(weather, noise, config.getint('sim', 'seed', fallback=0))
+
+    speed = config.getfloat('sim', 'speed', fallback=1)
+    if config.getboolean('sim', 'real_outputs', fallback=False) and speed != 1:
+        # Sped up timestamps run ahead of the real clock
+        raise SimulationError('real_outputs needs speed = 1')
+
+    return Simulation(weather, speed=speed,
+                      latency=config.getfloat('sim', 'i2c_latency', fallback=0))
@@ -0,0 +1,160 @@
+# Copyright (c) 2016 Joseph Kogut
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Durable store-and-forward queues for observations awaiting upload.
+#
+# Observations are appended to an SQLite database in WAL mode and removed once
+# they have been uploaded, so nothing is lost while the network is down or the
+# daemon restarts. Each sink has its own queue, a table in the one database.
+# All queues share a single connection, so writes from every sink are grouped
+# into the same transactions, committed every commit_count changes or
+# commit_interval seconds, whichever comes first. Each commit costs one fsync
+# of the WAL, which keeps writes to the SD card down at rapidfire sample
+# rates.
+#
+# Delivery is at least once: an upload acknowledged after the last commit is
+# sent again after a crash.
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from weatherstation.observation import Observation
+
+class Spool(object):
+    def __init__(self, path=':memory:', max_records=100000, commit_interval=60,
+                 commit_count=20, clock=time.monotonic):
+        # Arguments:
+        # max_records: per queue, oldest observations are dropped beyond this
+        self.logger = logging.getLogger('.' + self.__class__.__name__)
+
+        self.path = path
+        self.max_records = max_records
+        self.commit_interval = commit_interval
+        self.commit_count = commit_count
+        self.clock = clock
+
+        self._lock = threading.RLock()
+
+        if path != ':memory:' and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Transactions are managed by hand, see _write
+        self._db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=FULL')
+
+        self._pending = 0
+        self._last_commit = self.clock()
+
+    def queue(self, name):
+        # Returns the SpoolQueue called name, creating it if needed
+        return SpoolQueue(self, name)
+
+    def _write(self, sql, parameters=()):
+        if not self._db.in_transaction:
+            self._db.execute('BEGIN')
+
+        cursor = self._db.execute(sql, parameters)
+        self._pending += 1
+
+        if (self._pending >= self.commit_count or
+                self.clock() - self._last_commit >= self.commit_interval):
+            self._commit()
+
+        return cursor
+
+    def _commit(self):
+        if self._db.in_transaction:
+            self._db.execute('COMMIT')
+
+        self._pending = 0
+        self._last_commit = self.clock()
+
+    def flush(self):
+        with self._lock:
+            self._commit()
+
+    def close(self):
+        with self._lock:
+            self._commit()
+            self._db.close()
+
+class SpoolQueue(object):
+    def __init__(self, spool, name):
+        if not name.isidentifier():
+            raise ValueError('Invalid spool queue name: {!r}'.format(name))
+
+        self.logger = logging.getLogger('.' + self.__class__.__name__)
+
+        self.spool = spool
+        self.name = name
+
+        with spool._lock:
+            self._execute(
+                'CREATE TABLE IF NOT EXISTS {table} ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp REAL, tempc REAL, '
+                'barom_kPa REAL, humidity_pct REAL, uv REAL)')
+            self._count = self._execute('SELECT COUNT(*) FROM {table}').fetchone()[0]
+
+        if self._count:
+            self.logger.info('{} observations for {} spooled from a previous run'.format(
+                self._count, name))
+
+    def __len__(self):
+        return self._count
+
+    def _execute(self, sql, parameters=()):
+        return self.spool._db.execute(sql.format(table=self.name), parameters)
+
+    def _write(self, sql, parameters=()):
+        return self.spool._write(sql.format(table=self.name), parameters)
+
+    def append(self, observation):
+        with self.spool._lock:
+            self._write('INSERT INTO {table} '
+                        '(timestamp, tempc, barom_kPa, humidity_pct, uv) VALUES (?, ?, ?, ?, ?)',
+                        tuple(observation))
+            self._count += 1
+
+            if self._count > self.spool.max_records:
+                dropped = self._count - self.spool.max_records
+                self._write('DELETE FROM {table} WHERE id IN '
+                            '(SELECT id FROM {table} ORDER BY id LIMIT ?)', (dropped,))
+                self._count -= dropped
+                self.logger.warning('Spool for {} full, dropped {} oldest observations'.format(
+                    self.name, dropped))
+
+    def peek(self, limit=1):
+        # Returns up to limit of the oldest observations, as (id, Observation)
+        with self.spool._lock:
+            rows = self._execute(
+                'SELECT id, timestamp, tempc, barom_kPa, humidity_pct, uv '
+                'FROM {table} ORDER BY id LIMIT ?', (limit,)).fetchall()
+
+        return [(row[0], Observation(*row[1:])) for row in rows]
+
+    def ack(self, id):
+        # Removes every observation up to and including id
+        with self.spool._lock:
+            removed = self._write('DELETE FROM {table} WHERE id <= ?', (id,)).rowcount
+            self._count -= removed
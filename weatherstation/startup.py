@@ -0,0 +1,62 @@
+# Copyright (c) 2016 Joseph Kogut
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Startup milestones, measured from process start.
+#
+# Each milestone is logged once, as 'Startup milestone <name>: <seconds> s',
+# so time to first sample and time to first served request can be tracked
+# from the service log or by benchmarks/startup.py.
+
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+def _process_age():
+    # Seconds since this process was started by the kernel, or None if
+    # /proc is not available
+    try:
+        with open('/proc/self/stat') as f:
+            # Field 22, starttime, counted after the parenthesized comm field
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+    except (OSError, IndexError, ValueError):
+        return None
+
+    return uptime - start_ticks / os.sysconf('SC_CLK_TCK')
+
+# Fall back to the first import of this module when /proc is unavailable
+_age = _process_age()
+_started = time.monotonic() - (_age if _age is not None else 0.0)
+
+milestones = {}
+
+def elapsed():
+    return time.monotonic() - _started
+
+def mark(name):
+    # Records the first occurrence of a milestone, returns seconds since start
+    if name not in milestones:
+        milestones[name] = elapsed()
+        logger.info('Startup milestone {}: {:.3f} s'.format(name, milestones[name]))
+
+    return milestones[name]
@@ -0,0 +1,222 @@
+# Copyright (c) 2016 Joseph Kogut
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Slow cycle tracer for the scheduler's jobs.
+#
+# While enabled, the scheduler reports the start and end of every job run.
+# A sampler thread sleeps until a run has gone over its time budget, then
+# samples that thread's stack every interval seconds until the run ends, so
+# the stacks show where a slow cycle spent its time while it was still
+# stuck. Each slow run is logged with its most common stack.
+#
+# Samples are aggregated as collapsed stacks, one 'job;frame;...;frame
+# count' line per distinct stack, the input flamegraph.pl and speedscope
+# take. Every flush_interval seconds they are appended to a rotating file.
+#
+# Disabled, begin() and end() return at once and the sampler thread waits
+# on an event. toggle() is safe to call from a signal handler.
+
+import collections
+import logging
+import logging.handlers
+import os
+import sys
+import threading
+import time
+
+# Seconds between slow run warnings, the rest are counted until the next one
+WARNING_INTERVAL = 10
+
+class Tracer(object):
+    def __init__(self, path=None, budget=0.5, interval=0.01, flush_interval=60,
+                 max_bytes=1048576, backup_count=5, enabled=False):
+        # Arguments:
+        # path: file for collapsed stacks, rotated at max_bytes, keeping
+        # backup_count old files; without one, stacks are only logged
+        # budget: seconds a job may run before its stack is sampled
+        # interval: seconds between samples of a slow job
+        self.logger = logging.getLogger('.' + self.__class__.__name__)
+
+        self.budget = budget
+        self.interval = interval
+        self.flush_interval = flush_interval
+        self.enabled = enabled
+        self.running = True
+
+        # Slow runs seen since startup, and since the last warning
+        self.slow_cycles = 0
+        self._unreported = 0
+        self._last_warning = None
+
+        self._stacks = None
+        if path:
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            except OSError as e:
+                self.logger.warning('Unable to create {}: {}'.format(path, e))
+
+            # Opened on the first flush, so tracing costs nothing until used
+            handler = logging.handlers.RotatingFileHandler(
+                path, maxBytes=max_bytes, backupCount=backup_count, delay=True)
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            self._stacks = logging.getLogger(__name__ + '.stacks')
+            self._stacks.propagate = False
+            self._stacks.setLevel(logging.INFO)
+            self._stacks.addHandler(handler)
+
+        # Runs in progress, by thread ident: (job name, start, samples)
+        self._active = {}
+        self._collapsed = collections.Counter()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._last_flush = time.monotonic()
+        self._reported = enabled
+
+    def begin(self, name):
+        if not self.enabled:
+            return
+
+        self._active[threading.get_ident()] = (name, time.perf_counter(),
+                                               collections.Counter())
+        self._wake.set()
+
+    def end(self):
+        run = self._active.pop(threading.get_ident(), None)
+        if run is None:
+            return
+
+        name, started, samples = run
+        elapsed = time.perf_counter() - started
+        if elapsed < self.budget:
+            return
+
+        self.slow_cycles += 1
+        self._unreported += 1
+
+        now = time.monotonic()
+        if self._last_warning is not None and now - self._last_warning < WARNING_INTERVAL:
+            return
+        self._last_warning = now
+
+        message = 'Job {} took {:.3f} s, over its {} s budget'.format(name, elapsed, self.budget)
+        if samples:
+            stack, count = samples.most_common(1)[0]
+            message += '; in {} of {} samples: {}'.format(count, sum(samples.values()), stack)
+        if self._unreported > 1:
+            message += ' ({} slow runs since the last warning)'.format(self._unreported)
+        self._unreported = 0
+
+        self.logger.warning(message)
+
+    def _collapse(self, name, frame):
+        frames = []
+        while frame is not None:
+            code = frame.f_code
+            frames.append('{}:{}'.format(
+                os.path.splitext(os.path.basename(code.co_filename))[0], code.co_name))
+            frame = frame.f_back
+
+        frames.append(name)
+        return ';'.join(reversed(frames))
+
+    def sample(self):
+        # Samples every run over budget, returns seconds until the next one
+        # is due, or None if nothing is running
+        now = time.perf_counter()
+        due = None
+        frames = None
+
+        for ident, (name, started, samples) in list(self._active.items()):
+            remaining = started + self.budget - now
+            if remaining > 0:
+                due = remaining if due is None else min(due, remaining)
+                continue
+
+            if frames is None:
+                frames = sys._current_frames()
+            frame = frames.get(ident)
+            if frame is not None:
+                stack = self._collapse(name, frame)
+                samples[stack] += 1
+                with self._lock:
+                    self._collapsed[stack] += 1
+
+            due = self.interval if due is None else min(due, self.interval)
+
+        return due
+
+    def flush(self):
+        # Appends the stacks collected since the last flush to the file
+        with self._lock:
+            collapsed, self._collapsed = self._collapsed, collections.Counter()
+        self._last_flush = time.monotonic()
+
+        if self._stacks is not None and collapsed:
+            self._stacks.info('\n'.join('{} {}'.format(stack, count)
+                                        for stack, count in sorted(collapsed.items())))
+
+    def run(self):
+        while self.running:
+            self._wake.clear()
+
+            # Reported here rather than by set_enabled(), which may be
+            # running in a signal handler
+            if self.enabled != self._reported:
+                self._reported = self.enabled
+                self.logger.info('Slow cycle tracing {}'.format(
+                    'enabled' if self.enabled else 'disabled'))
+
+            timeout = self.sample() if self.enabled else None
+
+            flush_in = self._last_flush + self.flush_interval - time.monotonic()
+            if flush_in <= 0:
+                self.flush()
+                flush_in = self.flush_interval
+            if self._collapsed:
+                timeout = flush_in if timeout is None else min(timeout, flush_in)
+
+            self._wake.wait(timeout)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name='Tracer', daemon=True)
+        self._thread.start()
+
+    def set_enabled(self, enabled):
+        self.enabled = enabled
+        if not enabled:
+            self._active.clear()
+        self._wake.set()
+
+    def toggle(self, *args):
+        # Usable as a signal handler
+        self.set_enabled(not self.enabled)
+
+    def status(self):
+        return {'enabled': self.enabled, 'budget': self.budget,
+                'interval': self.interval, 'slow_cycles': self.slow_cycles}
+
+    def stop(self):
+        self.running = False
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
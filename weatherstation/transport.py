@@ -0,0 +1,120 @@
+# Copyright (c) 2016 Joseph Kogut
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# HTTP transport with persistent connections.
+#
+# One keep-alive connection is kept open per scheme, host and port, so
+# repeated requests skip the DNS lookup and the TCP and TLS handshakes. A
+# request on a reused connection the server has since closed is retried once
+# on a fresh connection.
+
+import http.client
+import threading
+import time
+import urllib.parse
+
+from weatherstation import metrics
+
+REQUEST_SECONDS = metrics.histogram('http_client_request_seconds',
+                                    'Time per outgoing HTTP request, by host', ['host'])
+REQUEST_ERRORS = metrics.counter('http_client_errors',
+                                 'Outgoing HTTP requests that failed to complete, by host',
+                                 ['host'])
+
+class HTTPTransport(object):
+    user_agent = 'weatherstation'
+
+    def __init__(self, timeout=10):
+        self.timeout = timeout
+
+        self._connections = {}
+        self._lock = threading.Lock()
+
+    def _connection(self, scheme, netloc):
+        key = (scheme, netloc)
+        conn = self._connections.get(key)
+
+        if conn is None:
+            if scheme == 'https':
+                conn = http.client.HTTPSConnection(netloc, timeout=self.timeout)
+            else:
+                conn = http.client.HTTPConnection(netloc, timeout=self.timeout)
+            self._connections[key] = conn
+
+        return key, conn
+
+    def _drop(self, key):
+        conn = self._connections.pop(key, None)
+        if conn is not None:
+            conn.close()
+
+    def request(self, method, url, body=None, headers=None):
+        # Performs a request, returning (status, response body as bytes)
+        parts = urllib.parse.urlsplit(url)
+        target = urllib.parse.urlunsplit(('', '', parts.path or '/', parts.query, ''))
+
+        request_headers = {'User-Agent': self.user_agent}
+        request_headers.update(headers or {})
+
+        started = time.perf_counter()
+        try:
+            return self._request(parts, method, target, body, request_headers)
+        except Exception:
+            REQUEST_ERRORS.labels(parts.netloc).inc()
+            raise
+        finally:
+            REQUEST_SECONDS.labels(parts.netloc).observe(time.perf_counter() - started)
+
+    def _request(self, parts, method, target, body, request_headers):
+        with self._lock:
+            for attempt in range(2):
+                key, conn = self._connection(parts.scheme, parts.netloc)
+                reused = conn.sock is not None
+
+                try:
+                    conn.request(method, target, body, request_headers)
+                    response = conn.getresponse()
+                    data = response.read()
+                except (http.client.RemoteDisconnected, http.client.CannotSendRequest,
+                        BrokenPipeError, ConnectionResetError):
+                    self._drop(key)
+                    # Only a stale keep-alive connection is worth retrying
+                    if reused and attempt == 0:
+                        continue
+                    raise
+                except Exception:
+                    self._drop(key)
+                    raise
+
+                if response.will_close:
+                    self._drop(key)
+
+                return response.status, data
+
+    def get(self, url, parameters=None):
+        if parameters:
+            url = '?'.join([url, urllib.parse.urlencode(parameters)])
+
+        return self.request('GET', url)
+
+    def close(self):
+        with self._lock:
+            for key in list(self._connections):
+                self._drop(key)
@@ -0,0 +1,129 @@
+# Copyright (c) 2016 Joseph Kogut
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Unit conversions for the quantities the station reports.
+#
+# Every unit we use is an affine function of its dimension's base unit, so
+# converting between any two of them is a single multiply and add. The
+# coefficients for every pair are computed once, at import, which keeps
+# conversions on the sampling path free of lookups into a unit registry.
+# Pint is only used, when installed, to validate the table.
+
+from collections import namedtuple
+from itertools import permutations
+
+class UnitError(Exception):
+    pass
+
+# unit: (dimension, scale, offset), where base = value * scale + offset
+UNITS = {
+    'degC': ('temperature', 1.0, 0.0),
+    'degF': ('temperature', 5.0 / 9.0, -160.0 / 9.0),
+    'K':    ('temperature', 1.0, -273.15),
+
+    'Pa':   ('pressure', 1.0, 0.0),
+    'hPa':  ('pressure', 100.0, 0.0),
+    'mbar': ('pressure', 100.0, 0.0),
+    'kPa':  ('pressure', 1000.0, 0.0),
+    # inch * Hg * g_0, with Hg = 13.5951 g/cm^3, as pint defines it
+    'inHg': ('pressure', 3386.388640341, 0.0),
+    'mmHg': ('pressure', 133.322387415, 0.0),
+}
+
+class Conversion(namedtuple('Conversion', ['scale', 'offset'])):
+    __slots__ = ()
+
+    def __call__(self, value):
+        return value * self.scale + self.offset
+
+def _conversion(src, dst):
+    src_dim, src_scale, src_offset = UNITS[src]
+    dst_dim, dst_scale, dst_offset = UNITS[dst]
+
+    return Conversion(src_scale / dst_scale, (src_offset - dst_offset) / dst_scale)
+
+_conversions = {
+    (src, dst): _conversion(src, dst)
+    for src, dst in permutations(UNITS, 2)
+    if UNITS[src][0] == UNITS[dst][0]
+}
+
+def conversion(src, dst):
+    # Returns the Conversion from unit src to unit dst
+    if src == dst and src in UNITS:
+        return Conversion(1.0, 0.0)
+
+    try:
+        return _conversions[(src, dst)]
+    except KeyError:
+        raise UnitError('Cannot convert {} to {}'.format(src, dst))
+
+def convert(value, src, dst):
+    return conversion(src, dst)(value)
+
+# Conversions used on the sampling path
+DEGC_TO_DEGF = conversion('degC', 'degF')
+DEGF_TO_DEGC = conversion('degF', 'degC')
+KPA_TO_INHG = conversion('kPa', 'inHg')
+INHG_TO_KPA = conversion('inHg', 'kPa')
+KPA_TO_HPA = conversion('kPa', 'hPa')
+HPA_TO_KPA = conversion('hPa', 'kPa')
+
+_registry = None
+
+def get_registry():
+    # Returns the process-wide pint UnitRegistry, creating it on first use.
+    # Building a registry parses pint's whole definitions file, so it is
+    # never done at import time, or more than once.
+    global _registry
+
+    if _registry is None:
+        import pint
+        _registry = pint.UnitRegistry()
+
+    return _registry
+
+def validate(ureg=None, value=123.456, rel_tol=1e-9):
+    # Checks every conversion in the table against pint
+    #
+    # Arguments:
+    # ureg: pint UnitRegistry to check against, default is the shared registry
+    #
+    # Returns a list of (src, dst, ours, pint's) for each disagreement
+    if ureg is None:
+        ureg = get_registry()
+
+    mismatches = []
+    for (src, dst), conv in sorted(_conversions.items()):
+        ours = conv(value)
+        theirs = ureg.Quantity(value, src).to(dst).magnitude
+
+        if abs(ours - theirs) > rel_tol * max(abs(ours), abs(theirs), 1.0):
+            mismatches.append((src, dst, ours, theirs))
+
+    return mismatches
+
+if __name__ == '__main__':
+    mismatches = validate()
+    for mismatch in mismatches:
+        print('{} -> {}: {} != {}'.format(*mismatch))
+
+    print('{} conversions checked, {} mismatches'.format(
+        len(_conversions), len(mismatches)))
@@ -0,0 +1,230 @@
+# Copyright (c) 2016 Joseph Kogut
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Background upload workers.
+#
+# The sampling job hands each observation to submit(), which only appends it
+# to an in-memory queue, so a slow or unreachable sink never holds up
+# sampling. Each Uploader drives one Publisher from its own thread: it moves
+# queued observations into the sink's spool and publishes the backlog oldest
+# first, at most batch observations every interval seconds. Failed batches
+# are retried after an exponential backoff with jitter, so stations that
+# lost the network together don't all retry at once.
+#
+# For a realtime publisher only the newest observation is worth sending: the
+# queue holds a single observation, each submit() replaces it, and nothing
+# is spooled.
+#
+# FanOut submits each observation to several uploaders. Observations are
+# immutable, so every sink shares the same one.
+
+import collections
+import http.client
+import logging
+import random
+import threading
+import time
+
+from weatherstation import metrics
+from weatherstation.publish import PublishError, PublishRejected
+
+PUBLISH_SECONDS = metrics.histogram('publish_seconds', 'Time per publish, by sink', ['sink'])
+PUBLISHES = metrics.counter('publishes',
+                            'Publishes by sink and result: ok, rejected or failed',
+                            ['sink', 'result'])
+
+class Uploader(object):
+    def __init__(self, publisher, spool=None, online=None, queue_size=100, batch=5,
+                 interval=2, retry_base=5, retry_max=300, clock=time.monotonic):
+        # Arguments:
+        # spool: SpoolQueue for the backlog, unused by realtime publishers
+        # online: returns whether the network is up, uploads wait while it isn't
+        # queue_size: observations held for the worker, the oldest are dropped
+        # beyond this
+        # batch: observations per publish, unless the publisher sets its own
+        self.logger = logging.getLogger('.' + self.__class__.__name__)
+
+        self.publisher = publisher
+        self.spool = spool
+        self.online = online if online is not None else lambda: True
+        self.realtime = publisher.realtime
+        self.batch = publisher.batch or batch
+        self.interval = interval
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.clock = clock
+
+        self.running = True
+        self.failures = 0
+        self.last_upload = None
+
+        self._seconds = PUBLISH_SECONDS.labels(publisher.name)
+        self._results = {result: PUBLISHES.labels(publisher.name, result)
+                         for result in ('ok', 'rejected', 'failed')}
+
+        self._queue = collections.deque(maxlen=1 if self.realtime else queue_size)
+        self._retry_at = None
+        self._wake = threading.Event()
+        self._thread = None
+
+    def submit(self, observation):
+        # Queues an observation for upload, never blocks
+        self._queue.append(observation)
+        self._wake.set()
+
+    def wake(self):
+        # Retries right away, e.g. once the network is back
+        self._retry_at = None
+        self._wake.set()
+
+    def backoff(self):
+        # Seconds to wait after the latest failure: half the exponential
+        # delay, plus up to as much again at random
+        delay = min(self.retry_max, self.retry_base * 2 ** (self.failures - 1))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def _publish(self, observations):
+        # Returns how many observations, from the front of the batch, are
+        # done with, published or rejected. A failure also sets _retry_at.
+        started = time.perf_counter()
+        try:
+            self.publisher.publish(observations)
+        except PublishRejected as e:
+            self._results['rejected'].inc()
+            # The sink saw it and said no, sending it again won't help
+            if e.delivered is None:
+                self.logger.warning('{} rejected {} observations from {}: {}'.format(
+                    self.publisher.name, len(observations), observations[0].dateutc, e))
+                return len(observations)
+
+            self.logger.warning('{} rejected the observation from {}: {}'.format(
+                self.publisher.name, observations[e.delivered].dateutc, e))
+            return e.delivered + 1
+        except (OSError, http.client.HTTPException, PublishError) as e:
+            self._results['failed'].inc()
+            self.failures += 1
+            delay = self.backoff()
+            self._retry_at = self.clock() + delay
+            self.logger.warning('Publishing to {} failed, retrying in {:.0f} s: {}'.format(
+                self.publisher.name, delay, e))
+            return getattr(e, 'delivered', 0)
+        finally:
+            self._seconds.observe(time.perf_counter() - started)
+
+        self._results['ok'].inc()
+        self.failures = 0
+        self.last_upload = time.time()
+        return len(observations)
+
+    def process(self):
+        # Publishes what is due, returns the seconds until it should be
+        # called again, or None to wait for the next submit() or wake()
+        if self.realtime:
+            pending = [self._queue[-1]] if self._queue else []
+        else:
+            while self._queue:
+                self.spool.append(self._queue.popleft())
+            pending = self.spool.peek(self.batch)
+
+        if not pending or not self.online():
+            return None
+
+        if self._retry_at is not None:
+            remaining = self._retry_at - self.clock()
+            if remaining > 0:
+                return remaining
+            self._retry_at = None
+
+        if self.realtime:
+            if not self._publish(pending):
+                return self._retry_at - self.clock()
+
+            # Unless a newer one arrived meanwhile
+            if self._queue and self._queue[-1] is pending[0]:
+                self._queue.clear()
+            return None
+
+        done = self._publish([observation for _, observation in pending])
+        if done:
+            self.spool.ack(pending[done - 1][0])
+
+        if self._retry_at is not None:
+            return self._retry_at - self.clock()
+
+        return self.interval if len(self.spool) else None
+
+    def run(self):
+        timeout = None
+        while self.running:
+            self._wake.wait(timeout)
+            self._wake.clear()
+            if not self.running:
+                break
+
+            try:
+                timeout = self.process()
+            except Exception:
+                self.logger.exception('Uploader for {} failed'.format(self.publisher.name))
+                timeout = self.retry_base
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run,
+                                        name='Uploader-' + self.publisher.name)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self.running = False
+        self._wake.set()
+
+        if self._thread is not None:
+            self._thread.join()
+
+        # Keep whatever was still queued
+        if not self.realtime:
+            while self._queue:
+                self.spool.append(self._queue.popleft())
+
+        self.publisher.close()
+
+class FanOut(object):
+    def __init__(self, uploaders):
+        self.uploaders = list(uploaders)
+
+    def submit(self, observation):
+        for uploader in self.uploaders:
+            uploader.submit(observation)
+
+    def wake(self):
+        for uploader in self.uploaders:
+            uploader.wake()
+
+    def start(self):
+        for uploader in self.uploaders:
+            uploader.start()
+
+    def stop(self):
+        # Let every worker finish at once, rather than one after another
+        for uploader in self.uploaders:
+            uploader.running = False
+            uploader.wake()
+
+        for uploader in self.uploaders:
+            uploader.stop()
@@ -18,33 +18,49 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-import urllib
-import urllib.request
-import urllib.parse
-
-import pint # Unit conversion library
-
+import http.client
 import logging
 
-class WUAuthError(Exception):
+from weatherstation import units
+from weatherstation.publish import Publisher, PublishError, PublishRejected
+from weatherstation.transport import HTTPTransport
+
+# The station ID or password was refused
+class WUAuthError(PublishRejected):
     pass
 
-class WUParameterError(Exception):
+# An upload parameter was refused
+class WUParameterError(PublishRejected):
     pass
 
-class WURequestFailedError(Exception):
+# Anything else, e.g. an outage or proxy error page, is worth retrying
+class WURequestFailedError(PublishError):
     pass
 
-class PWS(object):
+class PWS(Publisher):
+    name = 'wunderground'
+
     url = 'https://weatherstation.wunderground.com/weatherstation/updateweatherstation.php'
     rapidfire_url = 'https://rtupdate.wunderground.com/weatherstation/updateweatherstation.php'
 
-    def __init__(self, id, password, rapidfire=False):
+    def __init__(self, id, password, rapidfire=False, rapidfire_interval=2.5,
+                 timeout=10, transport=None):
+        # Arguments:
+        # rapidfire: upload to the realtime endpoint, every rapidfire_interval
+        # seconds, instead of the regular one
+        # timeout: seconds to wait on the server before giving up
+        # transport: HTTPTransport to share, default is one of our own
         self._id = id
         self._password = password
 
-        # Create the unit registry for conversions
-        self.ureg = pint.UnitRegistry()
+        self.rapidfire = rapidfire
+        self.rapidfire_interval = rapidfire_interval
+
+        # Realtime data is only worth sending while it is current
+        self.realtime = rapidfire
+
+        # Uploads reuse one keep-alive connection
+        self.transport = transport if transport is not None else HTTPTransport(timeout)
 
         self.logger = logging.getLogger('.' + self.__class__.__name__)
         self.logger.setLevel(logging.DEBUG)
@@ -56,39 +72,84 @@ class PWS(object):
         self._uv = None
 
     def _request(self, url, parameters):
-        params = urllib.parse.urlencode(parameters)
-        response = urllib.request.urlopen('?'.join([url, params]))
+        status, body = self.transport.get(url, parameters)
+
+        parsed_response = body.decode('UTF-8', 'replace').strip()
 
-        parsed_response = response.read().decode('UTF-8').strip()
+        if not 200 <= status < 300:
+            raise WURequestFailedError('HTTP {}: {}'.format(status, parsed_response[:200]))
 
         if parsed_response == 'success':
             return
 
-        raise WURequestFailedError(parsed_response)
+        # e.g. INVALIDPASSWORDID|Password or key and/or id are incorrect
+        if parsed_response.startswith('INVALIDPASSWORDID'):
+            raise WUAuthError(parsed_response)
+
+        # e.g. INVALID dateutc
+        if parsed_response.startswith('INVALID'):
+            raise WUParameterError(parsed_response)
+
+        raise WURequestFailedError(parsed_response[:200])
 
     def upload_outdoor(self, dt=None):
         # Upload weather conditions
         #
         # Arguments:
         # dt: UTC datetime of data capture, default is now 
+        self._upload_outdoor(dt, self.tempf, self.humidity_pct, self.barom_inHg, self.uv)
+
+    def upload_observation(self, observation):
+        # Upload an Observation, with the time it was captured
+        self._upload_outdoor(observation.dateutc,
+                             units.DEGC_TO_DEGF(observation.tempc),
+                             observation.humidity_pct,
+                             units.KPA_TO_INHG(observation.barom_kPa),
+                             observation.uv)
+
+    def publish(self, observations):
+        # One request per observation, so a failure says how many went
+        # through before it
+        for i, observation in enumerate(observations):
+            try:
+                self.upload_observation(observation)
+            except (PublishError, PublishRejected) as e:
+                e.delivered = i
+                raise
+            except (OSError, http.client.HTTPException) as e:
+                raise PublishError(str(e) or type(e).__name__, delivered=i) from e
+
+    def close(self):
+        self.transport.close()
+
+    def _upload_outdoor(self, dt, tempf, humidity_pct, barom_inHg, uv):
         params = {
             'action': 'updateraw',
             'ID': self._id,
             'PASSWORD': self._password,
             'dateutc': dt if dt is not None else 'now',
-            'tempf': self.tempf,
-            'humidity': self.humidity_pct,
-            'baromin': self.barom_inHg,
-            'UV': self.uv
+            'tempf': tempf,
+            'humidity': humidity_pct,
+            'baromin': barom_inHg,
+            'UV': uv
         }
 
-        self.logger.info(
+        url = self.url
+        log = self.logger.info
+        if self.rapidfire:
+            url = self.rapidfire_url
+            params['realtime'] = 1
+            params['rtfreq'] = self.rapidfire_interval
+            # Every few seconds is too often for the info log
+            log = self.logger.debug
+
+        log(
                 'Uploading outdoor snapshot: {:.2f} F, {:.2f}% humidity, {:.2f} in Hg, {} UV index'.format(
-                self.tempf, self.humidity_pct, self.barom_inHg, self.uv
+                tempf, humidity_pct, barom_inHg, uv
             )
         )
 
-        self._request(self.url, params)
+        self._request(url, params)
 
     def upload_indoor(self, dt=None):
         # Upload indoor conditions
@@ -111,12 +172,17 @@ class PWS(object):
 
         self._request(self.url, params)
 
+    @property
+    def ureg(self):
+        # Shared pint registry, for callers that need arbitrary conversions
+        return units.get_registry()
+
     # Internally, we store atmospheric conditions in metric, then convert if
     # the user requests them in imperial.
 
     @property
     def tempc(self):
-        if not self._tempc:
+        if self._tempc is None:
             return None
 
         return self._tempc
@@ -127,22 +193,18 @@ class PWS(object):
 
     @property
     def tempf(self):
-        if not self._tempc:
+        if self._tempc is None:
             return None
 
-        Q_ = self.ureg.Quantity
-        quantity, unit = Q_(self._tempc, self.ureg.degC).to('degF').to_tuple()
-        return quantity
+        return units.DEGC_TO_DEGF(self._tempc)
 
     @tempf.setter
     def tempf(self, value):
-        Q_ = self.ureg.Quantity
-        quantity, unit = Q_(value, self.ureg.degF).to('degC').to_tuple()
-        self._tempc = quantity
+        self._tempc = units.DEGF_TO_DEGC(value)
 
     @property
     def barom_kPa(self):
-        if not self._kPa:
+        if self._kPa is None:
             return None
 
         return self._kPa
@@ -153,19 +215,29 @@ class PWS(object):
 
     @property
     def barom_inHg(self):
-        if not self._kPa:
+        if self._kPa is None:
             return None
 
-        quantity, unit = (self._kPa * self.ureg.kPa).to(self.ureg.inHg).to_tuple()
-        return quantity
+        return units.KPA_TO_INHG(self._kPa)
 
     @barom_inHg.setter
     def barom_inHg(self, value):
-        self._kPa = (value * self.ureg.inHg).to(self.ureg.kPa)
+        self._kPa = units.INHG_TO_KPA(value)
+
+    @property
+    def barom_hPa(self):
+        if self._kPa is None:
+            return None
+
+        return units.KPA_TO_HPA(self._kPa)
+
+    @barom_hPa.setter
+    def barom_hPa(self, value):
+        self._kPa = units.HPA_TO_KPA(value)
 
     @property
     def humidity_pct(self):
-        if not self._humd_pct:
+        if self._humd_pct is None:
             return None
 
         return self._humd_pct
@@ -176,7 +248,7 @@ class PWS(object):
 
     @property
     def uv(self):
-        if not self._uv:
+        if self._uv is None:
             return None
 
         return self._uv
@@ -1,8 +1,67 @@
-from flask import Flask
+import datetime
+import ipaddress
+import time
+
+from flask import Flask, Response, g, jsonify, request
+
+from weatherstation import api, metrics, startup
 
 app = Flask(__name__)
 
-env_data = {}
+REQUEST_SECONDS = metrics.histogram('http_request_seconds',
+                                    'Time to handle a web request, by endpoint', ['endpoint'])
+RESPONSES = metrics.counter('http_responses', 'Web responses, by endpoint and status',
+                            ['endpoint', 'status'])
+
+# Who may use /debug/tracer: nobody, clients on the loopback interface,
+# or any client
+TRACER_CONTROL = ('off', 'loopback', 'any')
+
+# Set by init()
+daemon = None
+cache = None
+_tracer_control = 'loopback'
+
+def init(pws_daemon, tracer_control='loopback'):
+    global daemon, cache, _tracer_control
+    if tracer_control not in TRACER_CONTROL:
+        raise ValueError('Unexpected tracer control {}, use one of {}'.format(
+            tracer_control, TRACER_CONTROL))
+
+    daemon = pws_daemon
+    cache = api.ResponseCache(pws_daemon)
+    _tracer_control = tracer_control
+
+@app.before_request
+def start_timer():
+    g.started = time.perf_counter()
+
+@app.after_request
+def mark_first_request(response):
+    startup.mark('first_request')
+    return response
+
+@app.after_request
+def record_request(response):
+    # Streamed responses are timed until their first byte
+    endpoint = request.endpoint or 'unmatched'
+    REQUEST_SECONDS.labels(endpoint).observe(time.perf_counter() - g.started)
+    RESPONSES.labels(endpoint, str(response.status_code)).inc()
+    return response
+
+def cached_response(key, build, mimetype):
+    # Serves build()'s content from the cache, answering 304 if the client's
+    # copy is still current
+    cached = cache.get(key, build)
+
+    response = Response(cached.body, mimetype=mimetype)
+    response.set_etag(cached.etag)
+    if cached.last_modified is not None:
+        response.last_modified = datetime.datetime.fromtimestamp(
+            int(cached.last_modified), datetime.timezone.utc)
+    response.headers['Cache-Control'] = 'no-cache'
+
+    return response.make_conditional(request)
 
 @app.route('/')
 def display_conditions():
@@ -12,10 +71,78 @@ def display_conditions():
             \tPressure: {press}\tUV Index: {uv}
         </pre>
     '''
-    
-    return formatter.format(
-        temp=env_data.get('temp', 'not available'),
-        humd=env_data.get('humd', 'not available'),
-        press=env_data.get('press', 'not available'),
-        uv=env_data.get('uv', 'not available')
-    )
+
+    def build():
+        return formatter.format(**daemon.conditions()).encode('UTF-8')
+
+    return cached_response('/', build, 'text/html')
+
+@app.route('/api/current')
+def api_current():
+    return cached_response('/api/current', lambda: api.current(daemon), 'application/json')
+
+@app.route('/api/stream')
+def api_stream():
+    return Response(daemon.broadcaster.events(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache'})
+
+async def api_stream_async(environ):
+    return ('200 OK',
+            [('Content-Type', 'text/event-stream'), ('Cache-Control', 'no-cache')],
+            daemon.broadcaster.events_async())
+
+# Served on the event loop by the asyncio runtime, in place of the matching
+# Flask routes, so each client costs a coroutine rather than a thread
+streams = {'/api/stream': api_stream_async}
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+def _is_loopback(address):
+    try:
+        address = ipaddress.ip_address(address or '')
+    except ValueError:
+        return False
+
+    mapped = getattr(address, 'ipv4_mapped', None)
+    return (mapped or address).is_loopback
+
+@app.route('/debug/tracer', methods=['GET', 'POST'])
+def debug_tracer():
+    # POST enabled=true or false switches slow cycle tracing. Tracing
+    # writes to disk, so by default only local clients may switch it.
+    tracer = daemon.tracer
+    if tracer is None or _tracer_control == 'off':
+        response = jsonify(error='Tracing is not available')
+        response.status_code = 404
+        return response
+
+    if _tracer_control == 'loopback' and not _is_loopback(request.remote_addr):
+        response = jsonify(error='Tracing can only be controlled from this host')
+        response.status_code = 403
+        return response
+
+    if request.method == 'POST':
+        enabled = request.values.get('enabled', '').lower()
+        if enabled not in ('true', 'false', '1', '0', 'on', 'off'):
+            response = jsonify(error='enabled must be true or false')
+            response.status_code = 400
+            return response
+
+        tracer.set_enabled(enabled in ('true', '1', 'on'))
+
+    return jsonify(tracer.status())
+
+@app.route('/api/history')
+def api_history():
+    args = request.args
+    params = (args.get('field'), args.get('from'), args.get('to'), args.get('step'))
+
+    try:
+        return cached_response(('/api/history',) + params,
+                               lambda: api.history(daemon, *params), 'application/json')
+    except api.APIError as e:
+        response = jsonify(error=str(e))
+        response.status_code = 400
+        return response